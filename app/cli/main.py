@@ -1,10 +1,11 @@
+import os
 import typer
-from datetime import datetime
+from datetime import datetime, timezone
 from app.db.indexes import ensure_indexes
 from app.domain.dispatcher import run_once as dispatcher_run_once
 from app.domain.worker import run_once as worker_run_once
-from app.db.dao_leads import backfill_lead_progress
-from app.db.dao_runtime import recount_account_runtime_state
+from app.db.dao_leads import backfill_lead_progress, backfill_lead_due_fields, due_fields
+from app.db.dao_runtime import recount_account_runtime_state, recount_campaign_runtime_state
 from app.db.dao_accounts import get_all_email_accounts
 from app.config.settings import settings
 
@@ -20,7 +21,9 @@ def init_indexes():
 def run_continuous(
     tick_seconds: int = typer.Option(settings.DISPATCHER_TICK_SECONDS, help="Seconds between dispatcher runs"),
     batch_size: int = typer.Option(settings.DEFAULT_WORKER_BATCH_SIZE, help="Batch size for each worker"),
-    verbose: bool = typer.Option(False, help="Enable verbose logging")
+    verbose: bool = typer.Option(False, help="Enable verbose logging"),
+    concurrency: int = typer.Option(settings.DISPATCHER_CONCURRENCY, help="Campaigns dispatched in parallel (1 = sequential)"),
+    event_driven: bool = typer.Option(settings.DISPATCHER_EVENT_DRIVEN, help="Sleep until the next lead, account or window is due instead of ticking")
 ):
     """Run the dispatcher continuously."""
     import time
@@ -41,6 +44,16 @@ def run_continuous(
             cache_logger_on_first_use=True,
         )
     
+    from app.db.client import db
+    from app.db.cache import CacheInvalidator
+    from app.domain import metrics
+    CacheInvalidator(db).start()
+    metrics.start_http_server()
+    
+    if event_driven:
+        _run_event_driven(db, batch_size, verbose, concurrency)
+        return
+    
     typer.echo(f"Starting continuous dispatcher with {tick_seconds}s intervals...")
     typer.echo("Press Ctrl+C to stop")
     
@@ -48,7 +61,7 @@ def run_continuous(
         while True:
             try:
                 typer.echo(f"\n--- Running dispatcher at {datetime.now()} ---")
-                dispatcher_run_once(batch_size=batch_size, verbose=verbose)
+                dispatcher_run_once(batch_size=batch_size, verbose=verbose, concurrency=concurrency)
                 typer.echo("Dispatcher run completed.")
                 
                 typer.echo(f"Sleeping for {tick_seconds} seconds...")
@@ -65,18 +78,84 @@ def run_continuous(
     except KeyboardInterrupt:
         typer.echo("\nDispatcher stopped.")
 
+def _run_event_driven(db, batch_size: int, verbose: bool, concurrency: int):
+    from app.domain.event_dispatcher import EventDrivenDispatcher
+    typer.echo(f"Starting event-driven dispatcher (re-checks at least every {settings.DISPATCHER_MAX_SLEEP_SECONDS}s)...")
+    typer.echo("Press Ctrl+C to stop")
+    try:
+        EventDrivenDispatcher(db, batch_size=batch_size, verbose=verbose, concurrency=concurrency).run_forever()
+    except KeyboardInterrupt:
+        typer.echo("\nDispatcher stopped.")
 
 @app.command()
-def run_dispatcher(tick_seconds: int = 15, batch_size: int = 20, verbose: bool = False):
+def run_pool(
+    processes: int = typer.Option(os.cpu_count() or 1, help="Dispatcher processes; campaigns are sharded between them"),
+    tick_seconds: int = typer.Option(settings.DISPATCHER_TICK_SECONDS, help="Seconds between dispatcher runs in each process"),
+    batch_size: int = typer.Option(settings.DEFAULT_WORKER_BATCH_SIZE, help="Batch size for each worker"),
+    verbose: bool = typer.Option(False, help="Enable verbose logging"),
+    concurrency: int = typer.Option(settings.DISPATCHER_CONCURRENCY, help="Campaigns dispatched in parallel per process"),
+    event_driven: bool = typer.Option(settings.DISPATCHER_EVENT_DRIVEN, help="Sleep until the next lead, account or window is due instead of ticking")
+):
+    """Run a supervised pool of dispatcher processes, sharding campaigns by consistent hashing."""
+    from app.domain.pool import WorkerPool
+    pool = WorkerPool(processes, {"batch_size": batch_size, "verbose": verbose, "concurrency": concurrency,
+                                  "tick_seconds": tick_seconds, "event_driven": event_driven})
+    typer.echo(f"Starting pool of {processes} dispatcher processes...")
+    typer.echo("Press Ctrl+C to stop")
+    try:
+        pool.run_forever()
+    except KeyboardInterrupt:
+        typer.echo("\nPool stopped.")
+
+@app.command()
+def pool_status():
+    """Show the health reported by run-pool processes."""
+    from app.db.dao_runtime import get_worker_health
+    now = datetime.now(timezone.utc)
+    docs = get_worker_health()
+    if not docs:
+        typer.echo("No pool processes have reported.")
+        return
+    for doc in docs:
+        heartbeat = doc.get("last_heartbeat_at")
+        if heartbeat is not None and heartbeat.tzinfo is None:
+            heartbeat = heartbeat.replace(tzinfo=timezone.utc)
+        age = f"{(now - heartbeat).total_seconds():.0f}s ago" if heartbeat else "never"
+        typer.echo(f"{doc['_id']}: pid={doc.get('pid')} status={doc.get('status')} heartbeat={age} "
+                   f"passes={doc.get('passes')} errors={doc.get('errors')} members={doc.get('members')}")
+        if doc.get("last_error"):
+            typer.echo(f"  last error: {doc['last_error']}")
+
+@app.command()
+def metrics_dump(
+    url: str = typer.Option(None, help="Fetch from a running process's /metrics endpoint instead of this process")
+):
+    """Print metrics in Prometheus text format (due backlog and component stats when run locally)."""
+    if url:
+        from urllib.request import urlopen
+        with urlopen(url, timeout=10) as response:
+            typer.echo(response.read().decode(), nl=False)
+        return
+    from app.domain.metrics import registry
+    typer.echo(registry.render(), nl=False)
+
+@app.command()
+def run_dispatcher(tick_seconds: int = 15, batch_size: int = 20, verbose: bool = False,
+                   concurrency: int = settings.DISPATCHER_CONCURRENCY):
     """Run the global dispatcher once."""
-    dispatcher_run_once(batch_size, verbose)
+    dispatcher_run_once(batch_size, verbose, concurrency)
     typer.echo("Dispatcher run completed.")
 
 @app.command()
-def run_worker(campaign: str, batch_size: int = 20, dry_run: bool = False, since: str = None):
-    """Run worker for a specific campaign."""
+def run_worker(campaign: str, batch_size: int = 20, dry_run: bool = False, since: str = None,
+               engine: str = settings.WORKER_ENGINE):
+    """Run worker for a specific campaign (engine: sync or async)."""
     since_dt = datetime.fromisoformat(since) if since else None
-    worker_run_once(campaign, batch_size, dry_run, since_dt)
+    if engine == "async":
+        from app.domain.async_worker import run_once as async_run_once
+        async_run_once(campaign, batch_size, dry_run, since_dt)
+    else:
+        worker_run_once(campaign, batch_size, dry_run, since_dt)
     typer.echo(f"Worker run completed for campaign {campaign}.")
 
 @app.command()
@@ -85,67 +164,99 @@ def backfill_progress(campaign: str):
     backfill_lead_progress(campaign)
     typer.echo(f"Progress backfilled for campaign {campaign}.")
 
+@app.command()
+def migrate_lead_due_fields(
+    campaign: str = typer.Option(None, help="Only migrate leads of this campaign"),
+    force: bool = typer.Option(False, help="Recompute state/due_at even for leads that already have them"),
+    chunk_size: int = typer.Option(1000, help="Leads per bulk write")
+):
+    """Backfill the indexed state/due_at fields from lead progress."""
+    updated = backfill_lead_due_fields(campaign, force, chunk_size,
+                                       on_progress=lambda n: typer.echo(f"  {n} leads migrated..."))
+    typer.echo(f"Migrated {updated} leads. Run init-indexes if the (campaign_id, state, due_at) index is missing.")
+
 @app.command()
 def recount_runtime(email_id: str, date: str):
     """Rebuild runtime state from activities for an account on a specific date."""
     recount_account_runtime_state(email_id, date)
     typer.echo(f"Runtime state recounted for {email_id} on {date}.")
 
-@app.command() 
-def check_runtime_states():
-    """Check current account runtime states."""
-    from app.db.client import db
-    from datetime import datetime, timezone
-    
-    now_utc = datetime.now(timezone.utc)
-    
-    # Get all runtime states
-    states = list(db.account_runtime_state.find({}))
-    
-    if not states:
-        typer.echo("No runtime states found.")
-        return
-        
-    typer.echo(f"Found {len(states)} runtime state records:")
-    
-    for state in states:
-        email_id = state["email_id"]
-        next_available = state["next_available_at"]
-        sent_count = state.get("sent_count", 0)
-        locked_until = state.get("locked_until")
-        
-        # Ensure datetimes are timezone-aware for comparison
-        if next_available and next_available.tzinfo is None:
-            next_available = next_available.replace(tzinfo=timezone.utc)
-        if locked_until and locked_until.tzinfo is None:
-            locked_until = locked_until.replace(tzinfo=timezone.utc)
-        
-        # Get account info
-        from bson import ObjectId
-        try:
-            if isinstance(email_id, str):
-                account = db.email_accounts.find_one({"_id": ObjectId(email_id)})
-            else:
-                account = db.email_accounts.find_one({"_id": email_id})
-        except:
-            account = None
-            
-        email = account["email"] if account else "unknown"
-        
-        # Get daily_limit from campaign settings (this is what the worker uses)
-        campaign_settings = db.email_campaign_settings.find_one({"email_id": email_id})
-        daily_limit = int(campaign_settings.get("daily_limit", 0)) if campaign_settings else 0
-        
-        status = "AVAILABLE" if next_available <= now_utc else "WAITING"
-        if locked_until and locked_until > now_utc:
-            status = "LOCKED"
-            
-        typer.echo(f"  {email} ({email_id}): {status}")
-        typer.echo(f"    Daily limit: {daily_limit}, Sent today: {sent_count}")
-        typer.echo(f"    Next available: {next_available}")
-        if locked_until:
-            typer.echo(f"    Locked until: {locked_until}")
-        typer.echo()
+@app.command()
+def recount_campaign(campaign: str, date: str):
+    """Rebuild a campaign's daily sent counter from activities for a specific date."""
+    sent_count = recount_campaign_runtime_state(campaign, date)
+    typer.echo(f"Campaign {campaign} sent {sent_count} emails on {date}; counter updated.")
+
+@app.command()
+def check_runtime_states(
+    date: str = typer.Option(None, help="Day to show (YYYY-MM-DD, UTC); defaults to today"),
+    page: int = typer.Option(1, min=1, help="Page to show, in email_id order"),
+    page_size: int = typer.Option(50, min=1, help="Accounts per page"),
+    as_json: bool = typer.Option(False, "--json", help="Print the page as JSON"),
+    watch: float = typer.Option(0, help="Refresh every N seconds until interrupted (0 = print once)")
+):
+    """Check account runtime states for one day."""
+    import json
+    import time
+    from app.db.dao_runtime import get_account_runtime_state_page, summarize_account_runtime_states
+
+    date_key = date or datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    skip = (page - 1) * page_size
+    # email_id -> (email, daily_limit); refreshes skip the $lookups while the page's accounts are known
+    accounts = {}
+
+    def as_utc(value):
+        if value is not None and value.tzinfo is None:
+            return value.replace(tzinfo=timezone.utc)
+        return value
+
+    def load_page():
+        rows = get_account_runtime_state_page(date_key, skip, page_size, join=False) if accounts else None
+        if rows is None or any(row["email_id"] not in accounts for row in rows):
+            rows = get_account_runtime_state_page(date_key, skip, page_size)
+            for row in rows:
+                accounts[row["email_id"]] = (row.get("email") or "unknown", int(row.get("daily_limit") or 0))
+        return rows
+
+    while True:
+        now_utc = datetime.now(timezone.utc)
+        summary = summarize_account_runtime_states(date_key, now_utc)
+        total = sum(summary.values())
+        states = []
+        for row in load_page():
+            email, daily_limit = accounts[row["email_id"]]
+            next_available = as_utc(row.get("next_available_at"))
+            locked_until = as_utc(row.get("locked_until"))
+            status = "AVAILABLE" if next_available is None or next_available <= now_utc else "WAITING"
+            if locked_until and locked_until > now_utc:
+                status = "LOCKED"
+            states.append({"email_id": str(row["email_id"]), "email": email, "status": status,
+                           "daily_limit": daily_limit, "sent_count": row.get("sent_count", 0),
+                           "next_available_at": next_available, "locked_until": locked_until})
+
+        if watch:
+            typer.clear()
+        if as_json:
+            typer.echo(json.dumps({"date_key": date_key, "checked_at": now_utc, "total": total, "summary": summary,
+                                   "page": page, "page_size": page_size, "states": states},
+                                  default=lambda value: value.isoformat()))
+        elif not total:
+            typer.echo(f"No runtime states found for {date_key}.")
+        else:
+            pages = (total + page_size - 1) // page_size
+            typer.echo(f"{total} runtime state records for {date_key} (page {page}/{pages}): "
+                       + ", ".join(f"{count} {status.lower()}" for status, count in summary.items()))
+            for state in states:
+                typer.echo(f"  {state['email']} ({state['email_id']}): {state['status']}")
+                typer.echo(f"    Daily limit: {state['daily_limit']}, Sent today: {state['sent_count']}")
+                typer.echo(f"    Next available: {state['next_available_at']}")
+                if state["locked_until"]:
+                    typer.echo(f"    Locked until: {state['locked_until']}")
+                typer.echo()
+
+        if not watch:
+            return
+        time.sleep(watch)
 
 
 @app.command() 
@@ -272,13 +383,23 @@ def debug_template(campaign: str, lead_id: str = None):
         typer.echo(f"Template render error: {e}")
 
 @app.command()
-def continuous_dispatcher(tick_seconds: int = 15, batch_size: int = 20, verbose: bool = False):
+def continuous_dispatcher(tick_seconds: int = 15, batch_size: int = 20, verbose: bool = False,
+                          concurrency: int = settings.DISPATCHER_CONCURRENCY,
+                          event_driven: bool = settings.DISPATCHER_EVENT_DRIVEN):
     """Run dispatcher continuously with specified tick interval."""
     import time
+    from app.db.client import db
+    from app.db.cache import CacheInvalidator
+    from app.domain import metrics
+    CacheInvalidator(db).start()
+    metrics.start_http_server()
+    if event_driven:
+        _run_event_driven(db, batch_size, verbose, concurrency)
+        return
     typer.echo(f"Starting continuous dispatcher with {tick_seconds}s intervals...")
     try:
         while True:
-            dispatcher_run_once(batch_size, verbose)
+            dispatcher_run_once(batch_size, verbose, concurrency)
             time.sleep(tick_seconds)
     except KeyboardInterrupt:
         typer.echo("Dispatcher stopped.")
@@ -330,7 +451,7 @@ def make_lead_due_now(
         now_utc = datetime.now(timezone.utc)
         result = db.campaign_leads.update_one(
             {"_id": ObjectId(lead_id)},
-            {"$set": {"progress.next_due_at": now_utc.replace(tzinfo=None)}}
+            {"$set": {"progress.next_due_at": now_utc.replace(tzinfo=None), "due_at": now_utc.replace(tzinfo=None)}}
         )
         
         if result.modified_count > 0:
@@ -350,67 +471,151 @@ def make_lead_due_now(
 
 
 @app.command()
-def update_lead_statuses():
+def update_lead_statuses(
+    campaign: str = typer.Option(None, help="Only update leads of this campaign"),
+    chunk_size: int = typer.Option(1000, help="Leads per cursor batch and bulk write"),
+    restart: bool = typer.Option(False, help="Ignore the checkpoint left by an interrupted run"),
+    server_side: bool = typer.Option(False, help="Let MongoDB compute the update in one pipeline update_many (4.2+)")
+):
     """Update lead statuses based on processed recipients."""
-    from app.db.client import db
-    from datetime import datetime, timezone
+    import time
+    from app.db.dao_leads import (update_recipient_statuses, update_recipient_statuses_server_side,
+                                  get_checkpoint, save_checkpoint, clear_checkpoint)
     
-    # Find all leads with processed recipients but not_contacted status
-    leads = list(db.campaign_leads.find({
-        "progress.processed_recipients": {"$exists": True, "$ne": {}}
-    }))
+    if server_side:
+        updated = update_recipient_statuses_server_side(campaign)
+        typer.echo(f"Updated {updated} leads with correct recipient statuses.")
+        return
     
-    updated_count = 0
+    checkpoint_name = f"update_lead_statuses:{campaign or 'all'}"
+    checkpoint = None if restart else get_checkpoint(checkpoint_name)
+    resume_after = checkpoint["last_id"] if checkpoint else None
+    if resume_after is not None:
+        typer.echo(f"Resuming after lead {resume_after} (use --restart to start over)")
     
-    for lead in leads:
-        lead_id = lead["_id"]
-        lead_data = lead.get("lead_data", [])
-        progress = lead.get("progress", {})
-        processed_recipients = progress.get("processed_recipients", {})
-        
-        if not isinstance(lead_data, list):
-            continue
-            
-        updated_lead_data = lead_data.copy()
-        lead_updated = False
-        
-        # Check each recipient
-        for i, recipient in enumerate(lead_data):
-            current_status = recipient.get("status", "not_contacted")
-            
-            # Check if this recipient has been processed in any step
-            recipient_processed = False
-            last_step = None
-            last_contacted = None
-            
-            for key, info in processed_recipients.items():
-                if key.endswith(f"_recipient_{i}"):
-                    recipient_processed = True
-                    # Extract step number from key like "step_1_recipient_0"
-                    step_num = int(key.split("_")[1])
-                    if last_step is None or step_num > last_step:
-                        last_step = step_num
-                        last_contacted = info.get("processed_at")
-            
-            if recipient_processed and current_status == "not_contacted":
-                updated_lead_data[i] = {
-                    **recipient,
-                    "status": "contacted",
-                    "last_contacted_at": last_contacted,
-                    "last_step": last_step
-                }
-                lead_updated = True
-                typer.echo(f"  Updated {recipient.get('email', 'unknown')} status to contacted")
-        
-        if lead_updated:
-            db.campaign_leads.update_one(
-                {"_id": lead_id},
-                {"$set": {"lead_data": updated_lead_data}}
-            )
-            updated_count += 1
-            typer.echo(f"Lead {lead_id} updated")
+    started = time.monotonic()
     
-    typer.echo(f"Updated {updated_count} leads with correct recipient statuses.")
+    def progress(scanned: int, updated: int, last_id):
+        save_checkpoint(checkpoint_name, last_id)
+        rate = scanned / max(time.monotonic() - started, 1e-6)
+        typer.echo(f"  {scanned} leads scanned, {updated} updated ({rate:.0f} leads/s)")
+    
+    scanned, updated = update_recipient_statuses(campaign, chunk_size, resume_after, on_progress=progress)
+    clear_checkpoint(checkpoint_name)
+    typer.echo(f"Updated {updated} leads with correct recipient statuses ({scanned} scanned).")
+
+
+@app.command()
+def import_leads(
+    path: str = typer.Argument(..., help="CSV or JSONL file (.gz is read compressed)"),
+    campaign: str = typer.Option(..., help="Campaign to add the leads to"),
+    file_format: str = typer.Option(None, "--format", help="csv | jsonl (default: from the file extension)"),
+    chunk_size: int = typer.Option(1000, min=1, help="Leads per duplicate check and insert_many")
+):
+    """Stream leads from a CSV/JSONL file into a campaign, skipping addresses it already has."""
+    import time
+    from bson import ObjectId
+    from app.domain.lead_import import FORMATS, import_leads as run_import, read_rows
+    if file_format and file_format not in FORMATS:
+        raise typer.BadParameter(f"expected one of {', '.join(FORMATS)}", param_hint="--format")
+    if not ObjectId.is_valid(campaign):
+        raise typer.BadParameter("not a campaign id", param_hint="--campaign")
+    
+    started = time.monotonic()
+    
+    def progress(stats: dict):
+        rate = stats["rows"] / max(time.monotonic() - started, 1e-6)
+        typer.echo(f"  {stats['rows']} rows read, {stats['inserted']} leads inserted ({rate:.0f} rows/s)")
+    
+    stats = run_import(campaign, read_rows(path, file_format), chunk_size, on_progress=progress)
+    elapsed = time.monotonic() - started
+    typer.echo(f"Imported {stats['inserted']} leads from {stats['rows']} rows in {elapsed:.1f}s "
+               f"({stats['rows'] / max(elapsed, 1e-6):.0f} rows/s); "
+               f"{stats['duplicates']} duplicate addresses and {stats['invalid']} rows without an address skipped.")
+
+
+@app.command()
+def import_suppressions(
+    path: str = typer.Argument(..., help="CSV (with an email column) or JSONL file; .gz is read compressed"),
+    reason: str = typer.Option("blocked", help="Reason for rows without their own reason column (unsubscribed, bounced, ...)"),
+    source: str = typer.Option(None, help="Where the list came from, stored with each suppression"),
+    lift: bool = typer.Option(False, help="Remove these addresses from the suppression list instead"),
+    file_format: str = typer.Option(None, "--format", help="csv | jsonl (default: from the file extension)"),
+    chunk_size: int = typer.Option(1000, min=1, help="Addresses per bulk write")
+):
+    """Add (or with --lift, remove) addresses on the suppression list from a file."""
+    import time
+    from app.domain.lead_import import FORMATS, read_rows
+    from app.domain.suppression import import_suppressions as run_import
+    if file_format and file_format not in FORMATS:
+        raise typer.BadParameter(f"expected one of {', '.join(FORMATS)}", param_hint="--format")
+    
+    started = time.monotonic()
+    stats = run_import(read_rows(path, file_format), reason, source or os.path.basename(path), lift, chunk_size,
+                       on_progress=lambda stats: typer.echo(f"  {stats['rows']} rows read"))
+    elapsed = time.monotonic() - started
+    changed = f"{stats['lifted']} lifted" if lift else f"{stats['added']} added, {stats['updated']} updated"
+    typer.echo(f"Suppressions: {changed} from {stats['rows']} rows in {elapsed:.1f}s; "
+               f"{stats['invalid']} rows without an address skipped.")
+
+@app.command()
+def export_suppressions(
+    output: str = typer.Option(None, help="Write to this file (.csv, otherwise JSONL) instead of stdout"),
+    include_lifted: bool = typer.Option(False, help="Also export suppressions that have been lifted")
+):
+    """Export the suppression list."""
+    import csv
+    import json
+    import sys
+    from app.db.dao_suppressions import iter_suppressions
+    
+    fields = ("email", "reason", "source", "active", "created_at", "updated_at")
+    target = open(output, "w", encoding="utf-8", newline="") if output else sys.stdout
+    count = 0
+    try:
+        if output and output.lower().endswith(".csv"):
+            writer = csv.DictWriter(target, fieldnames=fields, extrasaction="ignore")
+            writer.writeheader()
+            for doc in iter_suppressions(include_lifted):
+                writer.writerow(doc)
+                count += 1
+        else:
+            for doc in iter_suppressions(include_lifted):
+                target.write(json.dumps(doc, default=lambda value: value.isoformat()) + "\n")
+                count += 1
+    finally:
+        if output:
+            target.close()
+    if output:
+        typer.echo(f"Exported {count} suppressions to {output}.")
+
+@app.command()
+def run_retention(
+    activity_days: int = typer.Option(settings.ACTIVITY_RETENTION_DAYS, min=1, help="Keep raw activities for this many days before today"),
+    action: str = typer.Option(settings.ACTIVITY_RETENTION_ACTION, help="archive | delete | keep (rollups only)"),
+    archive_dir: str = typer.Option(settings.ACTIVITY_ARCHIVE_DIR, help="Where archive writes gzip JSONL files"),
+    runtime_days: int = typer.Option(settings.RUNTIME_STATE_RETENTION_DAYS, min=1, help="Keep runtime state rows for this many days before today"),
+    max_days: int = typer.Option(None, help="Stop after this many days of activities (resume with the next run)")
+):
+    """Roll up old activities into daily summaries, archive or delete them, and drop stale runtime state."""
+    from app.domain.retention import ACTIONS, compact_runtime_states, retain_activities
+    if action not in ACTIONS:
+        raise typer.BadParameter(f"expected one of {', '.join(ACTIONS)}", param_hint="--action")
+    now_utc = datetime.now(timezone.utc)
+    
+    def report(day: dict):
+        line = f"  {day['date_key']}: {day['summaries']} summaries"
+        if day["archive_path"]:
+            line += f", {day['archived']} archived to {day['archive_path']}"
+        if action != "keep":
+            line += f", {day['deleted']} deleted"
+        typer.echo(line)
+    
+    processed = retain_activities(now_utc, activity_days, action, archive_dir, max_days, on_day=report)
+    typer.echo(f"Activities: {len(processed)} day(s) processed.")
+    deleted = compact_runtime_states(now_utc, runtime_days)
+    typer.echo(f"Runtime state: removed {deleted['account_runtime_state']} account and "
+               f"{deleted['campaign_runtime_state']} campaign rows.")
 
 
 @app.command()
@@ -510,7 +715,8 @@ def reset_lead_progress(
                     "stopped": False,
                     "processed_recipients": {}
                 },
-                "lead_data": reset_lead_data
+                "lead_data": reset_lead_data,
+                **due_fields({})
             }}
         )
         
@@ -552,28 +758,24 @@ def list_leads():
         typer.echo()
 
 @app.command()
-def show_due_leads():
+def show_due_leads(
+    campaign_id: str = typer.Option(None, help="Only this campaign (default: every campaign with leads)"),
+    limit: int = typer.Option(100, help="Maximum leads to show")
+):
     """Show all leads that are currently due for processing."""
     from app.db.client import db
+    from app.db.dao_leads import get_due_leads
     from datetime import datetime, timezone
     
     now_utc = datetime.now(timezone.utc)
     
-    # Query for leads that are due across all campaigns
-    query = {
-        "$or": [
-            {"progress": {"$exists": False}},  # No progress means never sent
-            {
-                "progress.stopped": {"$ne": True},
-                "$or": [
-                    {"progress.next_due_at": {"$lte": now_utc}},
-                    {"progress.last_sent_at": {"$exists": False}}
-                ]
-            }
-        ]
-    }
-    
-    leads = list(db.campaign_leads.find(query, {"lead_data": 1, "progress": 1, "campaign_id": 1}).limit(100))
+    # Same query the workers run (honours LEGACY_DUE_LEADS_QUERY and leads not yet migrated)
+    campaign_ids = [campaign_id] if campaign_id else [str(c) for c in db.campaign_leads.distinct("campaign_id")]
+    leads = []
+    for cid in campaign_ids:
+        if len(leads) >= limit:
+            break
+        leads.extend(dict(lead, campaign_id=cid) for lead in get_due_leads(cid, now_utc, limit - len(leads)))
     
     if not leads:
         typer.echo("No leads are currently due for processing.")
@@ -6,11 +6,52 @@ class Settings(BaseSettings):
     MONGO_URI: str = Field(...)
     DB_NAME: str = Field(...)
     SMTP_STARTTLS: bool = Field(default=True)
+    SMTP_TIMEOUT_SECONDS: int = Field(default=10)
+    SMTP_POOL_ENABLED: bool = Field(default=True)
+    SMTP_POOL_MAX_IDLE_SECONDS: int = Field(default=240)
     DEFAULT_RESERVATION_LOCK_SECONDS: int = Field(default=30)
+    ARBITER_AVAILABILITY_INDEX: bool = Field(default=True)
+    ARBITER_INDEX_RESYNC_SECONDS: int = Field(default=60)
+    RATE_LIMITS_ENABLED: bool = Field(default=True)  # per-account/per-smtp_host token buckets; no-op until limits are configured
     DEFAULT_WORKER_BATCH_SIZE: int = Field(default=20)
+    LEGACY_DUE_LEADS_QUERY: bool = Field(default=False)  # query progress.* only; leads without state are matched on progress.* either way
+    WORKER_SEND_CONCURRENCY: int = Field(default=1)  # accounts sending in parallel within one campaign
+    WORKER_ENGINE: str = Field(default="sync")  # "async" runs batches on motor + aiosmtplib
+    ASYNC_WORKER_CONCURRENCY: int = Field(default=20)  # sends in flight per batch on the async engine
+    LEAD_LEASES_ENABLED: bool = Field(default=True)  # claim due leads so several workers can share a campaign
+    LEAD_LEASE_SECONDS: int = Field(default=300)  # must outlast a worker batch; expired leases are reclaimed
     DISPATCHER_TICK_SECONDS: int = Field(default=15)
+    DISPATCHER_CONCURRENCY: int = Field(default=1)  # 1 = dispatch campaigns sequentially
+    DISPATCHER_CAMPAIGN_BUDGET_SECONDS: int = Field(default=0)  # 0 = no per-campaign time budget
+    DISPATCHER_EVENT_DRIVEN: bool = Field(default=False)  # sleep until the next wake-up instead of ticking
+    DISPATCHER_MAX_SLEEP_SECONDS: int = Field(default=300)  # event-driven mode re-checks at least this often
+    DISPATCHER_MIN_SLEEP_SECONDS: float = Field(default=1.0)  # floor between passes over the same campaign
+    DISPATCHER_WAKE_ON_CHANGES: bool = Field(default=True)  # wake early on lead/campaign changes (needs a replica set)
+    DISPATCHER_SCHEDULE_RECHECK_SECONDS: int = Field(default=300)  # longest a closed window is trusted before re-reading the schedule
+    POOL_HEARTBEAT_SECONDS: float = Field(default=5.0)  # run-pool processes re-check membership and report health this often
+    POOL_HEARTBEAT_TIMEOUT_SECONDS: int = Field(default=600)  # a silent process is restarted after this; must outlast a dispatcher pass
+    POOL_RESTART_BACKOFF_SECONDS: float = Field(default=2.0)  # doubles per consecutive crash, capped at 60s
+    SUPPRESSION_ENABLED: bool = Field(default=True)  # skip suppressed recipients before reserving an account
+    SUPPRESSION_SYNC_SECONDS: int = Field(default=30)  # how often workers pick up suppressions added or lifted elsewhere
     DAY_BOUNDARY_TZ: str = Field(default="UTC")
     LOG_LEVEL: str = Field(default="INFO")
+    METRICS_ENABLED: bool = Field(default=False)  # phase histograms and send counters; off = one flag check per call site
+    METRICS_PORT: int = Field(default=0)  # serve /metrics on this port when enabled (0 = no endpoint; run-pool adds the slot)
+    METRICS_ADDR: str = Field(default="127.0.0.1")
+    DAO_CACHE_ENABLED: bool = Field(default=True)
+    DAO_CACHE_MAX_ENTRIES: int = Field(default=10000)
+    DAO_CACHE_TTL_SECONDS: int = Field(default=120)
+    DAO_CACHE_INVALIDATION: str = Field(default="poll")  # poll | change_stream | none
+    DAO_CACHE_POLL_SECONDS: int = Field(default=30)
+    TEMPLATE_CACHE_SIZE: int = Field(default=512)
+    ACTIVITY_BUFFER_ENABLED: bool = Field(default=True)
+    ACTIVITY_BUFFER_SIZE: int = Field(default=100)
+    ACTIVITY_BUFFER_MAX_SECONDS: float = Field(default=5.0)
+    ACTIVITY_SPOOL_PATH: Optional[str] = Field(default=None)  # local JSONL spool, replayed after a crash
+    ACTIVITY_RETENTION_DAYS: int = Field(default=90)  # run-retention rolls up and prunes raw activities older than this
+    ACTIVITY_RETENTION_ACTION: str = Field(default="archive")  # archive | delete | keep (rollups only, raw events stay)
+    ACTIVITY_ARCHIVE_DIR: str = Field(default="archive")  # gzip JSONL per UTC day, under campaign_activities/
+    RUNTIME_STATE_RETENTION_DAYS: int = Field(default=7)  # account/campaign runtime state rows for older days are dropped
     
     class Config:
         env_file = ".env"
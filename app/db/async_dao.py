@@ -0,0 +1,125 @@
+from datetime import datetime
+from typing import Dict, Iterable, List
+from pymongo import ASCENDING
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from app.config.settings import settings
+from app.db.dao_leads import (LeadUpdateBatch, RELEASE_UPDATE, _due_query, _lease_update, _legacy_due_query,
+                              _release_filter, _unclaimed_clause)
+from app.db.dao_runtime import (ROLLBACK_UPDATE, _available_clause, _campaign_sends_query, _claim_filter,
+                                _commit_update, _new_runtime_state, _raise_unless_duplicates)
+
+# Async counterparts of the DAO calls made per worker batch. They take the motor
+# database explicitly and build their filters/updates with the sync DAOs' helpers,
+# so both engines issue the same conditional writes.
+
+_client = None
+
+def get_async_db():
+    """Motor database for the async engine (created on first use)"""
+    global _client
+    try:
+        from motor.motor_asyncio import AsyncIOMotorClient
+    except ImportError as e:
+        raise RuntimeError("WORKER_ENGINE=async needs the motor package: pip install motor") from e
+    if _client is None:
+        _client = AsyncIOMotorClient(settings.MONGO_URI)
+    return _client[settings.DB_NAME]
+
+async def claim_due_leads(db, campaign_id: str, now_utc: datetime, batch_size: int, claim_id: str,
+                          lease_seconds: int = None) -> List[dict]:
+    lease_seconds = lease_seconds if lease_seconds is not None else settings.LEAD_LEASE_SECONDS
+    unclaimed = _unclaimed_clause(now_utc)
+    cursor = db.campaign_leads.find({"$and": [_due_query(campaign_id, now_utc), unclaimed]}, {"_id": 1}).limit(batch_size)
+    if not settings.LEGACY_DUE_LEADS_QUERY:
+        cursor = cursor.sort("due_at", ASCENDING)
+    ids = [doc["_id"] for doc in await cursor.to_list(length=None)]
+    if not ids:
+        return []
+    await db.campaign_leads.update_many({"$and": [{"_id": {"$in": ids}}, unclaimed]},
+                                        _lease_update(claim_id, now_utc, lease_seconds))
+    claimed = await db.campaign_leads.find({"_id": {"$in": ids}, "claimed_by": claim_id},
+                                           {"lead_data": 1, "progress": 1}).to_list(length=None)
+    by_id = {doc["_id"]: doc for doc in claimed}
+    return [by_id[_id] for _id in ids if _id in by_id]
+
+async def release_lead_claims(db, lead_ids: List, claim_id: str) -> int:
+    if not lead_ids:
+        return 0
+    result = await db.campaign_leads.update_many(_release_filter(lead_ids, claim_id), RELEASE_UPDATE)
+    return result.modified_count
+
+async def write_lead_updates(db, lead_updates: LeadUpdateBatch) -> int:
+    ops = lead_updates.take_ops()
+    if ops:
+        await db.campaign_leads.bulk_write(ops, ordered=False)
+    return len(ops)
+
+async def insert_activities(db, activities: List[Dict]):
+    if not activities:
+        return
+    try:
+        await db.campaign_activities.insert_many(activities, ordered=False)
+    except BulkWriteError as e:
+        # Replayed events already written
+        _raise_unless_duplicates(e)
+
+async def increment_campaign_sent(db, campaign_id: str, date_key: str, count: int):
+    if count <= 0:
+        return
+    state_filter = {"campaign_id": campaign_id, "date_key": date_key}
+    result = await db.campaign_runtime_state.update_one(state_filter, {"$inc": {"sent_count": count}})
+    if result.matched_count:
+        return
+    # Day's first write seeds the counter, as in dao_runtime.increment_campaign_sent
+    sent_count = max(await db.campaign_activities.count_documents(_campaign_sends_query(campaign_id, date_key)), count)
+    try:
+        await db.campaign_runtime_state.insert_one({**state_filter, "sent_count": sent_count})
+    except DuplicateKeyError:
+        await db.campaign_runtime_state.update_one(state_filter, {"$inc": {"sent_count": count}})
+
+async def ensure_account_runtime_states(db, email_ids: Iterable[str], date_key: str, now_utc: datetime):
+    email_ids = list(email_ids)
+    existing = {doc["email_id"] for doc in await db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key}, {"email_id": 1}
+    ).to_list(length=None)}
+    missing = [_new_runtime_state(email_id, date_key, now_utc) for email_id in email_ids if email_id not in existing]
+    if not missing:
+        return
+    try:
+        await db.account_runtime_state.insert_many(missing, ordered=False)
+    except BulkWriteError as e:
+        _raise_unless_duplicates(e)
+
+async def find_available_accounts(db, email_ids: List[str], date_key: str, now_utc: datetime) -> List[dict]:
+    return await db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key, "$and": _available_clause(now_utc)},
+        {"email_id": 1, "sent_count": 1, "next_available_at": 1, "locked_until": 1}
+    ).to_list(length=None)
+
+async def claim_accounts(db, email_ids: List[str], date_key: str, now_utc: datetime, daily_limit: int,
+                         lock_until: datetime, claim_token: str) -> int:
+    result = await db.account_runtime_state.update_many(
+        _claim_filter(email_ids, date_key, now_utc, daily_limit),
+        {"$set": {"locked_until": lock_until, "claim_token": claim_token}}
+    )
+    return result.modified_count
+
+async def get_claimed_accounts(db, email_ids: List[str], date_key: str, claim_token: str) -> List[str]:
+    docs = await db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key, "claim_token": claim_token}, {"email_id": 1}
+    ).to_list(length=None)
+    return [doc["email_id"] for doc in docs]
+
+async def commit_account_send(db, email_id: str, date_key: str, next_available: datetime):
+    await db.account_runtime_state.update_one({"email_id": email_id, "date_key": date_key},
+                                              _commit_update(next_available))
+
+async def rollback_account_reservation(db, email_id: str, date_key: str):
+    await db.account_runtime_state.update_one({"email_id": email_id, "date_key": date_key}, ROLLBACK_UPDATE)
+
+async def get_due_leads(db, campaign_id: str, now_utc: datetime, batch_size: int) -> List[dict]:
+    if settings.LEGACY_DUE_LEADS_QUERY:
+        cursor = db.campaign_leads.find(_legacy_due_query(campaign_id, now_utc), {"lead_data": 1, "progress": 1})
+    else:
+        cursor = db.campaign_leads.find(_due_query(campaign_id, now_utc), {"lead_data": 1, "progress": 1}).sort("due_at", ASCENDING)
+    return await cursor.limit(batch_size).to_list(length=None)
@@ -0,0 +1,236 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+import structlog
+from pymongo.errors import PyMongoError
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+# Seconds a cached document stays valid, per collection
+COLLECTION_TTLS = {
+    "campaign_sequences": 300,
+    "sequence_steps": 300,
+    "templates": 300,
+    "email_accounts": 300,
+    "email_general_settings": 300,
+    "email_campaign_settings": 120,
+    "campaign_options": 60,
+    "campaign_schedule": 60,
+    "smtp_host_limits": 300,
+}
+
+# Field each DAO looks documents up by, used to map a changed document to its cache entry
+COLLECTION_KEYS = {
+    "campaign_sequences": "campaign_id",
+    "sequence_steps": "_id",
+    "templates": "_id",
+    "email_accounts": "_id",
+    "email_general_settings": "email_id",
+    "email_campaign_settings": "email_id",
+    "campaign_options": "campaign_id",
+    "campaign_schedule": "campaign_id",
+    "smtp_host_limits": "smtp_host",
+}
+
+
+class DaoCache:
+    """In-process LRU cache with per-collection TTLs for read-mostly documents"""
+
+    def __init__(self, max_entries: int = None, ttls: Dict[str, int] = None):
+        self.max_entries = max_entries or settings.DAO_CACHE_MAX_ENTRIES
+        self.ttls = ttls if ttls is not None else COLLECTION_TTLS
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[Any, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, collection: str, key: str) -> Tuple[bool, Any]:
+        now = time.monotonic()
+        with self._lock:
+            counters = self._stats.setdefault(collection, {"hits": 0, "misses": 0})
+            entry = self._entries.get((collection, key))
+            if entry is None or entry[1] <= now:
+                if entry is not None:
+                    del self._entries[(collection, key)]
+                counters["misses"] += 1
+                return False, None
+            self._entries.move_to_end((collection, key))
+            counters["hits"] += 1
+            return True, entry[0]
+
+    def set(self, collection: str, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttls.get(collection, settings.DAO_CACHE_TTL_SECONDS)
+        with self._lock:
+            self._entries[(collection, key)] = (value, expires_at)
+            self._entries.move_to_end((collection, key))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_many(self, collection: str, keys: Iterable[str],
+                 loader: Callable[[list], Dict[str, Any]]) -> Dict[str, Any]:
+        """Serve what we can from cache and load the rest with a single loader call"""
+        found, missing = {}, []
+        for key in set(keys):
+            hit, value = self.get(collection, key)
+            if hit:
+                found[key] = value
+            else:
+                missing.append(key)
+        if missing:
+            loaded = loader(missing)
+            for key, value in loaded.items():
+                self.set(collection, key, value)
+            found.update(loaded)
+        return found
+
+    def invalidate(self, collection: str, key: Optional[str] = None):
+        """Drop one entry, or every entry of a collection when key is None"""
+        with self._lock:
+            if key is not None:
+                removed = 1 if self._entries.pop((collection, key), None) is not None else 0
+            else:
+                stale = [k for k in self._entries if k[0] == collection]
+                for k in stale:
+                    del self._entries[k]
+                removed = len(stale)
+            self.invalidations += removed
+
+    def invalidate_document(self, collection: str, doc: dict):
+        key_field = COLLECTION_KEYS.get(collection, "_id")
+        if doc.get(key_field) is None:
+            self.invalidate(collection)
+        else:
+            self.invalidate(collection, str(doc[key_field]))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._stats.clear()
+            self.evictions = 0
+            self.invalidations = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits = sum(c["hits"] for c in self._stats.values())
+            misses = sum(c["misses"] for c in self._stats.values())
+            return {
+                "size": len(self._entries),
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+                "collections": {name: dict(c) for name, c in self._stats.items()},
+            }
+
+
+dao_cache = DaoCache()
+
+
+def cached(collection: str):
+    """Cache a single-document DAO lookup under (collection, str(key))"""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(key):
+            if not settings.DAO_CACHE_ENABLED:
+                return fn(key)
+            hit, value = dao_cache.get(collection, str(key))
+            if hit:
+                return value
+            value = fn(key)
+            # Don't cache misses - a document created right after would stay invisible for a full TTL
+            if value is not None:
+                dao_cache.set(collection, str(key), value)
+            return value
+        wrapper.uncached = fn
+        return wrapper
+    return decorator
+
+
+def cached_many(collection: str, keys: Iterable[str], loader: Callable[[list], Dict[str, Any]]) -> Dict[str, Any]:
+    keys = [str(k) for k in keys]
+    if not settings.DAO_CACHE_ENABLED:
+        return loader(list(set(keys)))
+    return dao_cache.get_many(collection, keys, loader)
+
+
+class CacheInvalidator:
+    """Keeps dao_cache fresh from a change stream, falling back to polling updated_at"""
+
+    def __init__(self, db, cache: DaoCache = None, poll_seconds: int = None):
+        self.db = db
+        self.cache = cache or dao_cache
+        self.poll_seconds = poll_seconds or settings.DAO_CACHE_POLL_SECONDS
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._last_seen: Dict[str, datetime] = {}
+
+    def start(self, mode: str = None) -> "CacheInvalidator":
+        mode = mode or settings.DAO_CACHE_INVALIDATION
+        if mode == "none":
+            return self
+        target = self._watch if mode == "change_stream" else self._poll_loop
+        self._thread = threading.Thread(target=target, name="dao-cache-invalidator", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+
+    def _watch(self):
+        pipeline = [{"$match": {"ns.coll": {"$in": list(COLLECTION_KEYS)}}}]
+        try:
+            with self.db.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000) as stream:
+                log.info("cache.change_stream_started")
+                while not self._stop.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        self._apply_change(change)
+        except PyMongoError as e:
+            # Change streams need a replica set; standalone servers end up here
+            log.warning("cache.change_stream_unavailable", error=str(e))
+            self._poll_loop()
+
+    def _apply_change(self, change: dict):
+        collection = change["ns"]["coll"]
+        doc = change.get("fullDocument") or change.get("documentKey") or {}
+        if COLLECTION_KEYS.get(collection) != "_id" and "fullDocument" not in change:
+            # Deletes only carry _id, which isn't the lookup key for this collection
+            self.cache.invalidate(collection)
+        else:
+            self.cache.invalidate_document(collection, doc)
+
+    def _poll_loop(self):
+        log.info("cache.polling_started", poll_seconds=self.poll_seconds)
+        now = datetime.now(timezone.utc)
+        for collection in COLLECTION_KEYS:
+            self._last_seen.setdefault(collection, now)
+        while not self._stop.wait(self.poll_seconds):
+            try:
+                self.poll_once()
+            except PyMongoError as e:
+                log.warning("cache.poll_error", error=str(e))
+
+    def poll_once(self):
+        """Invalidate entries for documents whose updated_at moved since the last poll"""
+        for collection, key_field in COLLECTION_KEYS.items():
+            since = self._last_seen.get(collection) or datetime.now(timezone.utc)
+            changed = self.db[collection].find({"updated_at": {"$gt": since}}, {key_field: 1, "updated_at": 1})
+            for doc in changed:
+                self.cache.invalidate_document(collection, doc)
+                updated_at = doc.get("updated_at")
+                if not isinstance(updated_at, datetime):
+                    continue
+                if updated_at.tzinfo is None:
+                    updated_at = updated_at.replace(tzinfo=timezone.utc)
+                if updated_at > since:
+                    since = updated_at
+            self._last_seen[collection] = since
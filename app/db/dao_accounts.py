@@ -1,15 +1,40 @@
 from app.db.client import db
+from app.db.cache import cached, cached_many
 from bson import ObjectId
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
+@cached("email_accounts")
 def get_email_account(email_id: str) -> Optional[dict]:
     return db.email_accounts.find_one({"_id": ObjectId(email_id)})
 
+@cached("email_campaign_settings")
 def get_email_campaign_settings(email_id: str) -> Optional[dict]:
     return db.email_campaign_settings.find_one({"email_id": email_id})
 
+@cached("email_general_settings")
 def get_email_general_settings(email_id: str) -> Optional[dict]:
     return db.email_general_settings.find_one({"email_id": email_id})
 
 def get_all_email_accounts() -> list:
     return list(db.email_accounts.find({"status": "active"}))
+
+def get_email_accounts_by_ids(email_ids: Iterable[str]) -> Dict[str, dict]:
+    """Fetch many accounts in one round trip, keyed by str(_id)"""
+    def load(missing):
+        ids = [ObjectId(e) for e in missing if e and ObjectId.is_valid(e)]
+        if not ids:
+            return {}
+        return {str(account["_id"]): account for account in db.email_accounts.find({"_id": {"$in": ids}})}
+    return cached_many("email_accounts", email_ids, load)
+
+def get_email_campaign_settings_many(email_ids: Iterable[str]) -> Dict[str, dict]:
+    """Campaign settings for many accounts, keyed by email_id"""
+    def load(missing):
+        return {doc["email_id"]: doc for doc in db.email_campaign_settings.find({"email_id": {"$in": missing}})}
+    return cached_many("email_campaign_settings", email_ids, load)
+
+def get_email_general_settings_many(email_ids: Iterable[str]) -> Dict[str, dict]:
+    """General settings (signature, sender name) for many accounts, keyed by email_id"""
+    def load(missing):
+        return {doc["email_id"]: doc for doc in db.email_general_settings.find({"email_id": {"$in": missing}})}
+    return cached_many("email_general_settings", email_ids, load)
@@ -1,5 +1,205 @@
+import atexit
+import glob
+import itertools
+import threading
+import time
+import structlog
 from app.db.client import db
-from typing import Dict
+from bson import ObjectId, json_util
+from datetime import datetime
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, PyMongoError
+from typing import Dict, Iterator, List, Optional
+from app.config.settings import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: no advisory locks, give every process its own ACTIVITY_SPOOL_PATH
+    fcntl = None
+
+log = structlog.get_logger()
+
+DUPLICATE_KEY = 11000
+
+class ActivityWriter:
+    """Buffers activity events and writes them with insert_many(ordered=False).
+
+    Flushes when the buffer reaches max_batch events or max_delay_seconds have
+    passed since the oldest one, at the end of every worker batch and at exit.
+    With a spool_path every event is also appended to a local JSONL file before
+    it is acknowledged. Each writer holds an exclusive lock on its own spool
+    (spool_path, or spool_path.1, .2, ... when that is taken by another live
+    writer), and on first use replays every spool matching spool_path* that no
+    live writer holds, i.e. the ones left behind by a crash.
+    Events get their _id up front, so a replay of already-written events is
+    dropped as duplicate keys instead of double-counting.
+    """
+
+    def __init__(self, max_batch: int = None, max_delay_seconds: float = None, spool_path: Optional[str] = None):
+        self.max_batch = max_batch or settings.ACTIVITY_BUFFER_SIZE
+        self.max_delay_seconds = max_delay_seconds if max_delay_seconds is not None else settings.ACTIVITY_BUFFER_MAX_SECONDS
+        self.spool_path = spool_path
+        self._spool = None  # locked handle of the spool file this writer owns
+        self._buffer: List[Dict] = []
+        self._oldest: Optional[float] = None
+        self._lock = threading.RLock()
+        self._recovered = False
+        self.stats = {"events": 0, "flushes": 0, "replayed": 0}
+
+    def add(self, activity: Dict):
+        with self._lock:
+            if not self._recovered:
+                self.recover()
+            activity.setdefault("_id", ObjectId())
+            if self._spool is not None:
+                self._spool.write(json_util.dumps(activity) + "\n")
+                self._spool.flush()
+            self._buffer.append(activity)
+            self.stats["events"] += 1
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            if len(self._buffer) >= self.max_batch or time.monotonic() - self._oldest >= self.max_delay_seconds:
+                try:
+                    self.flush()
+                except PyMongoError as e:
+                    # Events stay buffered (and spooled) for the next flush
+                    log.warning("activities.flush_failed", buffered=len(self._buffer), error=str(e))
+
+    def flush(self):
+        with self._lock:
+            if not self._buffer:
+                return
+            _insert_ignoring_duplicates(self._buffer)
+            self._buffer = []
+            self._oldest = None
+            self.stats["flushes"] += 1
+            if self._spool is not None:
+                # Everything in our spool is now in Mongo
+                _truncate(self._spool)
+
+    def recover(self) -> int:
+        """Claim a spool, then write out events left in orphaned spools by processes that died before flushing"""
+        with self._lock:
+            self._recovered = True
+            if not self.spool_path or self._spool is not None:
+                return 0
+            self._spool = _claim_spool(self.spool_path)
+            replayed = 0
+            for path in sorted(glob.glob(glob.escape(self.spool_path) + "*")):
+                if path == self._spool.name:
+                    replayed += self._replay(self._spool)
+                    continue
+                spool = _lock_spool(path)
+                if spool is None:
+                    continue  # a live writer's spool
+                try:
+                    replayed += self._replay(spool)
+                finally:
+                    spool.close()
+            return replayed
+
+    def _replay(self, spool) -> int:
+        spool.seek(0)
+        pending = [json_util.loads(line) for line in spool if line.strip()]
+        if pending:
+            _insert_ignoring_duplicates(pending)
+            self.stats["replayed"] += len(pending)
+            log.info("activities.spool_replayed", path=spool.name, events=len(pending))
+        _truncate(spool)
+        return len(pending)
+
+    def close(self, flush: bool = True):
+        """Flush (unless told not to) and release the spool for another writer to claim"""
+        with self._lock:
+            if flush:
+                self.flush()
+            if self._spool is not None:
+                self._spool.close()
+                self._spool = None
+            self._recovered = False
+
+def _lock_spool(path: str):
+    """Open `path` holding an exclusive lock; None when another writer has it"""
+    spool = open(path, "a+", encoding="utf-8")
+    if fcntl is not None:
+        try:
+            fcntl.flock(spool.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            spool.close()
+            return None
+    return spool
+
+def _claim_spool(spool_path: str):
+    for n in itertools.count():
+        spool = _lock_spool(spool_path if n == 0 else f"{spool_path}.{n}")
+        if spool is not None:
+            return spool
+
+def _truncate(spool):
+    spool.seek(0)
+    spool.truncate()
+
+def _insert_ignoring_duplicates(activities: List[Dict]):
+    try:
+        db.campaign_activities.insert_many(activities, ordered=False)
+    except BulkWriteError as e:
+        if any(err.get("code") != DUPLICATE_KEY for err in e.details.get("writeErrors", [])):
+            raise
+
+activity_writer = ActivityWriter(spool_path=settings.ACTIVITY_SPOOL_PATH)
+atexit.register(activity_writer.flush)
 
 def insert_activity(activity: Dict):
-    db.campaign_activities.insert_one(activity)
+    if settings.ACTIVITY_BUFFER_ENABLED:
+        activity_writer.add(activity)
+    else:
+        db.campaign_activities.insert_one(activity)
+
+def flush_activities():
+    """Write any buffered activities now (end of batch / shutdown)"""
+    activity_writer.flush()
+
+def first_activity_at(since: datetime = None) -> Optional[datetime]:
+    """created_at of the oldest activity (at or after `since`)"""
+    query = {"created_at": {"$gte": since}} if since is not None else {}
+    doc = db.campaign_activities.find_one(query, {"created_at": 1}, sort=[("created_at", 1)])
+    return doc["created_at"] if doc else None
+
+def rollup_activities(date_key: str, start: datetime, end: datetime, chunk_size: int = 1000) -> int:
+    """Write one activity_rollups document per (campaign, account) for activities in [start, end)
+
+    Counts are $set, not $inc, so rolling a day up again gives the same result.
+    Returns the number of summaries written.
+    """
+    summaries: Dict[tuple, Dict[str, int]] = {}
+    for row in db.campaign_activities.aggregate([
+        {"$match": {"created_at": {"$gte": start, "$lt": end}}},
+        {"$group": {"_id": {"campaign_id": "$campaign_id", "email_id": "$email_id", "type": "$type"},
+                    "count": {"$sum": 1}}}
+    ]):
+        key = (row["_id"].get("campaign_id"), row["_id"].get("email_id"))
+        summaries.setdefault(key, {})[row["_id"].get("type") or "unknown"] = row["count"]
+
+    ops = [
+        UpdateOne({"_id": f"{date_key}:{campaign_id}:{email_id}"},
+                  {"$set": {"date_key": date_key, "campaign_id": campaign_id, "email_id": email_id,
+                            "counts": counts, "total": sum(counts.values())}},
+                  upsert=True)
+        for (campaign_id, email_id), counts in summaries.items()
+    ]
+    for i in range(0, len(ops), chunk_size):
+        db.activity_rollups.bulk_write(ops[i:i + chunk_size], ordered=False)
+    return len(ops)
+
+def iter_activities(start: datetime, end: datetime, batch_size: int = 1000) -> Iterator[dict]:
+    return db.campaign_activities.find({"created_at": {"$gte": start, "$lt": end}},
+                                       batch_size=batch_size).sort("_id", 1)
+
+def delete_activities(start: datetime, end: datetime) -> int:
+    return db.campaign_activities.delete_many({"created_at": {"$gte": start, "$lt": end}}).deleted_count
+
+def get_activity_rollups(date_key: str, campaign_id: str = None) -> List[dict]:
+    query = {"date_key": date_key}
+    if campaign_id:
+        query["campaign_id"] = campaign_id
+    return list(db.activity_rollups.find(query).sort("_id", 1))
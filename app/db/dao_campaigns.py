@@ -1,4 +1,5 @@
 from app.db.client import db
+from app.db.cache import cached
 from bson import ObjectId
 from typing import Any, Optional, List
 
@@ -8,9 +9,11 @@ def get_campaign_queue():
 def get_campaign_by_id(campaign_id: str) -> Optional[dict]:
     return db.campaigns.find_one({"_id": ObjectId(campaign_id)})
 
+@cached("campaign_options")
 def get_campaign_options(campaign_id: str) -> Optional[dict]:
     return db.campaign_options.find_one({"campaign_id": campaign_id})
 
+@cached("campaign_schedule")
 def get_campaign_schedule(campaign_id: str) -> Optional[dict]:
     return db.campaign_schedule.find_one({"campaign_id": campaign_id})
 
@@ -1,9 +1,146 @@
+import os
+import re
+import socket
+import threading
+import uuid
 from app.db.client import db
 from bson import ObjectId
-from typing import List, Optional
-from datetime import datetime
+from pymongo import ASCENDING, UpdateOne
+from typing import Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timezone, timedelta
+from app.config.settings import settings
+
+LEAD_STATE_ACTIVE = "active"
+LEAD_STATE_STOPPED = "stopped"
+# due_at for leads that have never been sent to - sorts ahead of everything else
+NEVER_SENT_DUE_AT = datetime(1970, 1, 1, tzinfo=timezone.utc)
+LEASE_FIELDS = ("claimed_by", "claim_expires_at")
+RELEASE_UPDATE = {"$unset": {field: "" for field in LEASE_FIELDS}}
+# progress.processed_recipients keys
+RECIPIENT_KEY = re.compile(r"^step_(\d+)_recipient_(\d+)$")
+
+def due_fields(progress: Optional[dict]) -> dict:
+    """Top-level state/due_at equivalent to a lead's progress document"""
+    progress = progress or {}
+    if progress.get("stopped") is True:
+        return {"state": LEAD_STATE_STOPPED, "due_at": None}
+    if "last_sent_at" not in progress:
+        return {"state": LEAD_STATE_ACTIVE, "due_at": NEVER_SENT_DUE_AT}
+    return {"state": LEAD_STATE_ACTIVE, "due_at": progress.get("next_due_at")}
 
 def get_due_leads(campaign_id: str, now_utc: datetime, batch_size: int) -> List[dict]:
+    """Due leads, earliest first - one range scan on (campaign_id, state, due_at)"""
+    if settings.LEGACY_DUE_LEADS_QUERY:
+        return _get_due_leads_legacy(campaign_id, now_utc, batch_size)
+    return list(db.campaign_leads.find(_due_query(campaign_id, now_utc), {"lead_data": 1, "progress": 1})
+                .sort("due_at", ASCENDING).limit(batch_size))
+
+def _due_query(campaign_id: str, now_utc: datetime) -> dict:
+    """Indexed state/due_at match, plus the progress.* match for leads that have no state yet
+
+    Leads inserted before migrate-lead-due-fields, or by tools that don't write
+    state/due_at, still go out. Once every lead has a state the second branch is
+    an empty range on the same index.
+    """
+    if settings.LEGACY_DUE_LEADS_QUERY:
+        return _legacy_due_query(campaign_id, now_utc)
+    return {"$or": [
+        {
+            "campaign_id": ObjectId(campaign_id),
+            "state": LEAD_STATE_ACTIVE,
+            "due_at": {"$lte": now_utc}
+        },
+        _unmigrated_due_query(campaign_id, now_utc)
+    ]}
+
+def _unmigrated_due_query(campaign_id: str, now_utc: datetime) -> dict:
+    return {**_legacy_due_query(campaign_id, now_utc), "state": {"$exists": False}}
+
+def _unclaimed_clause(now_utc: datetime) -> dict:
+    return {"$or": [
+        {"claim_expires_at": {"$exists": False}},
+        {"claim_expires_at": None},
+        {"claim_expires_at": {"$lte": now_utc}}
+    ]}
+
+def count_due_leads(campaign_id: str, now_utc: datetime) -> int:
+    """Due-lead backlog, leased or not (same index range as get_due_leads)"""
+    return db.campaign_leads.count_documents(_due_query(campaign_id, now_utc))
+
+def get_next_due_at(campaign_id: str, now_utc: datetime) -> Optional[datetime]:
+    """Earliest due_at among the campaign's active, unleased leads (None if there are none)"""
+    unclaimed = _unclaimed_clause(now_utc)
+    lead = db.campaign_leads.find_one(
+        {"$and": [{"campaign_id": ObjectId(campaign_id), "state": LEAD_STATE_ACTIVE}, unclaimed]},
+        {"due_at": 1},
+        sort=[("due_at", ASCENDING)]
+    )
+    due_at = lead.get("due_at") if lead else None
+    # Leads without state/due_at yet: work it out from progress the way due_fields does
+    unmigrated = db.campaign_leads.find_one(
+        {"$and": [{"campaign_id": ObjectId(campaign_id), "state": {"$exists": False},
+                   "progress.stopped": {"$ne": True}}, unclaimed]},
+        {"progress": 1},
+        sort=[("progress.next_due_at", ASCENDING)]
+    )
+    if unmigrated:
+        legacy_due_at = due_fields(unmigrated.get("progress"))["due_at"]
+        # Both UTC; stored values come back naive
+        if legacy_due_at is not None and (due_at is None or
+                                          legacy_due_at.replace(tzinfo=None) < due_at.replace(tzinfo=None)):
+            due_at = legacy_due_at
+    return due_at
+
+def new_claim_id() -> str:
+    """Lease owner for one worker batch: host:pid plus a per-batch suffix"""
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+def claim_due_leads(campaign_id: str, now_utc: datetime, batch_size: int, claim_id: str,
+                    lease_seconds: int = None) -> List[dict]:
+    """Lease up to batch_size due leads to claim_id so other processes skip them
+    
+    Candidates come from the usual due-leads scan (minus live leases); the claim
+    itself is one conditional update_many, so a lead another process grabbed in
+    between is simply not returned. Leases that outlive a crashed worker expire
+    after lease_seconds and the leads become claimable again.
+    """
+    lease_seconds = lease_seconds if lease_seconds is not None else settings.LEAD_LEASE_SECONDS
+    unclaimed = _unclaimed_clause(now_utc)
+    query = {"$and": [_due_query(campaign_id, now_utc), unclaimed]}
+    cursor = db.campaign_leads.find(query, {"_id": 1}).limit(batch_size)
+    if not settings.LEGACY_DUE_LEADS_QUERY:
+        cursor = cursor.sort("due_at", ASCENDING)
+    ids = [doc["_id"] for doc in cursor]
+    if not ids:
+        return []
+    
+    db.campaign_leads.update_many({"$and": [{"_id": {"$in": ids}}, unclaimed]},
+                                  _lease_update(claim_id, now_utc, lease_seconds))
+    claimed = db.campaign_leads.find({"_id": {"$in": ids}, "claimed_by": claim_id},
+                                     {"lead_data": 1, "progress": 1})
+    # Keep the due order of the candidate scan
+    by_id = {doc["_id"]: doc for doc in claimed}
+    return [by_id[_id] for _id in ids if _id in by_id]
+
+def _lease_update(claim_id: str, now_utc: datetime, lease_seconds: int) -> dict:
+    return {"$set": {"claimed_by": claim_id, "claim_expires_at": now_utc + timedelta(seconds=lease_seconds)}}
+
+def _release_filter(lead_ids: List, claim_id: str) -> dict:
+    return {"_id": {"$in": [ObjectId(str(lead_id)) for lead_id in lead_ids]}, "claimed_by": claim_id}
+
+def release_lead_claims(lead_ids: List, claim_id: str) -> int:
+    """Drop this batch's leases; leads re-leased by someone else are left alone"""
+    if not lead_ids:
+        return 0
+    result = db.campaign_leads.update_many(_release_filter(lead_ids, claim_id), RELEASE_UPDATE)
+    return result.modified_count
+
+def _get_due_leads_legacy(campaign_id: str, now_utc: datetime, batch_size: int) -> List[dict]:
+    """Pre-migration query on progress fields (can't use a campaign-scoped index)"""
+    return list(db.campaign_leads.find(_legacy_due_query(campaign_id, now_utc), {"lead_data": 1, "progress": 1})
+                .limit(batch_size))
+
+def _legacy_due_query(campaign_id: str, now_utc: datetime) -> dict:
     query = {
         "campaign_id": ObjectId(campaign_id),  # Convert string to ObjectId
         "$or": [
@@ -17,14 +154,236 @@ def get_due_leads(campaign_id: str, now_utc: datetime, batch_size: int) -> List[
             }
         ]
     }
-    return list(db.campaign_leads.find(query, {"lead_data": 1, "progress": 1}).limit(batch_size))
+    return query
 
 def update_lead_progress(lead_id: str, progress: dict):
     db.campaign_leads.update_one({"_id": ObjectId(lead_id)}, {"$set": {"progress": progress}})
 
+class LeadUpdateBatch:
+    """Collects targeted $set updates for a batch of leads and writes them with one bulk_write
+    
+    Paths like progress.processed_recipients.<key> and lead_data.<i>.status keep
+    each write (and its oplog entry) proportional to what changed rather than to
+    the size of the lead's recipient list.
+    """
+    
+    def __init__(self):
+        self._updates: Dict[str, Dict] = {}
+        self._lock = threading.Lock()
+    
+    def set(self, lead_id: str, fields: Dict):
+        with self._lock:
+            self._updates.setdefault(lead_id, {}).update(fields)
+    
+    def __len__(self) -> int:
+        return len(self._updates)
+    
+    def take_ops(self) -> List[UpdateOne]:
+        """Hand over the pending updates as bulk_write operations and start empty"""
+        with self._lock:
+            updates, self._updates = self._updates, {}
+        return [UpdateOne({"_id": ObjectId(lead_id)}, {"$set": fields}) for lead_id, fields in updates.items()]
+    
+    def flush(self) -> int:
+        ops = self.take_ops()
+        if not ops:
+            return 0
+        db.campaign_leads.bulk_write(ops, ordered=False)
+        return len(ops)
+
 def backfill_lead_progress(campaign_id: str):
     """Add default progress to leads that don't have it"""
     db.campaign_leads.update_many(
         {"campaign_id": campaign_id, "progress": {"$exists": False}},
-        {"$set": {"progress": {"current_step_order": 1, "stopped": False}}}
+        {"$set": {"progress": {"current_step_order": 1, "stopped": False},
+                  "state": LEAD_STATE_ACTIVE, "due_at": NEVER_SENT_DUE_AT}}
     )
+
+def backfill_lead_due_fields(campaign_id: Optional[str] = None, force: bool = False,
+                             chunk_size: int = 1000, on_progress=None) -> int:
+    """Derive state/due_at from progress for existing leads, in chunked bulk writes
+    
+    Only leads without a state are touched unless force is set, so the migration
+    can be interrupted and re-run.
+    """
+    query = {} if force else {"state": {"$exists": False}}
+    if campaign_id:
+        query.update(_campaign_filter(campaign_id))
+    
+    updated = 0
+    ops = []
+    for lead in db.campaign_leads.find(query, {"progress": 1}, batch_size=chunk_size):
+        ops.append(UpdateOne({"_id": lead["_id"]}, {"$set": due_fields(lead.get("progress"))}))
+        if len(ops) >= chunk_size:
+            db.campaign_leads.bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+            if on_progress:
+                on_progress(updated)
+    if ops:
+        db.campaign_leads.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+def _campaign_filter(campaign_id: str) -> dict:
+    ids = [campaign_id, ObjectId(campaign_id)] if ObjectId.is_valid(campaign_id) else [campaign_id]
+    return {"campaign_id": {"$in": ids}}
+
+def _uncontacted_query(campaign_id: Optional[str] = None) -> dict:
+    """Leads with processed recipients and at least one recipient still marked not_contacted"""
+    query = {
+        "progress.processed_recipients": {"$exists": True, "$ne": {}},
+        "lead_data": {"$elemMatch": {"$or": [{"status": "not_contacted"}, {"status": {"$exists": False}}]}},
+    }
+    if campaign_id:
+        query.update(_campaign_filter(campaign_id))
+    return query
+
+def recipient_last_steps(processed_recipients: dict) -> Dict[int, Tuple[int, Optional[datetime]]]:
+    """recipient index -> (latest step, processed_at) in one pass over the keys"""
+    last_steps: Dict[int, Tuple[int, Optional[datetime]]] = {}
+    for key, info in processed_recipients.items():
+        match = RECIPIENT_KEY.match(key)
+        if not match:
+            continue
+        step, index = int(match.group(1)), int(match.group(2))
+        if index not in last_steps or step > last_steps[index][0]:
+            last_steps[index] = (step, (info or {}).get("processed_at"))
+    return last_steps
+
+def contacted_status_fields(lead: dict) -> dict:
+    """$set fields marking processed-but-not_contacted recipients of a lead as contacted"""
+    lead_data = lead.get("lead_data")
+    if not isinstance(lead_data, list):
+        return {}
+    last_steps = recipient_last_steps(lead.get("progress", {}).get("processed_recipients", {}))
+    fields = {}
+    for index, recipient in enumerate(lead_data):
+        if index not in last_steps or not isinstance(recipient, dict):
+            continue
+        if recipient.get("status", "not_contacted") != "not_contacted":
+            continue
+        step, processed_at = last_steps[index]
+        # Positional fields: concurrent sends to other recipients aren't overwritten
+        fields[f"lead_data.{index}.status"] = "contacted"
+        fields[f"lead_data.{index}.last_contacted_at"] = processed_at
+        fields[f"lead_data.{index}.last_step"] = step
+    return fields
+
+def update_recipient_statuses(campaign_id: Optional[str] = None, chunk_size: int = 1000,
+                              resume_after: Optional[ObjectId] = None,
+                              on_progress: Callable[[int, int, ObjectId], None] = None) -> Tuple[int, int]:
+    """Mark processed recipients as contacted, streaming leads in _id order
+
+    Returns (leads scanned, leads updated). on_progress(scanned, updated, last_id)
+    runs after every chunk; last_id is a safe resume_after for a later run.
+    """
+    query = _uncontacted_query(campaign_id)
+    if resume_after is not None:
+        query["_id"] = {"$gt": resume_after}
+    projection = {"lead_data": 1, "progress.processed_recipients": 1}
+    cursor = db.campaign_leads.find(query, projection, batch_size=chunk_size).sort("_id", ASCENDING)
+    
+    scanned = updated = 0
+    ops = []
+    last_id = resume_after
+    for lead in cursor:
+        scanned += 1
+        last_id = lead["_id"]
+        fields = contacted_status_fields(lead)
+        if fields:
+            ops.append(UpdateOne({"_id": lead["_id"]}, {"$set": fields}))
+        if scanned % chunk_size == 0:
+            if ops:
+                db.campaign_leads.bulk_write(ops, ordered=False)
+                updated += len(ops)
+                ops = []
+            if on_progress:
+                on_progress(scanned, updated, last_id)
+    if ops:
+        db.campaign_leads.bulk_write(ops, ordered=False)
+        updated += len(ops)
+    if on_progress and scanned % chunk_size:
+        on_progress(scanned, updated, last_id)
+    return scanned, updated
+
+def _recipient_part(key_expr: str, part: int) -> dict:
+    # "step_<s>_recipient_<i>".split("_") -> ["step", s, "recipient", i]
+    return {"$arrayElemAt": [{"$split": [key_expr, "_"]}, part]}
+
+# Server-side equivalent of contacted_status_fields, as an update pipeline (MongoDB 4.2+)
+CONTACTED_STATUS_PIPELINE = [{"$set": {"lead_data": {"$map": {
+    "input": {"$range": [0, {"$size": "$lead_data"}]},
+    "as": "i",
+    "in": {"$let": {
+        "vars": {
+            "recipient": {"$arrayElemAt": ["$lead_data", "$$i"]},
+            "last": {"$reduce": {
+                "input": {"$filter": {
+                    "input": {"$objectToArray": "$progress.processed_recipients"},
+                    "as": "p",
+                    "cond": {"$and": [
+                        {"$regexMatch": {"input": "$$p.k", "regex": RECIPIENT_KEY.pattern}},
+                        {"$eq": [_recipient_part("$$p.k", 3), {"$toString": "$$i"}]},
+                    ]},
+                }},
+                "initialValue": None,
+                "in": {"$cond": [
+                    {"$or": [{"$eq": ["$$value", None]},
+                             {"$gt": [{"$toInt": _recipient_part("$$this.k", 1)}, "$$value.step"]}]},
+                    {"step": {"$toInt": _recipient_part("$$this.k", 1)}, "at": "$$this.v.processed_at"},
+                    "$$value",
+                ]},
+            }},
+        },
+        "in": {"$cond": [
+            {"$and": [
+                {"$ne": ["$$last", None]},
+                {"$eq": [{"$type": "$$recipient"}, "object"]},
+                {"$eq": [{"$ifNull": ["$$recipient.status", "not_contacted"]}, "not_contacted"]},
+            ]},
+            {"$mergeObjects": ["$$recipient", {"status": "contacted", "last_contacted_at": "$$last.at",
+                                               "last_step": "$$last.step"}]},
+            "$$recipient",
+        ]},
+    }},
+}}}}]
+
+def update_recipient_statuses_server_side(campaign_id: Optional[str] = None) -> int:
+    """Same update as update_recipient_statuses, computed by the server in one update_many"""
+    result = db.campaign_leads.update_many(_uncontacted_query(campaign_id), CONTACTED_STATUS_PIPELINE)
+    return result.modified_count
+
+def new_lead(campaign_id: str, recipients: List[dict]) -> dict:
+    """A fresh lead document: first step, never sent, due immediately"""
+    progress = {"current_step_order": 1, "stopped": False}
+    return {"campaign_id": ObjectId(campaign_id), "lead_data": recipients, "progress": progress, **due_fields(progress)}
+
+def existing_lead_emails(campaign_id: str, emails: List[str]) -> set:
+    """The subset of `emails` already on a lead of this campaign (served by the lead_data.email index)"""
+    wanted = set(emails)
+    found = set()
+    for lead in db.campaign_leads.find({**_campaign_filter(campaign_id), "lead_data.email": {"$in": list(wanted)}},
+                                       {"lead_data.email": 1}):
+        lead_data = lead.get("lead_data")
+        recipients = lead_data if isinstance(lead_data, list) else [lead_data or {}]
+        found.update(recipient.get("email") for recipient in recipients if recipient.get("email") in wanted)
+    return found
+
+def insert_leads(leads: List[dict]) -> int:
+    if not leads:
+        return 0
+    return len(db.campaign_leads.insert_many(leads, ordered=False).inserted_ids)
+
+def get_checkpoint(name: str) -> Optional[dict]:
+    return db.maintenance_checkpoints.find_one({"_id": name})
+
+def save_checkpoint(name: str, last_id, **fields):
+    db.maintenance_checkpoints.update_one(
+        {"_id": name},
+        {"$set": {"last_id": last_id, "updated_at": datetime.now(timezone.utc), **fields}},
+        upsert=True
+    )
+
+def clear_checkpoint(name: str):
+    db.maintenance_checkpoints.delete_one({"_id": name})
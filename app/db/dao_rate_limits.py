@@ -0,0 +1,36 @@
+from app.db.client import db
+from app.db.cache import cached_many
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+from pymongo.errors import DuplicateKeyError
+
+def get_smtp_host_limits_many(smtp_hosts: Iterable[str]) -> Dict[str, dict]:
+    """Provider-level throttles keyed by smtp_host (hosts without a document are unthrottled)"""
+    def load(missing):
+        found = {doc["smtp_host"]: doc for doc in db.smtp_host_limits.find({"smtp_host": {"$in": missing}})}
+        # Most hosts have no limits: cache that too, or every reservation would query for it
+        return {host: found.get(host, {}) for host in missing}
+    return cached_many("smtp_host_limits", smtp_hosts, load)
+
+def get_bucket(key: str) -> Optional[dict]:
+    return db.rate_limit_buckets.find_one({"_id": key})
+
+def create_bucket(key: str, tokens: float, now_utc: datetime) -> bool:
+    """Insert a new bucket; False if another process created it first"""
+    try:
+        db.rate_limit_buckets.insert_one({"_id": key, "tokens": tokens, "updated_at": now_utc})
+        return True
+    except DuplicateKeyError:
+        return False
+
+def swap_bucket(bucket: dict, tokens: float, now_utc: datetime) -> bool:
+    """Store a new level only if nobody changed the bucket since it was read"""
+    result = db.rate_limit_buckets.update_one(
+        {"_id": bucket["_id"], "tokens": bucket["tokens"], "updated_at": bucket["updated_at"]},
+        {"$set": {"tokens": tokens, "updated_at": now_utc}}
+    )
+    return result.modified_count == 1
+
+def refund_token(key: str):
+    # Refill clamps to capacity, so a refund can't grow the burst
+    db.rate_limit_buckets.update_one({"_id": key}, {"$inc": {"tokens": 1}})
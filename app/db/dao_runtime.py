@@ -1,65 +1,213 @@
 from app.db.client import db
-from typing import Optional
-from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from datetime import datetime, timezone
 from pymongo import ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+DUPLICATE_KEY = 11000
+ROLLBACK_UPDATE = {"$set": {"locked_until": None}}
 
 def get_account_runtime_state(email_id: str, date_key: str) -> Optional[dict]:
     return db.account_runtime_state.find_one({"email_id": email_id, "date_key": date_key})
 
+def get_account_runtime_states(email_ids: List[str], date_key: str) -> List[dict]:
+    return list(db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key},
+        {"email_id": 1, "sent_count": 1, "next_available_at": 1, "locked_until": 1}
+    ))
+
+def _available_clause(now_utc: datetime) -> list:
+    """Unlocked and past its cooldown"""
+    return [
+        {
+            "$or": [
+                {"locked_until": {"$exists": False}},
+                {"locked_until": None},
+                {"locked_until": {"$lte": now_utc}}
+            ]
+        },
+        {
+            "$or": [
+                {"next_available_at": {"$exists": False}},
+                {"next_available_at": {"$lte": now_utc}}
+            ]
+        }
+    ]
+
+def ensure_account_runtime_states(email_ids: Iterable[str], date_key: str, now_utc: datetime):
+    """Create today's runtime state rows that don't exist yet"""
+    email_ids = list(email_ids)
+    existing = {doc["email_id"] for doc in db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key}, {"email_id": 1}
+    )}
+    missing = [_new_runtime_state(email_id, date_key, now_utc) for email_id in email_ids if email_id not in existing]
+    if not missing:
+        return
+    try:
+        db.account_runtime_state.insert_many(missing, ordered=False)
+    except BulkWriteError as e:
+        _raise_unless_duplicates(e)
+
+def _new_runtime_state(email_id: str, date_key: str, now_utc: datetime) -> dict:
+    # For new records, set next_available_at to beginning of today (so they're immediately available)
+    start_of_day = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {"email_id": email_id, "date_key": date_key, "sent_count": 0, "next_available_at": start_of_day}
+
+def _raise_unless_duplicates(error: BulkWriteError):
+    # Another process inserted the same row first - that's fine
+    if any(err.get("code") != DUPLICATE_KEY for err in error.details.get("writeErrors", [])):
+        raise error
+
 def atomic_reserve_account(email_id: str, date_key: str, now_utc: datetime, 
                           daily_limit: int, lock_until: datetime) -> Optional[dict]:
     """Atomically reserve an account if available"""
-    # For new records, set next_available_at to beginning of today (so they're immediately available)
-    start_of_day = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
+    # Create the row separately: upserting with the availability filter would try to insert
+    # a duplicate row whenever the existing one is locked, cooling down or at its limit
+    ensure_account_runtime_states([email_id], date_key, now_utc)
     
     return db.account_runtime_state.find_one_and_update(
         {
             "email_id": email_id,
             "date_key": date_key,
             "sent_count": {"$lt": daily_limit},
-            "$and": [
-                {
-                    "$or": [
-                        {"locked_until": {"$exists": False}},
-                        {"locked_until": {"$lte": now_utc}}
-                    ]
-                },
-                {
-                    "$or": [
-                        {"next_available_at": {"$exists": False}},
-                        {"next_available_at": {"$lte": now_utc}}
-                    ]
-                }
-            ]
+            "$and": _available_clause(now_utc)
         },
         {
-            "$setOnInsert": {
-                "sent_count": 0, 
-                "next_available_at": start_of_day  # Set to start of day for new records
-            },
             "$set": {"locked_until": lock_until}
             # Don't update next_available_at during reservation - only during commit
         },
-        upsert=True, 
         return_document=ReturnDocument.AFTER
     )
 
+def get_next_account_available_at(daily_limits: Dict[str, int], date_key: str,
+                                  now_utc: datetime) -> Optional[datetime]:
+    """Soonest moment one of these accounts can send today (None if all hit their limit)"""
+    states = {state["email_id"]: state for state in get_account_runtime_states(list(daily_limits), date_key)}
+    earliest = None
+    for email_id, daily_limit in daily_limits.items():
+        state = states.get(email_id)
+        if state is None:
+            return now_utc
+        if state.get("sent_count", 0) >= daily_limit:
+            continue
+        ready = now_utc
+        for field in ("next_available_at", "locked_until"):
+            value = state.get(field)
+            if value is not None:
+                if value.tzinfo is None:
+                    value = value.replace(tzinfo=timezone.utc)
+                ready = max(ready, value)
+        earliest = ready if earliest is None else min(earliest, ready)
+    return earliest
+
+def find_available_accounts(email_ids: List[str], date_key: str, now_utc: datetime) -> List[dict]:
+    """Runtime states that are unlocked and off cooldown"""
+    return list(db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key, "$and": _available_clause(now_utc)},
+        {"email_id": 1, "sent_count": 1, "next_available_at": 1, "locked_until": 1}
+    ))
+
+def claim_accounts(email_ids: List[str], date_key: str, now_utc: datetime, daily_limit: int,
+                   lock_until: datetime, claim_token: str) -> int:
+    """Lock every still-eligible account in email_ids under claim_token"""
+    result = db.account_runtime_state.update_many(
+        _claim_filter(email_ids, date_key, now_utc, daily_limit),
+        {"$set": {"locked_until": lock_until, "claim_token": claim_token}}
+    )
+    return result.modified_count
+
+def _claim_filter(email_ids: List[str], date_key: str, now_utc: datetime, daily_limit: int) -> dict:
+    return {
+        "email_id": {"$in": email_ids},
+        "date_key": date_key,
+        "sent_count": {"$lt": daily_limit},
+        "$and": _available_clause(now_utc)
+    }
+
+def get_claimed_accounts(email_ids: List[str], date_key: str, claim_token: str) -> List[str]:
+    return [doc["email_id"] for doc in db.account_runtime_state.find(
+        {"email_id": {"$in": email_ids}, "date_key": date_key, "claim_token": claim_token}, {"email_id": 1}
+    )]
+
 def commit_account_send(email_id: str, date_key: str, next_available: datetime):
     """Commit a successful send"""
-    db.account_runtime_state.update_one(
-        {"email_id": email_id, "date_key": date_key},
-        {
-            "$inc": {"sent_count": 1},
-            "$set": {"next_available_at": next_available, "locked_until": None}
-        }
-    )
+    db.account_runtime_state.update_one({"email_id": email_id, "date_key": date_key}, _commit_update(next_available))
+
+def _commit_update(next_available: datetime) -> dict:
+    return {
+        "$inc": {"sent_count": 1},
+        "$set": {"next_available_at": next_available, "locked_until": None}
+    }
 
 def rollback_account_reservation(email_id: str, date_key: str):
     """Rollback a failed send"""
-    db.account_runtime_state.update_one(
-        {"email_id": email_id, "date_key": date_key},
-        {"$set": {"locked_until": None}}
+    db.account_runtime_state.update_one({"email_id": email_id, "date_key": date_key}, ROLLBACK_UPDATE)
+
+def _day_bounds(date_key: str):
+    start_of_day = datetime.fromisoformat(f"{date_key}T00:00:00+00:00")
+    end_of_day = datetime.fromisoformat(f"{date_key}T23:59:59+00:00")
+    return start_of_day, end_of_day
+
+def _campaign_sends_query(campaign_id: str, date_key: str) -> dict:
+    start_of_day, end_of_day = _day_bounds(date_key)
+    return {
+        "campaign_id": campaign_id,
+        "type": "sent",
+        "created_at": {"$gte": start_of_day, "$lte": end_of_day}
+    }
+
+def _count_campaign_sends(campaign_id: str, date_key: str) -> int:
+    return db.campaign_activities.count_documents(_campaign_sends_query(campaign_id, date_key))
+
+def get_campaign_sent_count(campaign_id: str, date_key: str) -> int:
+    """Sends for a campaign on date_key from its campaign_runtime_state counter
+    
+    Whoever creates the day's counter - this check or a worker's first
+    increment - seeds it from activities (cheap that early); after that it is
+    a single indexed find_one.
+    """
+    state = db.campaign_runtime_state.find_one({"campaign_id": campaign_id, "date_key": date_key}, {"sent_count": 1})
+    if state is not None:
+        return state.get("sent_count", 0)
+    sent_count = _count_campaign_sends(campaign_id, date_key)
+    try:
+        db.campaign_runtime_state.insert_one({"campaign_id": campaign_id, "date_key": date_key, "sent_count": sent_count})
+    except DuplicateKeyError:
+        # A worker or another dispatcher created it first
+        state = db.campaign_runtime_state.find_one({"campaign_id": campaign_id, "date_key": date_key}, {"sent_count": 1})
+        return state.get("sent_count", 0)
+    return sent_count
+
+def increment_campaign_sent(campaign_id: str, date_key: str, count: int = 1):
+    """Add committed sends to the campaign's daily counter, seeding it if this is the day's first write
+
+    Workers call this after flushing the batch's activities, so a seed counted
+    here already includes the batch.
+    """
+    if count <= 0:
+        return
+    result = db.campaign_runtime_state.update_one({"campaign_id": campaign_id, "date_key": date_key},
+                                                  {"$inc": {"sent_count": count}})
+    if result.matched_count:
+        return
+    sent_count = max(_count_campaign_sends(campaign_id, date_key), count)
+    try:
+        db.campaign_runtime_state.insert_one({"campaign_id": campaign_id, "date_key": date_key, "sent_count": sent_count})
+    except DuplicateKeyError:
+        # Seeded concurrently; a seed counted before our activities landed would miss them, so add them
+        # (at worst this batch is counted twice, which only errs towards the daily limit)
+        db.campaign_runtime_state.update_one({"campaign_id": campaign_id, "date_key": date_key},
+                                             {"$inc": {"sent_count": count}})
+
+def recount_campaign_runtime_state(campaign_id: str, date_key: str) -> int:
+    """Rebuild a campaign's daily counter from activities"""
+    sent_count = _count_campaign_sends(campaign_id, date_key)
+    db.campaign_runtime_state.update_one(
+        {"campaign_id": campaign_id, "date_key": date_key},
+        {"$set": {"sent_count": sent_count}},
+        upsert=True
     )
+    return sent_count
 
 def recount_account_runtime_state(email_id: str, date_key: str):
     """Rebuild runtime state from activities"""
@@ -78,3 +226,70 @@ def recount_account_runtime_state(email_id: str, date_key: str):
         {"$set": {"sent_count": sent_count}},
         upsert=True
     )
+
+def _runtime_state_status_expr(now_utc: datetime) -> dict:
+    # Same precedence as the CLI: a live lock wins over a pending cooldown
+    return {"$cond": [
+        {"$gt": ["$locked_until", now_utc]}, "LOCKED",
+        {"$cond": [{"$gt": ["$next_available_at", now_utc]}, "WAITING", "AVAILABLE"]}
+    ]}
+
+def summarize_account_runtime_states(date_key: str, now_utc: datetime) -> Dict[str, int]:
+    """Count of date_key's runtime states per status, computed server side"""
+    counts = {"AVAILABLE": 0, "WAITING": 0, "LOCKED": 0}
+    for row in db.account_runtime_state.aggregate([
+        {"$match": {"date_key": date_key}},
+        {"$group": {"_id": _runtime_state_status_expr(now_utc), "count": {"$sum": 1}}}
+    ]):
+        counts[row["_id"]] = row["count"]
+    return counts
+
+def runtime_state_page_pipeline(date_key: str, skip: int, limit: int, join: bool = True) -> list:
+    """One page of date_key's runtime states, optionally joined to account email and daily limit
+
+    Paging happens before the lookups so they only run for the rows shown;
+    the (date_key, email_id) index serves the match and sort.
+    """
+    pipeline = [
+        {"$match": {"date_key": date_key}},
+        {"$sort": {"email_id": 1}},
+        {"$skip": skip},
+        {"$limit": limit},
+    ]
+    fields = {"_id": 0, "email_id": 1, "sent_count": 1, "next_available_at": 1, "locked_until": 1}
+    if join:
+        pipeline += [
+            # email_id is the account _id as a string; bad ids join to nothing
+            {"$lookup": {
+                "from": "email_accounts",
+                "let": {"account_id": {"$convert": {"input": "$email_id", "to": "objectId",
+                                                    "onError": None, "onNull": None}}},
+                "pipeline": [{"$match": {"$expr": {"$eq": ["$_id", "$$account_id"]}}},
+                             {"$project": {"_id": 0, "email": 1}}],
+                "as": "account"
+            }},
+            {"$lookup": {"from": "email_campaign_settings", "localField": "email_id",
+                         "foreignField": "email_id", "as": "settings"}},
+        ]
+        fields.update({"email": {"$arrayElemAt": ["$account.email", 0]},
+                       "daily_limit": {"$arrayElemAt": ["$settings.daily_limit", 0]}})
+    pipeline.append({"$project": fields})
+    return pipeline
+
+def get_account_runtime_state_page(date_key: str, skip: int = 0, limit: int = 50, join: bool = True) -> List[dict]:
+    return list(db.account_runtime_state.aggregate(runtime_state_page_pipeline(date_key, skip, limit, join)))
+
+def delete_runtime_states_before(date_key: str) -> Dict[str, int]:
+    """Remove account/campaign runtime state rows for days before date_key"""
+    query = {"date_key": {"$lt": date_key}}
+    return {
+        "account_runtime_state": db.account_runtime_state.delete_many(query).deleted_count,
+        "campaign_runtime_state": db.campaign_runtime_state.delete_many(query).deleted_count,
+    }
+
+def report_worker_health(worker_id: str, fields: dict):
+    """Upsert one pool process's heartbeat document"""
+    db.worker_health.update_one({"_id": worker_id}, {"$set": fields}, upsert=True)
+
+def get_worker_health() -> List[dict]:
+    return list(db.worker_health.find().sort("slot", 1))
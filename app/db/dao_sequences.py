@@ -1,9 +1,21 @@
 from app.db.client import db
+from app.db.cache import cached, cached_many
 from bson import ObjectId
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
+@cached("campaign_sequences")
 def get_campaign_sequence(campaign_id: str) -> Optional[dict]:
     return db.campaign_sequences.find_one({"campaign_id": campaign_id})
 
+@cached("sequence_steps")
 def get_sequence_step_by_id(step_id: str) -> Optional[dict]:
     return db.sequence_steps.find_one({"_id": ObjectId(step_id)})
+
+def get_sequence_steps_by_ids(step_ids: Iterable[str]) -> Dict[str, dict]:
+    """Fetch many steps in one round trip, keyed by str(_id)"""
+    def load(missing):
+        ids = [ObjectId(s) for s in missing if s and ObjectId.is_valid(s)]
+        if not ids:
+            return {}
+        return {str(step["_id"]): step for step in db.sequence_steps.find({"_id": {"$in": ids}})}
+    return cached_many("sequence_steps", step_ids, load)
@@ -0,0 +1,42 @@
+from app.db.client import db
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+from pymongo import ASCENDING, UpdateOne
+
+def iter_active_suppressed_emails(batch_size: int = 10000) -> Iterator[str]:
+    for doc in db.suppressions.find({"active": True}, {"_id": 0, "email": 1}, batch_size=batch_size):
+        yield doc["email"]
+
+def get_suppression_changes(since: datetime) -> List[dict]:
+    """Suppressions added or lifted since `since` (served by the updated_at index)"""
+    return list(db.suppressions.find({"updated_at": {"$gte": since}}, {"_id": 0, "email": 1, "active": 1})
+                .sort("updated_at", ASCENDING))
+
+def get_suppression(email: str) -> Optional[dict]:
+    return db.suppressions.find_one({"email": email})
+
+def upsert_suppressions(entries: List[dict], now_utc: datetime) -> Tuple[int, int]:
+    """Suppress each entry's email (with its reason/source); returns (new, reactivated or updated)"""
+    if not entries:
+        return 0, 0
+    ops = [
+        UpdateOne({"email": entry["email"]},
+                  {"$set": {"active": True, "reason": entry.get("reason"), "source": entry.get("source"),
+                            "updated_at": now_utc},
+                   "$setOnInsert": {"created_at": now_utc}},
+                  upsert=True)
+        for entry in entries
+    ]
+    result = db.suppressions.bulk_write(ops, ordered=False)
+    return result.upserted_count, result.modified_count
+
+def lift_suppressions(emails: List[str], now_utc: datetime) -> int:
+    """Mark suppressions inactive; kept as documents so running filters see the change"""
+    if not emails:
+        return 0
+    return db.suppressions.update_many({"email": {"$in": emails}, "active": True},
+                                       {"$set": {"active": False, "updated_at": now_utc}}).modified_count
+
+def iter_suppressions(include_lifted: bool = False, batch_size: int = 10000) -> Iterator[dict]:
+    query = {} if include_lifted else {"active": True}
+    return db.suppressions.find(query, {"_id": 0}, batch_size=batch_size).sort("email", ASCENDING)
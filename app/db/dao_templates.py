@@ -1,6 +1,17 @@
 from app.db.client import db
+from app.db.cache import cached, cached_many
 from bson import ObjectId
-from typing import Optional
+from typing import Dict, Iterable, Optional
 
+@cached("templates")
 def get_template(template_id: str) -> Optional[dict]:
     return db.templates.find_one({"_id": ObjectId(template_id)})
+
+def get_templates_by_ids(template_ids: Iterable[str]) -> Dict[str, dict]:
+    """Fetch many templates in one round trip, keyed by str(_id)"""
+    def load(missing):
+        ids = [ObjectId(t) for t in missing if t and ObjectId.is_valid(t)]
+        if not ids:
+            return {}
+        return {str(template["_id"]): template for template in db.templates.find({"_id": {"$in": ids}})}
+    return cached_many("templates", template_ids, load)
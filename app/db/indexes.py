@@ -11,7 +11,16 @@ def ensure_indexes():
     db.campaign_leads.create_index([("campaign_id", ASCENDING)])
     db.campaign_leads.create_index([("lead_data.email", ASCENDING)])
     db.campaign_leads.create_index([("progress.stopped", ASCENDING), ("progress.next_due_at", ASCENDING)])
+    db.campaign_leads.create_index([("campaign_id", ASCENDING), ("state", ASCENDING), ("due_at", ASCENDING)])
     db.campaign_activities.create_index([("campaign_id", ASCENDING), ("created_at", DESCENDING)])
     db.campaign_activities.create_index([("lead_id", ASCENDING), ("created_at", DESCENDING)])
     db.campaign_activities.create_index([("email_id", ASCENDING), ("created_at", DESCENDING)])
+    db.campaign_activities.create_index([("created_at", ASCENDING)])
+    db.activity_rollups.create_index([("date_key", ASCENDING), ("campaign_id", ASCENDING)])
     db.account_runtime_state.create_index([("email_id", ASCENDING), ("date_key", ASCENDING)], unique=True)
+    # check-runtime-states pages through one day's rows in email_id order
+    db.account_runtime_state.create_index([("date_key", ASCENDING), ("email_id", ASCENDING)])
+    db.campaign_runtime_state.create_index([("campaign_id", ASCENDING), ("date_key", ASCENDING)], unique=True)
+    db.smtp_host_limits.create_index([("smtp_host", ASCENDING)], unique=True)
+    db.suppressions.create_index([("email", ASCENDING)], unique=True)
+    db.suppressions.create_index([("updated_at", ASCENDING)])
@@ -1,19 +1,42 @@
+import asyncio
+import uuid
 from datetime import datetime, timedelta
-from app.db.dao_runtime import atomic_reserve_account, commit_account_send, rollback_account_reservation
+from typing import Dict, List, Optional
+from app.db.dao_runtime import (atomic_reserve_account, commit_account_send, rollback_account_reservation,
+                                ensure_account_runtime_states, find_available_accounts, claim_accounts,
+                                get_claimed_accounts)
+from app.db import async_dao
+from app.domain.availability import AccountAvailabilityIndex, availability_index
+from app.domain.rate_limit import RateLimiter, rate_limiter as default_rate_limiter
 from app.config.settings import settings
 import structlog
 
 log = structlog.get_logger()
 
 class AccountArbiter:
-    def __init__(self, db):
+    def __init__(self, db, availability: Optional[AccountAvailabilityIndex] = None,
+                 rate_limiter: Optional[RateLimiter] = None):
         self.db = db
+        if availability is None and settings.ARBITER_AVAILABILITY_INDEX:
+            availability = availability_index
+        self.availability = availability
+        if rate_limiter is None and settings.RATE_LIMITS_ENABLED:
+            rate_limiter = default_rate_limiter
+        self.rate_limiter = rate_limiter
+        # email_id -> token buckets drawn for its current reservation
+        self._tokens: Dict[str, list] = {}
 
     def reserve(self, email_id: str, now_utc: datetime, daily_limit: int, min_wait_minutes: int) -> bool:
         """Reserve an account for sending if available"""
         date_key = now_utc.strftime('%Y-%m-%d')
         lock_until = now_utc + timedelta(seconds=settings.DEFAULT_RESERVATION_LOCK_SECONDS)
         
+        if self.availability and not self.availability.plausibly_free({email_id: daily_limit}, now_utc, date_key):
+            log.debug("arbiter.skipped_busy", email_id=email_id, date_key=date_key)
+            return False
+        
+        if not self._take_tokens([email_id], now_utc):
+            return False
         state = atomic_reserve_account(email_id, date_key, now_utc, daily_limit, lock_until)
         
         if state and state.get("locked_until"):
@@ -25,23 +48,207 @@ class AccountArbiter:
             # Check if lock times are close (within 1 second) to account for MongoDB precision
             time_diff = abs((returned_lock - lock_until).total_seconds())
             if time_diff <= 1.0:
+                if self.availability:
+                    self.availability.mark_locked(email_id, lock_until)
                 log.debug("arbiter.reserved", email_id=email_id, date_key=date_key)
                 return True
         
+        self._refund_tokens([email_id])
+        if self.availability:
+            # Our view said free but Mongo disagreed - reload it
+            self.availability.resync([email_id], date_key)
         log.debug("arbiter.denied", email_id=email_id, date_key=date_key, 
                  sent_count=state.get("sent_count") if state else None,
                  daily_limit=daily_limit)
         return False
 
+    def reserve_many(self, daily_limits: Dict[str, int], now_utc: datetime, count: int) -> List[str]:
+        """Reserve up to `count` accounts out of daily_limits (email_id -> daily limit)
+        
+        Candidates are tried in the dict's order. Eligible accounts are found with one
+        indexed query and claimed with a conditional update_many per distinct limit, so
+        the same locked_until/next_available_at/sent_count guards as reserve() apply.
+        Accounts whose own or SMTP host's rate limit is exhausted are passed over.
+        """
+        if count <= 0 or not daily_limits:
+            return []
+        date_key = now_utc.strftime('%Y-%m-%d')
+        lock_until = now_utc + timedelta(seconds=settings.DEFAULT_RESERVATION_LOCK_SECONDS)
+        daily_limits = self._plausibly_free(daily_limits, now_utc, date_key)
+        if not daily_limits:
+            return []
+        candidates = list(daily_limits)
+        
+        ensure_account_runtime_states(candidates, date_key, now_utc)
+        states = find_available_accounts(candidates, date_key, now_utc)
+        ordered = self._eligible(states, daily_limits, date_key)
+        
+        claimed: List[str] = []
+        while ordered and len(claimed) < count:
+            # Claim only as many as still needed; any we lose to another process are retried from the rest
+            wanted, ordered = ordered[:count - len(claimed)], ordered[count - len(claimed):]
+            wanted = self._take_tokens(wanted, now_utc)
+            if not wanted:
+                continue
+            token = uuid.uuid4().hex
+            for daily_limit, email_ids in self._by_limit(wanted, daily_limits).items():
+                claim_accounts(email_ids, date_key, now_utc, daily_limit, lock_until, token)
+            won = set(get_claimed_accounts(wanted, date_key, token))
+            claimed.extend(email_id for email_id in wanted if email_id in won)
+            self._refund_tokens([e for e in wanted if e not in won])
+            self._after_claim(wanted, won, lock_until, date_key)
+        
+        log.debug("arbiter.reserved_many", date_key=date_key, requested=count, claimed=claimed)
+        return claimed
+
+    def _plausibly_free(self, daily_limits: Dict[str, int], now_utc: datetime, date_key: str) -> Dict[str, int]:
+        if not self.availability:
+            return daily_limits
+        # Skip accounts we already know are cooling down, locked or capped
+        free = self.availability.plausibly_free(daily_limits, now_utc, date_key)
+        if not free:
+            log.debug("arbiter.all_busy", date_key=date_key)
+        return free
+
+    def _eligible(self, states: List[dict], daily_limits: Dict[str, int], date_key: str) -> List[str]:
+        """Candidates whose runtime state is free and under its limit, in candidate order"""
+        eligible = {
+            state["email_id"] for state in states
+            if state.get("sent_count", 0) < daily_limits[state["email_id"]]
+        }
+        if self.availability:
+            self.availability.load(states, date_key)
+            returned = {state["email_id"] for state in states}
+            self._resync([e for e in daily_limits if e not in returned], date_key)
+        return [email_id for email_id in daily_limits if email_id in eligible]
+
+    @staticmethod
+    def _by_limit(email_ids: List[str], daily_limits: Dict[str, int]) -> Dict[int, List[str]]:
+        by_limit: Dict[int, List[str]] = {}
+        for email_id in email_ids:
+            by_limit.setdefault(daily_limits[email_id], []).append(email_id)
+        return by_limit
+
+    def _after_claim(self, wanted: List[str], won: set, lock_until: datetime, date_key: str):
+        if not self.availability:
+            return
+        for email_id in wanted:
+            if email_id in won:
+                self.availability.mark_locked(email_id, lock_until)
+        self._resync([e for e in wanted if e not in won], date_key)
+
+    def _resync(self, email_ids: List[str], date_key: str):
+        self.availability.resync(email_ids, date_key)
+
+    def _take_tokens(self, email_ids: List[str], now_utc: datetime) -> List[str]:
+        """The accounts that got a token from each of their buckets, in order"""
+        if not self.rate_limiter:
+            return email_ids
+        buckets = self.rate_limiter.buckets_for(email_ids)
+        granted = []
+        for email_id in email_ids:
+            if self.rate_limiter.acquire(buckets[email_id], now_utc) is None:
+                self._tokens[email_id] = buckets[email_id]
+                granted.append(email_id)
+            else:
+                log.debug("arbiter.rate_limited", email_id=email_id)
+        return granted
+
+    def _refund_tokens(self, email_ids: List[str]):
+        for email_id in email_ids:
+            buckets = self._tokens.pop(email_id, None)
+            if buckets:
+                self.rate_limiter.release(buckets)
+
+    def reserve_any(self, daily_limits: Dict[str, int], now_utc: datetime) -> Optional[str]:
+        """Reserve the first available account out of daily_limits"""
+        claimed = self.reserve_many(daily_limits, now_utc, 1)
+        return claimed[0] if claimed else None
+
     def commit(self, email_id: str, now_utc: datetime, min_wait_minutes: int):
         """Commit a successful send"""
         date_key = now_utc.strftime('%Y-%m-%d')
         next_available = now_utc + timedelta(minutes=min_wait_minutes)
         commit_account_send(email_id, date_key, next_available)
+        self._committed(email_id, next_available)
+
+    def _committed(self, email_id: str, next_available: datetime):
+        self._tokens.pop(email_id, None)
+        if self.availability:
+            self.availability.mark_committed(email_id, next_available)
         log.debug("arbiter.committed", email_id=email_id, next_available=next_available)
 
-    def rollback(self, email_id: str, now_utc: datetime):
-        """Rollback a failed send"""
+    def rollback(self, email_id: str, now_utc: datetime, refund_tokens: bool = False):
+        """Rollback a failed send
+        
+        A send the provider saw still counts against its rate limits; pass
+        refund_tokens=True when nothing was handed to SMTP (dry run, render error).
+        """
         date_key = now_utc.strftime('%Y-%m-%d')
         rollback_account_reservation(email_id, date_key)
+        if refund_tokens:
+            self._refund_tokens([email_id])
+        self._rolled_back(email_id)
+
+    def _rolled_back(self, email_id: str):
+        self._tokens.pop(email_id, None)
+        if self.availability:
+            self.availability.mark_released(email_id)
         log.debug("arbiter.rolled_back", email_id=email_id)
+
+
+class AsyncAccountArbiter(AccountArbiter):
+    """AccountArbiter for the async engine: same guards and index bookkeeping, motor I/O
+
+    db is a motor database; reserve_many, commit and rollback are coroutines.
+    Rate-limit buckets go through the sync DAOs on a worker thread.
+    """
+
+    async def reserve_many(self, daily_limits: Dict[str, int], now_utc: datetime, count: int) -> List[str]:
+        if count <= 0 or not daily_limits:
+            return []
+        date_key = now_utc.strftime('%Y-%m-%d')
+        lock_until = now_utc + timedelta(seconds=settings.DEFAULT_RESERVATION_LOCK_SECONDS)
+        daily_limits = self._plausibly_free(daily_limits, now_utc, date_key)
+        if not daily_limits:
+            return []
+        candidates = list(daily_limits)
+        
+        await async_dao.ensure_account_runtime_states(self.db, candidates, date_key, now_utc)
+        states = await async_dao.find_available_accounts(self.db, candidates, date_key, now_utc)
+        ordered = self._eligible(states, daily_limits, date_key)
+        
+        claimed: List[str] = []
+        while ordered and len(claimed) < count:
+            wanted, ordered = ordered[:count - len(claimed)], ordered[count - len(claimed):]
+            if self.rate_limiter:
+                wanted = await asyncio.to_thread(self._take_tokens, wanted, now_utc)
+            if not wanted:
+                continue
+            token = uuid.uuid4().hex
+            for daily_limit, email_ids in self._by_limit(wanted, daily_limits).items():
+                await async_dao.claim_accounts(self.db, email_ids, date_key, now_utc, daily_limit, lock_until, token)
+            won = set(await async_dao.get_claimed_accounts(self.db, wanted, date_key, token))
+            claimed.extend(email_id for email_id in wanted if email_id in won)
+            lost = [e for e in wanted if e not in won]
+            if self.rate_limiter and lost:
+                await asyncio.to_thread(self._refund_tokens, lost)
+            self._after_claim(wanted, won, lock_until, date_key)
+        
+        log.debug("arbiter.reserved_many", date_key=date_key, requested=count, claimed=claimed)
+        return claimed
+
+    async def commit(self, email_id: str, now_utc: datetime, min_wait_minutes: int):
+        next_available = now_utc + timedelta(minutes=min_wait_minutes)
+        await async_dao.commit_account_send(self.db, email_id, now_utc.strftime('%Y-%m-%d'), next_available)
+        self._committed(email_id, next_available)
+
+    async def rollback(self, email_id: str, now_utc: datetime, refund_tokens: bool = False):
+        await async_dao.rollback_account_reservation(self.db, email_id, now_utc.strftime('%Y-%m-%d'))
+        if refund_tokens and self.rate_limiter:
+            await asyncio.to_thread(self._refund_tokens, [email_id])
+        self._rolled_back(email_id)
+
+    def _resync(self, email_ids: List[str], date_key: str):
+        # A blocking reload would stall the event loop; drop the entries and let Mongo decide next time
+        self.availability.forget(email_ids)
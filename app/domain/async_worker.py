@@ -0,0 +1,215 @@
+import asyncio
+import threading
+import time
+import structlog
+from datetime import datetime, timezone
+from typing import List, Optional
+from app.db import async_dao
+from app.db.dao_leads import new_claim_id, LeadUpdateBatch
+from app.db.dao_sequences import get_campaign_sequence
+from app.db.dao_campaigns import get_campaign_options
+from app.domain import metrics
+from app.domain.arbiter import AsyncAccountArbiter
+from app.domain.campaign_context import CampaignContext
+from app.domain.transport import AsyncSmtpConnectionPool, AsyncSmtpSender
+from app.domain.suppression import suppression_filter
+from app.domain.worker import (_account_rr_cache, _prepare_job, _daily_limits, _reservations, _render_job,
+                               _record_sent, _error_activity, _skip_if_suppressed)
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+async def run_once_async(campaign_id: str, batch_size: int, dry_run: bool = False, deadline: float = None,
+                         concurrency: int = None, db=None, pool: AsyncSmtpConnectionPool = None):
+    """worker.run_once on motor + aiosmtplib
+    
+    Same batch semantics: leads are leased, jobs prepared and rendered by the
+    sync worker's helpers, accounts reserved/committed/rolled back under the same
+    guards, and progress, activities, the campaign counter and lease release are
+    written once at the end of the batch. Up to `concurrency` sends are in flight
+    at once. The read-mostly campaign lookups go through the cached sync DAOs on
+    a thread.
+    """
+    db = db if db is not None else async_dao.get_async_db()
+    own_pool = pool is None
+    pool = pool or AsyncSmtpConnectionPool()
+    now_utc = datetime.now(timezone.utc)
+    
+    sequence = await asyncio.to_thread(get_campaign_sequence, campaign_id)
+    if not sequence:
+        log.error("worker.no_sequence", campaign_id=campaign_id)
+        return
+    options = await asyncio.to_thread(get_campaign_options, campaign_id)
+    if not options:
+        log.error("worker.no_options", campaign_id=campaign_id)
+        return
+    email_accounts = options.get("email_accounts", [])
+    if not email_accounts:
+        log.error("worker.no_accounts", campaign_id=campaign_id)
+        return
+    
+    claim_id = new_claim_id() if settings.LEAD_LEASES_ENABLED else None
+    with metrics.timer("due_leads"):
+        if claim_id:
+            leads = await async_dao.claim_due_leads(db, campaign_id, now_utc, batch_size, claim_id)
+        else:
+            leads = await async_dao.get_due_leads(db, campaign_id, now_utc, batch_size)
+    if not leads:
+        log.info("worker.no_due_leads", campaign_id=campaign_id)
+        return
+    
+    with metrics.timer("load_context"):
+        context = await asyncio.to_thread(CampaignContext.load, campaign_id, sequence, email_accounts)
+        if settings.SUPPRESSION_ENABLED:
+            await asyncio.to_thread(suppression_filter.refresh)
+    rr = _account_rr_cache.setdefault(campaign_id, list(email_accounts))
+    arbiter = AsyncAccountArbiter(db)
+    concurrency = max(1, concurrency or settings.ASYNC_WORKER_CONCURRENCY)
+    
+    lead_updates = LeadUpdateBatch()
+    activities: List[dict] = []
+    processed = 0
+    pending = iter(leads)
+    exhausted = False
+    
+    try:
+        while not exhausted:
+            if deadline is not None and time.monotonic() >= deadline:
+                log.info("worker.time_budget_exhausted", campaign_id=campaign_id, processed=processed)
+                break
+            
+            jobs = []
+            while len(jobs) < concurrency:
+                lead = next(pending, None)
+                if lead is None:
+                    exhausted = True
+                    break
+                job = _prepare_job(context, lead, lead_updates)
+                if job and not _skip_if_suppressed(context, job, now_utc, lead_updates):
+                    jobs.append(job)
+            if not jobs:
+                break
+            
+            with metrics.timer("reserve"):
+                claimed = await arbiter.reserve_many(_daily_limits(rr, context), now_utc, len(jobs))
+            reservations = _reservations(rr, context, claimed)
+            if len(reservations) < len(jobs):
+                log.info("worker.no_account_available", campaign_id=campaign_id, lead_id=jobs[len(reservations)]["lead_id"])
+                metrics.inc("emailbot_no_account_available_total", campaign_id=campaign_id)
+                exhausted = True
+            
+            results = await asyncio.gather(*(
+                _process_job_async(context, arbiter, pool, job, reservation, now_utc, dry_run, lead_updates, activities)
+                for job, reservation in zip(jobs, reservations)
+            ))
+            processed += sum(1 for ok in results if ok)
+    finally:
+        # Each step runs even if an earlier one raised: activities only live in this
+        # batch's list, and the sends they record have already gone out
+        try:
+            with metrics.timer("progress_write"):
+                await async_dao.write_lead_updates(db, lead_updates)
+        finally:
+            try:
+                with metrics.timer("activity_write"):
+                    await async_dao.insert_activities(db, activities)
+            finally:
+                try:
+                    if not dry_run:
+                        await async_dao.increment_campaign_sent(db, campaign_id, now_utc.strftime('%Y-%m-%d'), processed)
+                finally:
+                    try:
+                        if claim_id:
+                            with metrics.timer("release_leads"):
+                                await async_dao.release_lead_claims(db, [lead["_id"] for lead in leads], claim_id)
+                    finally:
+                        if own_pool:
+                            await pool.close_all()
+                        else:
+                            await pool.prune()
+    
+    log.info("worker.batch_complete", campaign_id=campaign_id, processed=processed,
+             total_leads=len(leads), dry_run=dry_run, engine="async")
+
+async def _process_job_async(context: CampaignContext, arbiter: AsyncAccountArbiter, pool: AsyncSmtpConnectionPool,
+                             job: dict, reservation: dict, now_utc: datetime, dry_run: bool,
+                             lead_updates: LeadUpdateBatch, activities: List[dict]) -> bool:
+    campaign_id = context.campaign_id
+    lead_id = job["lead_id"]
+    selected_email_id = reservation["email_id"]
+    selected_account = reservation["account"]
+    
+    with metrics.timer("render"):
+        rendered = _render_job(context, job, reservation)
+    if rendered is None:
+        await arbiter.rollback(selected_email_id, now_utc, refund_tokens=True)
+        return False
+    to_email, subject, html = rendered
+    
+    if dry_run:
+        log.info("worker.dry_run_send", campaign_id=campaign_id, lead_id=lead_id,
+                email_id=selected_email_id, to_email=to_email, subject=subject)
+        await arbiter.rollback(selected_email_id, now_utc, refund_tokens=True)
+        return True
+    
+    try:
+        sender = AsyncSmtpSender(
+            host=selected_account["smtp_host"],
+            port=int(selected_account["smtp_port"]),
+            username=selected_account["smtp_username"],
+            password=selected_account.get("smtp_passcode") or selected_account.get("smtp_password"),
+            starttls=settings.SMTP_STARTTLS,
+            pool=pool
+        )
+        with metrics.timer("smtp"):
+            await sender.send(selected_account, to_email, subject, html)
+        with metrics.timer("commit"):
+            await arbiter.commit(selected_email_id, now_utc, reservation["min_wait"])
+            activities.append(_record_sent(context, job, reservation, to_email, now_utc, lead_updates))
+        metrics.inc("emailbot_emails_sent_total", campaign_id=campaign_id)
+        log.info("worker.sent", campaign_id=campaign_id, lead_id=lead_id,
+                email_id=selected_email_id, step_order=job["step_order"],
+                to_email=to_email, subject=subject)
+        return True
+    except Exception as e:
+        await arbiter.rollback(selected_email_id, now_utc)
+        activities.append(_error_activity(context, job, reservation, now_utc, e))
+        metrics.inc("emailbot_send_errors_total", campaign_id=campaign_id)
+        log.error("worker.send_error", campaign_id=campaign_id, lead_id=lead_id,
+                 email_id=selected_email_id, error=str(e))
+        return False
+
+class AsyncEngine:
+    """Event loop on a background thread that runs async batches for sync callers
+    
+    The dispatcher and CLI stay synchronous; batches submitted from several
+    dispatcher threads run concurrently on the one loop, which also keeps the
+    motor client and pooled SMTP sessions alive between batches.
+    """
+    
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+        self.pool: Optional[AsyncSmtpConnectionPool] = None
+    
+    def _ensure_started(self) -> asyncio.AbstractEventLoop:
+        with self._lock:
+            if self._loop is None:
+                self.pool = AsyncSmtpConnectionPool()
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="async-engine", daemon=True).start()
+            return self._loop
+    
+    def run_once(self, campaign_id: str, batch_size: int, dry_run: bool = False, since: datetime = None,
+                 deadline: float = None, concurrency: int = None):
+        loop = self._ensure_started()
+        future = asyncio.run_coroutine_threadsafe(
+            run_once_async(campaign_id, batch_size, dry_run, deadline, concurrency, pool=self.pool), loop)
+        return future.result()
+
+async_engine = AsyncEngine()
+
+def run_once(campaign_id: str, batch_size: int, dry_run: bool = False, since: datetime = None,
+             deadline: float = None, concurrency: int = None):
+    """Drop-in for worker.run_once that runs the batch on the async engine"""
+    return async_engine.run_once(campaign_id, batch_size, dry_run, since, deadline, concurrency)
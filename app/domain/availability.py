@@ -0,0 +1,159 @@
+import heapq
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.db.dao_runtime import get_account_runtime_states
+from app.config.settings import settings
+
+
+def _aware(dt: Optional[datetime]) -> Optional[datetime]:
+    if dt is not None and dt.tzinfo is None:
+        return dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+class AccountAvailabilityIndex:
+    """Process-local view of when each account can send next.
+
+    Only used to skip accounts that are certainly busy (cooling down, locked by
+    this process, or at their daily limit) without a round trip. Mongo stays the
+    source of truth: claims still go through the arbiter's conditional updates,
+    and entries are reloaded when a claim disagrees or they are older than
+    ARBITER_INDEX_RESYNC_SECONDS.
+    """
+
+    def __init__(self, resync_seconds: int = None):
+        self.resync_seconds = resync_seconds if resync_seconds is not None else settings.ARBITER_INDEX_RESYNC_SECONDS
+        self._lock = threading.Lock()
+        self._date_key: Optional[str] = None
+        # email_id -> {"next_available_at", "sent_count", "locked_until", "loaded_at"}
+        self._entries: Dict[str, dict] = {}
+        # Lazily-pruned (next_available_at, email_id) heap for earliest-availability queries
+        self._heap: List[Tuple[datetime, str]] = []
+        self.stats = {"skipped": 0, "passed": 0, "resyncs": 0}
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._heap.clear()
+            self._date_key = None
+
+    def _roll_day(self, date_key: str):
+        if self._date_key != date_key:
+            self._entries.clear()
+            self._heap.clear()
+            self._date_key = date_key
+
+    def _store(self, email_id: str, next_available_at: Optional[datetime], sent_count: int,
+               locked_until: Optional[datetime] = None):
+        next_available_at = _aware(next_available_at)
+        self._entries[email_id] = {
+            "next_available_at": next_available_at,
+            "sent_count": sent_count,
+            "locked_until": _aware(locked_until),
+            "loaded_at": time.monotonic(),
+        }
+        if next_available_at is not None:
+            heapq.heappush(self._heap, (next_available_at, email_id))
+            if len(self._heap) > 2 * len(self._entries) + 64:
+                self._rebuild_heap()
+
+    def _rebuild_heap(self):
+        """Drop superseded entries once they outnumber the live ones"""
+        self._heap = [(entry["next_available_at"], email_id) for email_id, entry in self._entries.items()
+                      if entry["next_available_at"] is not None]
+        heapq.heapify(self._heap)
+
+    def load(self, states: Iterable[dict], date_key: str):
+        """Refresh entries from account_runtime_state documents"""
+        with self._lock:
+            self._roll_day(date_key)
+            for state in states:
+                self._store(state["email_id"], state.get("next_available_at"),
+                            state.get("sent_count", 0), state.get("locked_until"))
+
+    def resync(self, email_ids: List[str], date_key: str):
+        if not email_ids:
+            return
+        states = get_account_runtime_states(email_ids, date_key)
+        with self._lock:
+            self._roll_day(date_key)
+            for email_id in email_ids:
+                self._entries.pop(email_id, None)
+            self._rebuild_heap()
+            self.stats["resyncs"] += 1
+        self.load(states, date_key)
+
+    def forget(self, email_ids: List[str]):
+        """Drop entries so the next check asks Mongo again"""
+        with self._lock:
+            for email_id in email_ids:
+                self._entries.pop(email_id, None)
+
+    def plausibly_free(self, daily_limits: Dict[str, int], now_utc: datetime, date_key: str) -> Dict[str, int]:
+        """Candidates worth asking Mongo about, in the same order"""
+        free = {}
+        now_mono = time.monotonic()
+        with self._lock:
+            self._roll_day(date_key)
+            for email_id, daily_limit in daily_limits.items():
+                entry = self._entries.get(email_id)
+                if entry is None or now_mono - entry["loaded_at"] > self.resync_seconds:
+                    free[email_id] = daily_limit
+                    continue
+                busy = (
+                    entry["sent_count"] >= daily_limit
+                    or (entry["next_available_at"] is not None and entry["next_available_at"] > now_utc)
+                    or (entry["locked_until"] is not None and entry["locked_until"] > now_utc)
+                )
+                if busy:
+                    self.stats["skipped"] += 1
+                else:
+                    free[email_id] = daily_limit
+            self.stats["passed"] += len(free)
+        return free
+
+    def mark_locked(self, email_id: str, lock_until: datetime):
+        with self._lock:
+            entry = self._entries.get(email_id)
+            if entry is not None:
+                entry["locked_until"] = _aware(lock_until)
+
+    def mark_committed(self, email_id: str, next_available: datetime):
+        with self._lock:
+            entry = self._entries.get(email_id)
+            if entry is None:
+                return
+            self._store(email_id, next_available, entry["sent_count"] + 1)
+
+    def mark_released(self, email_id: str):
+        with self._lock:
+            entry = self._entries.get(email_id)
+            if entry is not None:
+                entry["locked_until"] = None
+
+    def earliest_available(self, email_ids: Iterable[str] = None) -> Optional[datetime]:
+        """Soonest next_available_at among tracked accounts (optionally a subset)"""
+        wanted = set(email_ids) if email_ids is not None else None
+        with self._lock:
+            skipped = []
+            found = None
+            while self._heap:
+                when, email_id = self._heap[0]
+                entry = self._entries.get(email_id)
+                if entry is None or entry["next_available_at"] != when:
+                    # Superseded by a newer next_available_at for the same account
+                    heapq.heappop(self._heap)
+                    continue
+                if wanted is None or email_id in wanted:
+                    found = when
+                    break
+                skipped.append(heapq.heappop(self._heap))
+            # Live entries outside the subset go back in
+            for item in skipped:
+                heapq.heappush(self._heap, item)
+        return found
+
+
+availability_index = AccountAvailabilityIndex()
@@ -0,0 +1,60 @@
+from typing import Dict, List, Optional
+from app.db.dao_sequences import get_sequence_steps_by_ids
+from app.db.dao_templates import get_templates_by_ids
+from app.db.dao_accounts import (
+    get_email_accounts_by_ids,
+    get_email_campaign_settings_many,
+    get_email_general_settings_many,
+)
+
+
+class CampaignContext:
+    """Steps, templates, accounts and account settings for one worker batch.
+
+    Loaded up front with one $in query per collection so a batch costs the same
+    number of round trips regardless of how many leads or accounts it touches.
+    """
+
+    def __init__(self, campaign_id: str, steps: List[dict], step_docs: Dict[str, dict],
+                 templates: Dict[str, dict], accounts: Dict[str, dict],
+                 campaign_settings: Dict[str, dict], general_settings: Dict[str, dict]):
+        self.campaign_id = campaign_id
+        self.steps = steps
+        self.step_docs = step_docs
+        self.templates = templates
+        self.accounts = accounts
+        self.campaign_settings = campaign_settings
+        self.general_settings = general_settings
+
+    @classmethod
+    def load(cls, campaign_id: str, sequence: dict, email_accounts: List[str]) -> "CampaignContext":
+        steps = sequence.get("steps", [])
+        step_docs = get_sequence_steps_by_ids(str(s["id"]) for s in steps if s.get("id"))
+        templates = get_templates_by_ids(str(s["active_template"]) for s in step_docs.values() if s.get("active_template"))
+        return cls(
+            campaign_id=campaign_id,
+            steps=steps,
+            step_docs=step_docs,
+            templates=templates,
+            accounts=get_email_accounts_by_ids(email_accounts),
+            campaign_settings=get_email_campaign_settings_many(email_accounts),
+            general_settings=get_email_general_settings_many(email_accounts),
+        )
+
+    def step_info(self, order: int) -> Optional[dict]:
+        return next((s for s in self.steps if s.get("order") == order), None)
+
+    def step(self, step_id: Optional[str]) -> Optional[dict]:
+        return self.step_docs.get(str(step_id)) if step_id else None
+
+    def template(self, template_id: Optional[str]) -> Optional[dict]:
+        return self.templates.get(str(template_id)) if template_id else None
+
+    def account(self, email_id: str) -> Optional[dict]:
+        return self.accounts.get(str(email_id))
+
+    def email_campaign_settings(self, email_id: str) -> Optional[dict]:
+        return self.campaign_settings.get(email_id)
+
+    def email_general_settings(self, email_id: str) -> Optional[dict]:
+        return self.general_settings.get(email_id)
@@ -1,82 +1,151 @@
 import structlog
-from datetime import datetime, timezone
-from app.db.dao_campaigns import get_campaign_queue, get_campaign_by_id, get_campaign_options, get_campaign_schedule, get_campaign_daily_sent_count
-from app.domain.scheduling import in_window
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, List, Optional, Tuple
+from app.db.dao_campaigns import get_campaign_queue, get_campaign_by_id, get_campaign_options, get_campaign_schedule
+from app.db.dao_runtime import get_campaign_sent_count
+from app.domain import metrics
+from app.domain.scheduling import compile_schedule
 from app.domain.worker import run_once as worker_run_once
+from app.domain.transport import smtp_pool
+from app.db.cache import dao_cache
 from app.config.settings import settings
 
 log = structlog.get_logger()
 
-def run_once(batch_size: int = None, verbose: bool = False):
-    """Run dispatcher once - check all campaigns in queue and dispatch workers"""
+# campaign_id -> when to look at it again because its send window is closed until then
+_window_opens: Dict[str, datetime] = {}
+
+def _plan_campaign(campaign_entry: dict, now_utc: datetime, batch_size: int, verbose: bool) -> Optional[Tuple[str, int]]:
+    """Return (campaign_id, batch size) if the campaign should run this tick"""
+    campaign_id = str(campaign_entry["campaign_id"])
+    
+    # Outside its send window: skip without touching Mongo until it opens
+    opens_at = _window_opens.get(campaign_id)
+    if opens_at is not None:
+        if now_utc < opens_at:
+            return None
+        del _window_opens[campaign_id]
+    
+    # Check if campaign exists and is active
+    campaign = get_campaign_by_id(campaign_id)
+    if not campaign:
+        log.warning("dispatcher.campaign_not_found", campaign_id=campaign_id)
+        return None
+        
+    if campaign.get("status") != "active":
+        if verbose:
+            log.info("dispatcher.campaign_not_active", campaign_id=campaign_id, status=campaign.get("status"))
+        return None
+    
+    # Check schedule window
+    schedule = get_campaign_schedule(campaign_id)
+    if not schedule:
+        log.warning("dispatcher.no_schedule", campaign_id=campaign_id)
+        return None
+        
+    compiled = compile_schedule(schedule)
+    if not compiled.is_open(now_utc):
+        next_open = compiled.next_open_at(now_utc)
+        # Capped so schedule edits are picked up within DISPATCHER_SCHEDULE_RECHECK_SECONDS
+        recheck_at = now_utc + timedelta(seconds=settings.DISPATCHER_SCHEDULE_RECHECK_SECONDS)
+        _window_opens[campaign_id] = min(next_open, recheck_at) if next_open else recheck_at
+        if verbose:
+            log.info("dispatcher.skip_schedule", campaign_id=campaign_id, 
+                    timezone=schedule.get("timezone"), 
+                    scheduled_days=schedule.get("scheduled_days"),
+                    next_open_at=next_open.isoformat() if next_open else None)
+        return None
+    
+    # Check campaign daily limits
+    options = get_campaign_options(campaign_id)
+    if not options:
+        log.error("dispatcher.no_options", campaign_id=campaign_id)
+        return None
+        
+    daily_limit = int(options.get("daily_email_limit", 0))
+    if daily_limit <= 0:
+        if verbose:
+            log.info("dispatcher.no_daily_limit", campaign_id=campaign_id)
+        return None
+        
+    # O(1) counter maintained by the worker (seeded from activities once a day)
+    sent_today = get_campaign_sent_count(campaign_id, now_utc.strftime('%Y-%m-%d'))
+    
+    if sent_today >= daily_limit:
+        if verbose:
+            log.info("dispatcher.daily_limit_reached", campaign_id=campaign_id, 
+                    sent_today=sent_today, daily_limit=daily_limit)
+        return None
+    
+    # Calculate remaining budget for this batch
+    remaining_budget = daily_limit - sent_today
+    effective_batch_size = min(batch_size, remaining_budget)
+    
+    if verbose:
+        log.info("dispatcher.dispatching_worker", campaign_id=campaign_id, 
+                batch_size=effective_batch_size, sent_today=sent_today, 
+                daily_limit=daily_limit)
+    return campaign_id, effective_batch_size
+
+def _dispatch(campaign_id: str, batch_size: int, budget_seconds: Optional[int]):
+    """Run one campaign's worker, keeping its failures away from other campaigns"""
+    deadline = time.monotonic() + budget_seconds if budget_seconds else None
+    run = worker_run_once
+    if settings.WORKER_ENGINE == "async":
+        from app.domain.async_worker import run_once as run
+    try:
+        run(campaign_id, batch_size, dry_run=False, deadline=deadline)
+    except Exception as e:
+        log.error("dispatcher.worker_error", campaign_id=campaign_id, error=str(e))
+
+def run_once(batch_size: int = None, verbose: bool = False, concurrency: int = None,
+             owns: Callable[[str], bool] = None):
+    """Run dispatcher once - check all campaigns in queue and dispatch workers
+    
+    With concurrency > 1 campaigns are dispatched on a thread pool so one slow
+    SMTP server can't hold up the rest of the tick. Account safety still comes
+    from the arbiter's atomic reservations. `owns` restricts the tick to one
+    process's shard of the queue (see app.domain.pool).
+    """
     now_utc = datetime.now(timezone.utc)
-    batch_size = batch_size or settings.DEFAULT_WORKER_BATCH_SIZE
     queue = get_campaign_queue()
+    if owns is not None:
+        queue = [entry for entry in queue if owns(str(entry["campaign_id"]))]
     
     if not queue:
         if verbose:
             log.info("dispatcher.no_campaigns_in_queue")
         return
     
-    for campaign_entry in queue:
-        campaign_id = str(campaign_entry["campaign_id"])
-        
-        # Check if campaign exists and is active
-        campaign = get_campaign_by_id(campaign_id)
-        if not campaign:
-            log.warning("dispatcher.campaign_not_found", campaign_id=campaign_id)
-            continue
-            
-        if campaign.get("status") != "active":
-            if verbose:
-                log.info("dispatcher.campaign_not_active", campaign_id=campaign_id, status=campaign.get("status"))
-            continue
-        
-        # Check schedule window
-        schedule = get_campaign_schedule(campaign_id)
-        if not schedule:
-            log.warning("dispatcher.no_schedule", campaign_id=campaign_id)
-            continue
-            
-        if not in_window(now_utc, schedule):
-            if verbose:
-                log.info("dispatcher.skip_schedule", campaign_id=campaign_id, 
-                        timezone=schedule.get("timezone"), 
-                        scheduled_days=schedule.get("scheduled_days"))
-            continue
-        
-        # Check campaign daily limits
-        options = get_campaign_options(campaign_id)
-        if not options:
-            log.error("dispatcher.no_options", campaign_id=campaign_id)
-            continue
-            
-        daily_limit = int(options.get("daily_email_limit", 0))
-        if daily_limit <= 0:
-            if verbose:
-                log.info("dispatcher.no_daily_limit", campaign_id=campaign_id)
-            continue
-            
-        day_start_utc = now_utc.replace(hour=0, minute=0, second=0, microsecond=0)
-        sent_today = get_campaign_daily_sent_count(campaign_id, day_start_utc)
-        
-        if sent_today >= daily_limit:
-            if verbose:
-                log.info("dispatcher.daily_limit_reached", campaign_id=campaign_id, 
-                        sent_today=sent_today, daily_limit=daily_limit)
-            continue
-        
-        # Calculate remaining budget for this batch
-        remaining_budget = daily_limit - sent_today
-        effective_batch_size = min(batch_size, remaining_budget)
-        
-        if verbose:
-            log.info("dispatcher.dispatching_worker", campaign_id=campaign_id, 
-                    batch_size=effective_batch_size, sent_today=sent_today, 
-                    daily_limit=daily_limit)
-        
-        # Dispatch worker for this campaign
-        try:
-            worker_run_once(campaign_id, effective_batch_size, dry_run=False)
-        except Exception as e:
-            log.error("dispatcher.worker_error", campaign_id=campaign_id, error=str(e))
+    dispatch_campaigns(queue, now_utc, batch_size, verbose, concurrency)
+
+def dispatch_campaigns(queue: List[dict], now_utc: datetime, batch_size: int = None, verbose: bool = False,
+                       concurrency: int = None):
+    """Plan and run workers for the given campaign_queue entries"""
+    batch_size = batch_size or settings.DEFAULT_WORKER_BATCH_SIZE
+    concurrency = concurrency or settings.DISPATCHER_CONCURRENCY
+    budget_seconds = settings.DISPATCHER_CAMPAIGN_BUDGET_SECONDS
+    
+    if concurrency <= 1:
+        for campaign_entry in queue:
+            with metrics.timer("plan"):
+                planned = _plan_campaign(campaign_entry, now_utc, batch_size, verbose)
+            if planned:
+                _dispatch(*planned, budget_seconds)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="dispatch") as executor:
+            for campaign_entry in queue:
+                with metrics.timer("plan"):
+                    planned = _plan_campaign(campaign_entry, now_utc, batch_size, verbose)
+                if planned:
+                    executor.submit(_dispatch, *planned, budget_seconds)
+    
+    # Close SMTP sessions that went idle during this tick
+    smtp_pool.prune()
+    
+    if verbose:
+        cache_stats = dao_cache.stats()
+        log.info("dispatcher.cache_stats", size=cache_stats["size"], hits=cache_stats["hits"],
+                misses=cache_stats["misses"], hit_rate=round(cache_stats["hit_rate"], 3))
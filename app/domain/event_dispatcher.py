@@ -0,0 +1,273 @@
+import heapq
+import threading
+import time
+import structlog
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from pymongo.errors import PyMongoError
+from app.db.dao_accounts import get_email_campaign_settings_many
+from app.db.dao_campaigns import get_campaign_queue, get_campaign_by_id, get_campaign_options, get_campaign_schedule
+from app.db.dao_leads import get_next_due_at
+from app.db.dao_runtime import get_campaign_sent_count, get_next_account_available_at
+from app.domain.dispatcher import dispatch_campaigns
+from app.domain.scheduling import compile_schedule
+from app.domain.transport import smtp_pool
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+# Collections whose changes can make a campaign sendable sooner than planned
+WATCHED_COLLECTIONS = ["campaign_leads", "campaign_queue", "campaigns", "campaign_schedule", "campaign_options"]
+
+
+def _aware(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _next_midnight(now_utc: datetime) -> datetime:
+    return (now_utc + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_wake_at(campaign_id: str, now_utc: datetime) -> Optional[datetime]:
+    """Earliest moment the campaign could have something to send (None: nothing in sight)
+
+    Every input is a "not before" bound - the window has to be open, the daily
+    budget not spent, a lead due and one of the accounts free - so the latest
+    of them is a safe time to look again.
+    """
+    campaign = get_campaign_by_id(campaign_id)
+    if not campaign or campaign.get("status") != "active":
+        return None
+    schedule = get_campaign_schedule(campaign_id)
+    if not schedule:
+        return None
+    wake = compile_schedule(schedule).next_open_at(now_utc)
+    if wake is None:
+        return None
+
+    options = get_campaign_options(campaign_id)
+    if not options:
+        return None
+    daily_limit = int(options.get("daily_email_limit", 0))
+    if daily_limit <= 0:
+        return None
+    if get_campaign_sent_count(campaign_id, wake.strftime('%Y-%m-%d')) >= daily_limit:
+        wake = _next_midnight(wake)
+
+    due_at = get_next_due_at(campaign_id, now_utc)
+    if due_at is None:
+        return None
+    wake = max(wake, _aware(due_at))
+
+    email_accounts = options.get("email_accounts", [])
+    account_settings = get_email_campaign_settings_many(email_accounts)
+    daily_limits = {email_id: int(account_settings[email_id].get("daily_limit", 0))
+                    for email_id in email_accounts if email_id in account_settings}
+    if not daily_limits:
+        return None
+    account_at = get_next_account_available_at(daily_limits, wake.strftime('%Y-%m-%d'), wake)
+    # Every account is at its daily limit: counts reset at midnight
+    return account_at if account_at is not None else _next_midnight(wake)
+
+
+class WakeQueue:
+    """Per-campaign wake-up times; rescheduling leaves the old heap entry to be skipped lazily"""
+
+    def __init__(self):
+        self._heap: List[Tuple[datetime, str]] = []
+        self._wake: Dict[str, datetime] = {}
+
+    def __len__(self) -> int:
+        return len(self._wake)
+
+    def __contains__(self, campaign_id: str) -> bool:
+        return campaign_id in self._wake
+
+    def schedule(self, campaign_id: str, when: datetime):
+        self._wake[campaign_id] = when
+        heapq.heappush(self._heap, (when, campaign_id))
+
+    def campaign_ids(self) -> List[str]:
+        return list(self._wake)
+
+    def discard(self, campaign_id: str):
+        self._wake.pop(campaign_id, None)
+
+    def wake_time(self, campaign_id: str) -> Optional[datetime]:
+        return self._wake.get(campaign_id)
+
+    def _prune(self):
+        while self._heap and self._wake.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def next_wake(self) -> Optional[datetime]:
+        self._prune()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now_utc: datetime) -> List[str]:
+        due = []
+        self._prune()
+        while self._heap and self._heap[0][0] <= now_utc:
+            when, campaign_id = heapq.heappop(self._heap)
+            if self._wake.get(campaign_id) == when:
+                del self._wake[campaign_id]
+                due.append(campaign_id)
+            self._prune()
+        return due
+
+
+class EventDrivenDispatcher:
+    """Dispatcher that sleeps until the earliest campaign wake-up instead of ticking
+
+    Wake-ups come from next_wake_at(). Campaigns with nothing in sight are
+    re-checked after max_sleep_seconds, which is also how often the campaign
+    queue is re-read. With a replica set, a change stream on leads and campaign
+    documents marks campaigns for re-planning so new or re-scheduled leads
+    don't wait for that.
+    """
+
+    def __init__(self, db, batch_size: int = None, verbose: bool = False, concurrency: int = None,
+                 max_sleep_seconds: float = None, min_sleep_seconds: float = None,
+                 owns: Callable[[str], bool] = None):
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.concurrency = concurrency
+        self.max_sleep_seconds = max_sleep_seconds or settings.DISPATCHER_MAX_SLEEP_SECONDS
+        self.min_sleep_seconds = min_sleep_seconds if min_sleep_seconds is not None else settings.DISPATCHER_MIN_SLEEP_SECONDS
+        self.db = db
+        self.owns = owns
+        self.queue = WakeQueue()
+        self._entries: Dict[str, dict] = {}
+        self._dirty: Set[str] = set()
+        self._reload = True
+        self._last_reload = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self.stats = {"passes": 0, "dispatched": 0, "wakeups": 0}
+
+    def notify(self, campaign_id: str = None):
+        """Re-plan one campaign (or re-read the whole queue) on the next pass, now"""
+        with self._lock:
+            if campaign_id is None:
+                self._reload = True
+            else:
+                self._dirty.add(campaign_id)
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _plan(self, campaign_ids, now_utc: datetime, not_before: datetime = None):
+        fallback = now_utc + timedelta(seconds=self.max_sleep_seconds)
+        for campaign_id in campaign_ids:
+            try:
+                when = next_wake_at(campaign_id, now_utc) or fallback
+            except PyMongoError as e:
+                log.warning("dispatcher.plan_error", campaign_id=campaign_id, error=str(e))
+                when = fallback
+            self.queue.schedule(campaign_id, max(when, not_before or now_utc))
+
+    def run_pass(self, now_utc: datetime = None) -> float:
+        """Dispatch campaigns whose wake-up has come; returns seconds until the next one"""
+        now_utc = now_utc or datetime.now(timezone.utc)
+        started = time.monotonic()
+        with self._lock:
+            # notify() without a campaign means campaign documents changed: re-plan everything
+            replan_all = self._reload
+            reload = replan_all or time.monotonic() - self._last_reload >= self.max_sleep_seconds
+            dirty, self._dirty, self._reload = self._dirty, set(), False
+
+        if reload:
+            self._entries = {str(entry["campaign_id"]): entry for entry in get_campaign_queue()
+                             if self.owns is None or self.owns(str(entry["campaign_id"]))}
+            self._last_reload = time.monotonic()
+            dirty.update(c for c in self._entries if replan_all or c not in self.queue)
+            for campaign_id in self.queue.campaign_ids():
+                if campaign_id not in self._entries:
+                    self.queue.discard(campaign_id)
+        self._plan([c for c in dirty if c in self._entries], now_utc)
+
+        # A wake-up is only a lower bound; confirm before running a worker
+        due = []
+        for campaign_id in self.queue.pop_due(now_utc):
+            if campaign_id not in self._entries:
+                continue
+            when = next_wake_at(campaign_id, now_utc)
+            if when is not None and when <= now_utc:
+                due.append(campaign_id)
+            else:
+                self._plan([campaign_id], now_utc)
+
+        if due:
+            if self.verbose:
+                log.info("dispatcher.wake", campaigns=due)
+            dispatch_campaigns([self._entries[c] for c in due], now_utc, self.batch_size, self.verbose, self.concurrency)
+            smtp_pool.prune()
+            after = now_utc + timedelta(seconds=time.monotonic() - started)
+            # min_sleep keeps a campaign that can't make progress from spinning
+            self._plan(due, after, not_before=after + timedelta(seconds=self.min_sleep_seconds))
+            self.stats["dispatched"] += len(due)
+        self.stats["passes"] += 1
+
+        next_wake = self.queue.next_wake()
+        if next_wake is None:
+            return self.max_sleep_seconds
+        seconds = (next_wake - now_utc).total_seconds() - (time.monotonic() - started)
+        return max(0.0, min(seconds, self.max_sleep_seconds))
+
+    def start_watching(self):
+        if settings.DISPATCHER_WAKE_ON_CHANGES:
+            threading.Thread(target=self._watch, name="dispatcher-wake", daemon=True).start()
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep until the next wake-up is due; True if notify()/stop() cut it short"""
+        if self._wake.wait(seconds):
+            self._wake.clear()
+            self.stats["wakeups"] += 1
+            return True
+        return False
+
+    def run_forever(self):
+        self.start_watching()
+        while not self._stop.is_set():
+            try:
+                sleep_seconds = self.run_pass()
+            except Exception as e:
+                log.error("dispatcher.pass_error", error=str(e))
+                sleep_seconds = settings.DISPATCHER_TICK_SECONDS
+            if self.verbose:
+                log.info("dispatcher.sleeping", seconds=round(sleep_seconds, 3), campaigns=len(self.queue))
+            self.wait(sleep_seconds)
+
+    def _watch(self):
+        pipeline = [{"$match": {
+            "ns.coll": {"$in": WATCHED_COLLECTIONS},
+            "$or": [
+                {"ns.coll": {"$ne": "campaign_leads"}},
+                {"operationType": {"$in": ["insert", "replace"]}},
+                # Lead updates only matter when they move the lead in the due queue or drop a lease
+                {"updateDescription.updatedFields.due_at": {"$exists": True}},
+                {"updateDescription.updatedFields.state": {"$exists": True}},
+                {"updateDescription.removedFields": "claimed_by"},
+            ]
+        }}]
+        try:
+            with self.db.watch(pipeline, full_document="updateLookup", max_await_time_ms=1000) as stream:
+                log.info("dispatcher.change_stream_started")
+                while not self._stop.is_set():
+                    change = stream.try_next()
+                    if change is not None:
+                        self._apply_change(change)
+        except PyMongoError as e:
+            # Change streams need a replica set; wake-ups then rely on max_sleep_seconds
+            log.warning("dispatcher.change_stream_unavailable", error=str(e))
+
+    def _apply_change(self, change: dict):
+        if change["ns"]["coll"] == "campaign_leads":
+            campaign_id = (change.get("fullDocument") or {}).get("campaign_id")
+            if campaign_id is not None:
+                self.notify(str(campaign_id))
+            return
+        self.notify()
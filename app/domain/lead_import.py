@@ -0,0 +1,135 @@
+import csv
+import gzip
+import json
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+import structlog
+from app.db.dao_leads import existing_lead_emails, insert_leads, new_lead
+
+log = structlog.get_logger()
+
+FORMATS = ("csv", "jsonl")
+# Header spellings normalised to the `email` field templates and the worker read
+EMAIL_COLUMNS = {"email", "e-mail", "email_address", "email address", "emailaddress", "mail"}
+
+
+def detect_format(path: str) -> str:
+    name = path.lower()
+    if name.endswith(".gz"):
+        name = name[:-3]
+    return "jsonl" if name.endswith((".jsonl", ".ndjson", ".json")) else "csv"
+
+
+def _open(path: str):
+    # utf-8-sig drops the BOM spreadsheet exports start with
+    if path.lower().endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8-sig", newline="")
+    return open(path, encoding="utf-8-sig", newline="")
+
+
+def read_rows(path: str, file_format: str = None) -> Iterator[Optional[dict]]:
+    """Stream rows from a CSV or JSONL file (optionally gzipped); unparsable lines yield None"""
+    file_format = file_format or detect_format(path)
+    with _open(path) as source:
+        if file_format == "csv":
+            yield from csv.DictReader(source)
+            return
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                log.warning("lead_import.bad_line", path=path, line=line_number, error=str(e))
+                row = None
+            yield row if isinstance(row, dict) else None
+
+
+def normalize_recipient(row: dict) -> Optional[dict]:
+    """Trimmed, non-empty fields with the address under `email` (lowercased); None without a usable address"""
+    recipient = {}
+    for key, value in row.items():
+        if key is None or value is None:
+            continue
+        key = str(key).strip()
+        if isinstance(value, str):
+            value = value.strip()
+        if not key or value == "":
+            continue
+        if key.lower() in EMAIL_COLUMNS:
+            key = "email"
+            value = str(value).lower()
+        recipient[key] = value
+    email = recipient.get("email", "")
+    if "@" not in email:
+        return None
+    return recipient
+
+
+def normalize_lead(row: Optional[dict]) -> List[dict]:
+    """Recipients of one input row: a flat row is one recipient, a `lead_data` list/object several"""
+    if not row:
+        return []
+    lead_data = row.get("lead_data", row)
+    rows = lead_data if isinstance(lead_data, list) else [lead_data]
+    recipients = [normalize_recipient(r) for r in rows if isinstance(r, dict)]
+    return [r for r in recipients if r]
+
+
+class LeadImporter:
+    """Writes normalised leads in chunks of insert_many(ordered=False)
+
+    Memory is bounded by one chunk: each chunk's addresses are checked against
+    the campaign with a single indexed query, and earlier chunks are already in
+    Mongo by then, so repeats across the file are caught the same way. A
+    recipient whose address is taken is dropped; a lead left with none is skipped.
+    """
+
+    def __init__(self, campaign_id: str, chunk_size: int = 1000,
+                 on_progress: Optional[Callable[[Dict[str, int]], None]] = None):
+        self.campaign_id = campaign_id
+        self.chunk_size = chunk_size
+        self.on_progress = on_progress
+        self._chunk: List[List[dict]] = []
+        self.stats = {"rows": 0, "inserted": 0, "duplicates": 0, "invalid": 0}
+
+    def add(self, row: Optional[dict]):
+        self.stats["rows"] += 1
+        recipients = normalize_lead(row)
+        if not recipients:
+            self.stats["invalid"] += 1
+            return
+        self._chunk.append(recipients)
+        if len(self._chunk) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        if not self._chunk:
+            return
+        emails = [recipient["email"] for recipients in self._chunk for recipient in recipients]
+        seen = existing_lead_emails(self.campaign_id, emails)
+        leads = []
+        for recipients in self._chunk:
+            unique = []
+            for recipient in recipients:
+                if recipient["email"] in seen:
+                    self.stats["duplicates"] += 1
+                    continue
+                seen.add(recipient["email"])
+                unique.append(recipient)
+            if unique:
+                leads.append(new_lead(self.campaign_id, unique))
+        self.stats["inserted"] += insert_leads(leads)
+        self._chunk = []
+        if self.on_progress:
+            self.on_progress(dict(self.stats))
+
+
+def import_leads(campaign_id: str, rows: Iterable[Optional[dict]], chunk_size: int = 1000,
+                 on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """Import rows into campaign_leads; returns rows read, leads inserted, duplicate and invalid counts"""
+    importer = LeadImporter(campaign_id, chunk_size, on_progress)
+    for row in rows:
+        importer.add(row)
+    importer.flush()
+    log.info("lead_import.done", campaign_id=campaign_id, **importer.stats)
+    return importer.stats
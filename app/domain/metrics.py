@@ -0,0 +1,214 @@
+import bisect
+import contextlib
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+import structlog
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+# Seconds; covers a cached lookup up to a slow SMTP handshake
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# name -> (type, help)
+METRICS = {
+    "emailbot_phase_seconds": ("histogram", "Time spent per send-loop phase"),
+    "emailbot_emails_sent_total": ("counter", "Emails handed to SMTP and committed"),
+    "emailbot_send_errors_total": ("counter", "Sends that failed and were rolled back"),
+    "emailbot_no_account_available_total": ("counter", "Batches stopped because no account could be reserved"),
+    "emailbot_template_errors_total": ("counter", "Jobs dropped because their template failed to render"),
+    "emailbot_suppressed_total": ("counter", "Recipients skipped before reservation because they are suppressed"),
+    "emailbot_due_leads": ("gauge", "Leads due now, per queued campaign"),
+    "emailbot_smtp_pool_events": ("gauge", "SMTP connection pool events since start"),
+    "emailbot_dao_cache_events": ("gauge", "DAO cache lookups since start"),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+_NULL_TIMER = contextlib.nullcontext()
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self, buckets: int):
+        self.counts = [0] * buckets
+        self.sum = 0.0
+        self.count = 0
+
+
+class MetricsRegistry:
+    """Counters, gauges and histograms kept in process and rendered in Prometheus text format
+
+    Collectors are called at render time for values that are cheaper to read on
+    scrape than to maintain on the send path (due backlog, pool/cache stats).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+        self._collectors: List[Callable[["MetricsRegistry"], None]] = []
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name: str, value: float, **labels):
+        with self._lock:
+            self._values.setdefault(name, {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name: str, seconds: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(len(self.buckets))
+            index = bisect.bisect_left(self.buckets, seconds)
+            if index < len(self.buckets):
+                histogram.counts[index] += 1
+            histogram.sum += seconds
+            histogram.count += 1
+
+    @contextlib.contextmanager
+    def timer(self, phase: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("emailbot_phase_seconds", time.perf_counter() - started, phase=phase)
+
+    def register_collector(self, collector: Callable[["MetricsRegistry"], None]):
+        self._collectors.append(collector)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+            self._histograms.clear()
+
+    def value(self, name: str, **labels) -> Optional[float]:
+        with self._lock:
+            return self._values.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def histogram(self, name: str, **labels) -> Optional[dict]:
+        with self._lock:
+            histogram = self._histograms.get(name, {}).get(tuple(sorted(labels.items())))
+            if histogram is None:
+                return None
+            return {"counts": list(histogram.counts), "sum": histogram.sum, "count": histogram.count}
+
+    def collect(self):
+        for collector in self._collectors:
+            try:
+                collector(self)
+            except Exception as e:
+                log.warning("metrics.collector_error", collector=getattr(collector, "__name__", "?"), error=str(e))
+
+    def render(self) -> str:
+        """Prometheus text exposition of everything recorded so far"""
+        self.collect()
+        lines = []
+        with self._lock:
+            names = sorted(set(self._values) | set(self._histograms))
+            for name in names:
+                kind, help_text = METRICS.get(name, ("untyped", ""))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._values.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                for labels, histogram in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, histogram.counts):
+                        cumulative += count
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', '+Inf'),))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in labels) + "}"
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+registry = MetricsRegistry()
+
+
+# Send-path entry points: a settings check and nothing else when METRICS_ENABLED is off
+
+def timer(phase: str):
+    if not settings.METRICS_ENABLED:
+        return _NULL_TIMER
+    return registry.timer(phase)
+
+
+def inc(name: str, value: float = 1, **labels):
+    if settings.METRICS_ENABLED:
+        registry.inc(name, value, **labels)
+
+
+def _collect_due_leads(metrics: MetricsRegistry):
+    from app.db.dao_campaigns import get_campaign_queue
+    from app.db.dao_leads import count_due_leads
+    now_utc = datetime.now(timezone.utc)
+    for entry in get_campaign_queue():
+        campaign_id = str(entry["campaign_id"])
+        metrics.set("emailbot_due_leads", count_due_leads(campaign_id, now_utc), campaign_id=campaign_id)
+
+
+def _collect_component_stats(metrics: MetricsRegistry):
+    from app.db.cache import dao_cache
+    from app.domain.transport import smtp_pool
+    for event, count in smtp_pool.stats.items():
+        metrics.set("emailbot_smtp_pool_events", count, event=event)
+    stats = dao_cache.stats()
+    metrics.set("emailbot_dao_cache_events", stats["hits"], event="hit")
+    metrics.set("emailbot_dao_cache_events", stats["misses"], event="miss")
+
+
+registry.register_collector(_collect_due_leads)
+registry.register_collector(_collect_component_stats)
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_http_server(port: int = None, addr: str = None) -> Optional[ThreadingHTTPServer]:
+    """Serve /metrics on a daemon thread; no-op unless metrics are enabled and a port is set"""
+    port = port if port is not None else settings.METRICS_PORT
+    if not settings.METRICS_ENABLED or not port:
+        return None
+    server = ThreadingHTTPServer((addr or settings.METRICS_ADDR, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("metrics.http_started", addr=server.server_address[0], port=server.server_address[1])
+    return server
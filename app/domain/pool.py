@@ -0,0 +1,217 @@
+import multiprocessing
+import os
+import socket
+import time
+import structlog
+from datetime import datetime, timezone
+from typing import List, Optional
+from pymongo.errors import PyMongoError
+from app.db.dao_runtime import report_worker_health
+from app.domain.dispatcher import run_once as dispatcher_run_once
+from app.domain.sharding import HashRing
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+MAX_RESTART_BACKOFF_SECONDS = 60
+# A process that stays up this long is considered recovered: its crash backoff resets
+STABLE_AFTER_SECONDS = 60
+
+
+class ShardMember:
+    """Dispatcher loop of one pool process, limited to the campaigns it owns on the ring
+
+    `alive` and `heartbeats` are shared with the supervisor, one slot per process.
+    The ring is rebuilt from the live slots, so when a process dies the survivors
+    pick up its campaigns at their next heartbeat and hand them back once it has
+    been restarted. Overlap while membership settles is safe: leads are leased
+    and accounts reserved atomically.
+    """
+
+    def __init__(self, slot: int, alive, heartbeats, db=None, batch_size: int = None, verbose: bool = False,
+                 concurrency: int = None, tick_seconds: float = None, event_driven: bool = False):
+        self.slot = slot
+        self.alive = alive
+        self.heartbeats = heartbeats
+        self.batch_size = batch_size
+        self.verbose = verbose
+        self.concurrency = concurrency
+        self.tick_seconds = tick_seconds or settings.DISPATCHER_TICK_SECONDS
+        self.ring = HashRing([slot])
+        self.dispatcher = None
+        if event_driven:
+            from app.domain.event_dispatcher import EventDrivenDispatcher
+            self.dispatcher = EventDrivenDispatcher(db, batch_size=batch_size, verbose=verbose,
+                                                    concurrency=concurrency, owns=self.owns)
+        self.worker_id = f"{socket.gethostname()}:pool-{slot}"
+        self.health = {"slot": slot, "pid": os.getpid(), "host": socket.gethostname(),
+                       "started_at": datetime.now(timezone.utc), "status": "running",
+                       "passes": 0, "errors": 0, "last_error": None, "last_pass_seconds": None}
+
+    def owns(self, campaign_id: str) -> bool:
+        return self.ring.owner(campaign_id) == self.slot
+
+    def refresh_membership(self) -> bool:
+        """Rebuild the ring if processes came or went; True when it changed"""
+        members = [i for i in range(len(self.alive)) if self.alive[i] or i == self.slot]
+        if members == self.ring.members:
+            return False
+        log.info("pool.rebalanced", slot=self.slot, members=members)
+        self.ring = HashRing(members)
+        if self.dispatcher is not None:
+            self.dispatcher.notify()
+        return True
+
+    def run_pass(self) -> float:
+        """One dispatcher pass over this shard; returns seconds until the next one"""
+        started = time.monotonic()
+        try:
+            if self.dispatcher is not None:
+                sleep_seconds = self.dispatcher.run_pass()
+            else:
+                dispatcher_run_once(self.batch_size, self.verbose, self.concurrency, owns=self.owns)
+                sleep_seconds = self.tick_seconds
+        except Exception as e:
+            log.error("pool.pass_error", slot=self.slot, error=str(e))
+            self.health["errors"] += 1
+            self.health["last_error"] = str(e)
+            sleep_seconds = self.tick_seconds
+        self.health["passes"] += 1
+        self.health["last_pass_seconds"] = round(time.monotonic() - started, 3)
+        return sleep_seconds
+
+    def beat(self, status: str = "running"):
+        self.heartbeats[self.slot] = time.time()
+        self.health.update(status=status, members=self.ring.members, last_heartbeat_at=datetime.now(timezone.utc))
+        try:
+            report_worker_health(self.worker_id, self.health)
+        except PyMongoError as e:
+            log.warning("pool.health_report_failed", slot=self.slot, error=str(e))
+
+    def run_forever(self):
+        self.alive[self.slot] = 1
+        if self.dispatcher is not None:
+            self.dispatcher.start_watching()
+        next_pass = 0.0
+        while True:
+            # Take over (or hand back) campaigns straight away when membership changes
+            if self.refresh_membership() or time.monotonic() >= next_pass:
+                next_pass = time.monotonic() + self.run_pass()
+            self.beat()
+            wait = min(max(next_pass - time.monotonic(), 0.0), settings.POOL_HEARTBEAT_SECONDS)
+            if self.dispatcher is not None:
+                if self.dispatcher.wait(wait):
+                    next_pass = 0.0
+            else:
+                time.sleep(wait)
+
+
+def _use_slot_spool(slot: int):
+    """One activity spool per process: ACTIVITY_SPOOL_PATH.pool-<slot>, replayed by the slot's replacement"""
+    from app.db.dao_activities import activity_writer
+    if not settings.ACTIVITY_SPOOL_PATH:
+        return
+    settings.ACTIVITY_SPOOL_PATH = f"{settings.ACTIVITY_SPOOL_PATH}.pool-{slot}"
+    activity_writer.close()
+    activity_writer.spool_path = settings.ACTIVITY_SPOOL_PATH
+
+
+def _run_member(slot: int, alive, heartbeats, options: dict):
+    """Entry point of a pool process (spawned, so it opens its own Mongo client and SMTP pool)"""
+    from app.db.client import db
+    from app.db.cache import CacheInvalidator
+    from app.domain import metrics
+    CacheInvalidator(db).start()
+    _use_slot_spool(slot)
+    if settings.METRICS_PORT:
+        # One endpoint per process: METRICS_PORT + slot
+        metrics.start_http_server(settings.METRICS_PORT + slot)
+    member = ShardMember(slot, alive, heartbeats, db=db, **options)
+    try:
+        member.run_forever()
+    except KeyboardInterrupt:
+        member.beat(status="stopped")
+
+
+class WorkerPool:
+    """Supervisor for `processes` dispatcher processes sharing the campaign queue
+
+    A process that exits, or stops heartbeating for POOL_HEARTBEAT_TIMEOUT_SECONDS,
+    is dropped from the ring (the others take over its campaigns) and restarted
+    with exponential backoff. Leads and accounts it held are released when their
+    lease/lock expires.
+    """
+
+    def __init__(self, processes: int, options: dict = None, target=_run_member):
+        self.processes = processes
+        self.options = options or {}
+        self.target = target
+        self._ctx = multiprocessing.get_context("spawn")
+        self.alive = self._ctx.RawArray("b", processes)
+        self.heartbeats = self._ctx.RawArray("d", processes)
+        self._procs: List[Optional[multiprocessing.Process]] = [None] * processes
+        self._started_at = [0.0] * processes
+        self._crashes = [0] * processes
+        self._restart_at = [0.0] * processes
+
+    def _spawn(self, slot: int):
+        proc = self._ctx.Process(target=self.target, args=(slot, self.alive, self.heartbeats, self.options),
+                                 name=f"pool-{slot}")
+        proc.start()
+        self._procs[slot] = proc
+        self._started_at[slot] = self.heartbeats[slot] = time.time()
+        log.info("pool.process_started", slot=slot, pid=proc.pid)
+
+    def start(self):
+        for slot in range(self.processes):
+            self._spawn(slot)
+
+    def supervise(self, now: float = None):
+        """Restart processes that died or hung; called about once a second"""
+        now = now or time.time()
+        for slot, proc in enumerate(self._procs):
+            if proc is None:
+                if now >= self._restart_at[slot]:
+                    self._spawn(slot)
+                continue
+            if proc.is_alive():
+                if now - self.heartbeats[slot] <= settings.POOL_HEARTBEAT_TIMEOUT_SECONDS:
+                    if now - self._started_at[slot] >= STABLE_AFTER_SECONDS:
+                        self._crashes[slot] = 0
+                    continue
+                log.warning("pool.process_hung", slot=slot, pid=proc.pid,
+                            silent_seconds=round(now - self.heartbeats[slot]))
+                proc.terminate()
+                proc.join(5)
+            else:
+                log.warning("pool.process_died", slot=slot, pid=proc.pid, exitcode=proc.exitcode)
+            # Survivors rebuild the ring without this slot on their next heartbeat
+            self.alive[slot] = 0
+            self._procs[slot] = None
+            backoff = min(settings.POOL_RESTART_BACKOFF_SECONDS * 2 ** self._crashes[slot], MAX_RESTART_BACKOFF_SECONDS)
+            self._crashes[slot] += 1
+            self._restart_at[slot] = now + backoff
+
+    def status(self) -> List[dict]:
+        now = time.time()
+        return [{"slot": slot, "pid": proc.pid if proc else None, "alive": bool(self.alive[slot]),
+                 "heartbeat_age": round(now - self.heartbeats[slot], 1) if proc else None,
+                 "restarting": proc is None}
+                for slot, proc in enumerate(self._procs)]
+
+    def run_forever(self):
+        self.start()
+        try:
+            while True:
+                self.supervise()
+                time.sleep(1)
+        finally:
+            self.stop()
+
+    def stop(self):
+        for proc in self._procs:
+            if proc is not None and proc.is_alive():
+                proc.terminate()
+        for proc in self._procs:
+            if proc is not None:
+                proc.join(10)
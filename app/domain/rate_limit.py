@@ -0,0 +1,123 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Tuple
+import structlog
+from app.db.dao_accounts import get_email_accounts_by_ids, get_email_campaign_settings_many
+from app.db.dao_rate_limits import create_bucket, get_bucket, get_smtp_host_limits_many, refund_token, swap_bucket
+
+log = structlog.get_logger()
+
+# Limit field -> refill window in seconds
+WINDOWS = {"per_minute_limit": 60, "per_hour_limit": 3600}
+# Lost compare-and-swap races before a bucket is treated as busy for this attempt
+CAS_ATTEMPTS = 5
+CONTENDED_RETRY_SECONDS = 1
+
+# (key, capacity, tokens per second)
+Bucket = Tuple[str, float, float]
+
+
+def _aware(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+
+def _buckets(prefix: str, doc: Optional[dict]) -> List[Bucket]:
+    """Buckets for the limits set on a settings document
+
+    per_minute_limit/per_hour_limit set the refill rates. burst_limit caps how
+    many of the per-minute tokens can be spent back to back (default: the limit).
+    """
+    buckets = []
+    for field, window in WINDOWS.items():
+        limit = int((doc or {}).get(field) or 0)
+        if limit <= 0:
+            continue
+        capacity = limit
+        if field == "per_minute_limit" and doc.get("burst_limit"):
+            capacity = int(doc["burst_limit"])
+        buckets.append((f"{prefix}:{window}", float(capacity), limit / window))
+    return buckets
+
+
+class RateLimiter:
+    """Token buckets per account and per SMTP host, shared by every process through Mongo
+
+    Account limits come from email_campaign_settings, provider-wide ones from
+    smtp_host_limits documents ({smtp_host, per_minute_limit, per_hour_limit,
+    burst_limit}). A send takes one token from each of its buckets or none at
+    all. Buckets known to be empty are skipped locally until they refill.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # bucket key -> when it has a token again
+        self._empty_until: Dict[str, datetime] = {}
+        self.stats = {"granted": 0, "throttled": 0}
+
+    def clear(self):
+        with self._lock:
+            self._empty_until.clear()
+
+    def buckets_for(self, email_ids: Iterable[str]) -> Dict[str, List[Bucket]]:
+        """email_id -> buckets a send on that account draws from"""
+        email_ids = list(email_ids)
+        account_settings = get_email_campaign_settings_many(email_ids)
+        accounts = get_email_accounts_by_ids(email_ids)
+        hosts = {email_id: account.get("smtp_host") for email_id, account in accounts.items() if account.get("smtp_host")}
+        host_limits = get_smtp_host_limits_many(set(hosts.values())) if hosts else {}
+        return {
+            email_id: _buckets(f"account:{email_id}", account_settings.get(email_id))
+                      + _buckets(f"host:{hosts.get(email_id)}", host_limits.get(hosts.get(email_id)))
+            for email_id in email_ids
+        }
+
+    def acquire(self, buckets: List[Bucket], now_utc: datetime) -> Optional[datetime]:
+        """Take a token from every bucket; None if granted, else when to try again (nothing taken)"""
+        with self._lock:
+            for key, _, _ in buckets:
+                empty_until = self._empty_until.get(key)
+                if empty_until is not None and now_utc < empty_until:
+                    self.stats["throttled"] += 1
+                    return empty_until
+        taken = []
+        for bucket in buckets:
+            retry_at = self._take(bucket, now_utc)
+            if retry_at is not None:
+                self.release(taken)
+                with self._lock:
+                    self._empty_until[bucket[0]] = retry_at
+                    self.stats["throttled"] += 1
+                log.debug("rate_limit.throttled", bucket=bucket[0], retry_at=retry_at)
+                return retry_at
+            taken.append(bucket)
+        with self._lock:
+            self.stats["granted"] += 1
+        return None
+
+    def release(self, buckets: List[Bucket]):
+        """Give back tokens for a send that never happened"""
+        for key, _, _ in buckets:
+            refund_token(key)
+            with self._lock:
+                self._empty_until.pop(key, None)
+
+    def _take(self, bucket: Bucket, now_utc: datetime) -> Optional[datetime]:
+        key, capacity, per_second = bucket
+        for _ in range(CAS_ATTEMPTS):
+            doc = get_bucket(key)
+            if doc is None:
+                if create_bucket(key, capacity - 1, now_utc):
+                    return None
+                continue
+            updated_at = _aware(doc["updated_at"])
+            elapsed = max(0.0, (now_utc - updated_at).total_seconds())
+            tokens = min(capacity, doc["tokens"] + elapsed * per_second)
+            if tokens < 1:
+                return now_utc + timedelta(seconds=(1 - tokens) / per_second)
+            if swap_bucket(doc, tokens - 1, max(now_utc, updated_at)):
+                return None
+        return now_utc + timedelta(seconds=CONTENDED_RETRY_SECONDS)
+
+
+# Shared by all arbiters in this process
+rate_limiter = RateLimiter()
@@ -0,0 +1,133 @@
+import gzip
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, List, Optional
+import structlog
+from bson import json_util
+from app.db.dao_activities import delete_activities, first_activity_at, iter_activities, rollup_activities
+from app.db.dao_leads import get_checkpoint, save_checkpoint
+from app.db.dao_runtime import delete_runtime_states_before
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+ACTIONS = ("archive", "delete", "keep")
+CHECKPOINT = "retention:campaign_activities"
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value
+
+
+def _start_of_day(value: datetime) -> datetime:
+    return _as_utc(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def archive_path(archive_dir: str, date_key: str) -> str:
+    """First unused archive file for date_key; an existing archive is never overwritten"""
+    directory = os.path.join(archive_dir, "campaign_activities")
+    path = os.path.join(directory, f"{date_key}.jsonl.gz")
+    part = 1
+    while os.path.exists(path):
+        path = os.path.join(directory, f"{date_key}.{part}.jsonl.gz")
+        part += 1
+    return path
+
+
+def write_archive(path: str, activities) -> int:
+    """Stream activities into a gzip JSONL file; it only appears under its final name once complete"""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = path + ".partial"
+    count = 0
+    with gzip.open(partial, "wt", encoding="utf-8") as archive:
+        for activity in activities:
+            archive.write(json_util.dumps(activity) + "\n")
+            count += 1
+    os.replace(partial, path)
+    return count
+
+
+def retain_activities(now_utc: datetime, days: int = None, action: str = None, archive_dir: str = None,
+                      max_days: Optional[int] = None,
+                      on_day: Optional[Callable[[dict], None]] = None) -> List[dict]:
+    """Roll up, then archive or delete, whole UTC days of activities older than `days`
+
+    Days are processed oldest first, each as rollup -> archive -> delete, and the
+    stage reached is checkpointed: an interrupted day is finished first on the
+    next run, without recounting it half-deleted or archiving it twice. The
+    checkpoint's last_id is the last day rolled up, so a later run with "keep"
+    starts after it and one with "archive"/"delete" doesn't recount days that
+    are already summarised.
+    """
+    days = days if days is not None else settings.ACTIVITY_RETENTION_DAYS
+    action = action or settings.ACTIVITY_RETENTION_ACTION
+    archive_dir = archive_dir or settings.ACTIVITY_ARCHIVE_DIR
+    if days < 1:
+        raise ValueError("activity retention must keep at least today (days >= 1)")
+    if action not in ACTIONS:
+        raise ValueError(f"unknown retention action {action!r}; expected one of {', '.join(ACTIONS)}")
+
+    cutoff = _start_of_day(now_utc) - timedelta(days=days)
+    checkpoint = get_checkpoint(CHECKPOINT) or {}
+    rolled_up_through = checkpoint.get("last_id")
+    since = None
+    if action == "keep" and rolled_up_through:
+        since = datetime.fromisoformat(rolled_up_through).replace(tzinfo=timezone.utc) + timedelta(days=1)
+
+    interrupted = checkpoint.get("day")
+    results = []
+    while max_days is None or len(results) < max_days:
+        if interrupted:
+            start = datetime.fromisoformat(interrupted).replace(tzinfo=timezone.utc)
+            stage = checkpoint.get("stage")
+            interrupted = None
+            if start >= cutoff:
+                # Window widened since; its rows are intact, so it just waits its turn
+                continue
+            resumed = True
+        else:
+            first = first_activity_at(since)
+            if first is None:
+                break
+            start = _start_of_day(first)
+            if start >= cutoff:
+                break
+            stage = None
+            resumed = False
+        end = start + timedelta(days=1)
+        date_key = start.strftime("%Y-%m-%d")
+        result = {"date_key": date_key, "summaries": 0, "archived": 0, "deleted": 0, "archive_path": None}
+
+        if stage is None and (rolled_up_through is None or date_key > rolled_up_through):
+            result["summaries"] = rollup_activities(date_key, start, end)
+            stage = "rolled_up"
+            save_checkpoint(CHECKPOINT, rolled_up_through, day=date_key, stage=stage)
+        if action == "archive" and stage != "archived":
+            path = archive_path(archive_dir, date_key)
+            result["archived"] = write_archive(path, iter_activities(start, end))
+            result["archive_path"] = path
+            stage = "archived"
+            save_checkpoint(CHECKPOINT, rolled_up_through, day=date_key, stage=stage)
+        if action != "keep":
+            result["deleted"] = delete_activities(start, end)
+
+        rolled_up_through = max(rolled_up_through or date_key, date_key)
+        save_checkpoint(CHECKPOINT, rolled_up_through, day=None, stage=None)
+        log.info("retention.activities_day", action=action, **result)
+        results.append(result)
+        if on_day:
+            on_day(result)
+        if not resumed:
+            since = end
+    return results
+
+
+def compact_runtime_states(now_utc: datetime, days: int = None) -> Dict[str, int]:
+    """Drop runtime state rows for days more than `days` before today; only today's rows are ever read"""
+    days = days if days is not None else settings.RUNTIME_STATE_RETENTION_DAYS
+    if days < 1:
+        raise ValueError("runtime state retention must keep at least today (days >= 1)")
+    before = (_start_of_day(now_utc) - timedelta(days=days)).strftime("%Y-%m-%d")
+    deleted = delete_runtime_states_before(before)
+    log.info("retention.runtime_states", before=before, **deleted)
+    return deleted
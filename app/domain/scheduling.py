@@ -1,59 +1,182 @@
+import re
 import pytz
-from datetime import datetime, time
-from typing import Dict
+from datetime import date, datetime, time, timedelta
+from functools import lru_cache
+from typing import Dict, Iterator, Optional, Tuple
 
 WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
 
-def in_window(now_utc: datetime, schedule_doc: Dict) -> bool:
-    tz_str = schedule_doc.get("timezone")
-    if not tz_str:
-        return False
-    try:
-        tz = pytz.timezone(tz_str.split()[0])
-    except Exception:
-        return False
-    now_local = now_utc.astimezone(tz)
-    weekday = now_local.strftime("%A").lower()
-    scheduled_days = schedule_doc.get("scheduled_days", WEEKDAYS)
-    if weekday not in [d.lower() for d in scheduled_days]:
-        return False
-    import re
-    def parse_date(val):
-        if isinstance(val, datetime):
-            return val.date()
-        if isinstance(val, str):
-            # Try ISO8601, with or without Z
-            m = re.match(r"(\d{4}-\d{2}-\d{2})", val)
-            if m:
-                return datetime.fromisoformat(m.group(1)).date()
+def _parse_date(val) -> Optional[date]:
+    if isinstance(val, datetime):
+        return val.date()
+    if isinstance(val, date):
+        return val
+    if isinstance(val, str):
+        # Try ISO8601, with or without Z
+        m = re.match(r"(\d{4}-\d{2}-\d{2})", val)
+        if m:
+            return datetime.fromisoformat(m.group(1)).date()
+        try:
+            return datetime.fromisoformat(val.replace('Z','')).date()
+        except Exception:
+            pass
+    return None
+
+def _parse_time(time_str: str) -> time:
+    # Handle AM/PM format like "01:00 pm"
+    if 'am' in time_str.lower() or 'pm' in time_str.lower():
+        return datetime.strptime(time_str, "%I:%M %p").time()
+    # Handle ISO format like "13:00"
+    return time.fromisoformat(time_str)
+
+class CompiledSchedule:
+    """A campaign_schedule document parsed once: timezone, weekdays, date bounds and times
+
+    is_open() answers exactly what in_window() always has. next_open_at() and
+    closes_at() walk the open intervals in local wall-clock time, so overnight
+    windows and DST shifts come out as real UTC instants.
+    """
+
+    def __init__(self, tz, weekdays: frozenset, start_date: Optional[date], end_date: Optional[date],
+                 t_from: Optional[time], t_to: Optional[time]):
+        self.tz = tz
+        self.weekdays = weekdays
+        self.start_date = start_date
+        self.end_date = end_date
+        self.t_from = t_from
+        self.t_to = t_to
+
+    @classmethod
+    def from_doc(cls, schedule_doc: Dict) -> "CompiledSchedule":
+        tz = None
+        tz_str = schedule_doc.get("timezone")
+        if tz_str:
             try:
-                return datetime.fromisoformat(val.replace('Z','')).date()
+                tz = pytz.timezone(tz_str.split()[0])
             except Exception:
-                pass
-        return None
-    start_date = parse_date(schedule_doc.get("start_date"))
-    end_date = parse_date(schedule_doc.get("end_date"))
-    today = now_local.date()
-    if start_date and today < start_date:
-        return False
-    if end_date and today > end_date:
-        return False
-    time_from = schedule_doc.get("time_from")
-    time_to = schedule_doc.get("time_to")
-    if not (time_from and time_to):
+                tz = None
+        scheduled_days = schedule_doc.get("scheduled_days", WEEKDAYS)
+        weekdays = frozenset(WEEKDAYS.index(d.lower()) for d in scheduled_days if d.lower() in WEEKDAYS)
+        time_from = schedule_doc.get("time_from")
+        time_to = schedule_doc.get("time_to")
+        if time_from and time_to:
+            t_from, t_to = _parse_time(time_from), _parse_time(time_to)
+        else:
+            t_from = t_to = None
+        return cls(tz, weekdays, _parse_date(schedule_doc.get("start_date")),
+                   _parse_date(schedule_doc.get("end_date")), t_from, t_to)
+
+    def _day_allowed(self, day: date) -> bool:
+        if day.weekday() not in self.weekdays:
+            return False
+        if self.start_date and day < self.start_date:
+            return False
+        if self.end_date and day > self.end_date:
+            return False
         return True
-    
-    def parse_time(time_str):
-        # Handle AM/PM format like "01:00 pm"
-        if 'am' in time_str.lower() or 'pm' in time_str.lower():
-            return datetime.strptime(time_str, "%I:%M %p").time()
-        # Handle ISO format like "13:00"
-        return time.fromisoformat(time_str)
-    
-    t_from = parse_time(time_from)
-    t_to = parse_time(time_to)
-    now_t = now_local.time()
-    if t_from <= t_to:
-        return t_from <= now_t <= t_to
-    else:
-        return now_t >= t_from or now_t <= t_to
+
+    def is_open(self, now_utc: datetime) -> bool:
+        if self.tz is None:
+            return False
+        now_local = now_utc.astimezone(self.tz)
+        if not self._day_allowed(now_local.date()):
+            return False
+        if self.t_from is None:
+            return True
+        now_t = now_local.time()
+        if self.t_from <= self.t_to:
+            return self.t_from <= now_t <= self.t_to
+        else:
+            return now_t >= self.t_from or now_t <= self.t_to
+
+    def _day_intervals(self, day: date) -> Iterator[Tuple[datetime, datetime]]:
+        """Open (start, end) wall-clock intervals belonging to a local calendar day"""
+        if not self._day_allowed(day):
+            return
+        midnight = datetime.combine(day, time.min)
+        next_midnight = midnight + timedelta(days=1)
+        if self.t_from is None:
+            yield midnight, next_midnight
+        elif self.t_from <= self.t_to:
+            yield datetime.combine(day, self.t_from), datetime.combine(day, self.t_to)
+        else:
+            # Overnight window: the early-morning tail and the late-evening head of the same day
+            yield midnight, datetime.combine(day, self.t_to)
+            yield datetime.combine(day, self.t_from), next_midnight
+
+    def _intervals(self, from_day: date) -> Iterator[Tuple[datetime, datetime]]:
+        """Open intervals from from_day on, with back-to-back ones across midnight merged"""
+        day = max(from_day, self.start_date) if self.start_date else from_day
+        last_day = day + timedelta(days=7)
+        if self.end_date:
+            last_day = min(last_day, self.end_date)
+        current = None
+        while day <= last_day:
+            for start, end in self._day_intervals(day):
+                if current and current[1] == start:
+                    current = (current[0], end)
+                    continue
+                if current:
+                    yield current
+                current = (start, end)
+            day += timedelta(days=1)
+        if current:
+            yield current
+
+    def _to_utc(self, local: datetime, earliest: bool) -> datetime:
+        try:
+            aware = self.tz.localize(local, is_dst=None)
+        except pytz.AmbiguousTimeError:
+            # Repeated hour when clocks go back: first or second occurrence
+            aware = self.tz.localize(local, is_dst=earliest)
+        except pytz.NonExistentTimeError:
+            # Skipped hour when clocks go forward: the wall time just after the gap
+            aware = self.tz.localize(local, is_dst=False)
+        return aware.astimezone(pytz.utc)
+
+    def next_open_at(self, now_utc: datetime) -> Optional[datetime]:
+        """now_utc if the window is open, else when it next opens (None if it never does)"""
+        if self.tz is None or not self.weekdays:
+            return None
+        if self.is_open(now_utc):
+            return now_utc
+        now_local = now_utc.astimezone(self.tz).replace(tzinfo=None)
+        for start, _ in self._intervals(now_local.date()):
+            # Compared in UTC: a start inside the hour repeated at the end of DST opens twice
+            for earliest in (True, False):
+                opens_at = self._to_utc(start, earliest)
+                if opens_at > now_utc:
+                    return opens_at
+        return None
+
+    def closes_at(self, now_utc: datetime) -> Optional[datetime]:
+        """End of the open window now_utc falls in (None if closed now or open for good)"""
+        if not self.is_open(now_utc):
+            return None
+        now_local = now_utc.astimezone(self.tz).replace(tzinfo=None)
+        for start, end in self._intervals(now_local.date()):
+            if start <= now_local <= end:
+                if not self.end_date and end >= datetime.combine(now_local.date() + timedelta(days=7), time.min):
+                    # Every day, all day: nothing to wait for
+                    return None
+                return self._to_utc(end, earliest=False)
+        return None
+
+@lru_cache(maxsize=1024)
+def _compile(tz_str, scheduled_days, start_date, end_date, time_from, time_to) -> CompiledSchedule:
+    doc = {"timezone": tz_str, "start_date": start_date, "end_date": end_date,
+           "time_from": time_from, "time_to": time_to}
+    if scheduled_days is not None:
+        doc["scheduled_days"] = list(scheduled_days)
+    return CompiledSchedule.from_doc(doc)
+
+def compile_schedule(schedule_doc: Dict) -> CompiledSchedule:
+    """Cached CompiledSchedule for a schedule document (keyed on the fields it uses)"""
+    scheduled_days = schedule_doc.get("scheduled_days")
+    return _compile(schedule_doc.get("timezone"),
+                    tuple(scheduled_days) if scheduled_days is not None else None,
+                    schedule_doc.get("start_date"), schedule_doc.get("end_date"),
+                    schedule_doc.get("time_from"), schedule_doc.get("time_to"))
+
+def in_window(now_utc: datetime, schedule_doc: Dict) -> bool:
+    return compile_schedule(schedule_doc).is_open(now_utc)
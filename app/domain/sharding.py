@@ -0,0 +1,30 @@
+import bisect
+import hashlib
+from typing import Iterable, List, Optional, Tuple
+
+
+def _hash(value: str) -> int:
+    # md5 rather than hash(): every process has to agree on placement
+    return int.from_bytes(hashlib.md5(value.encode()).digest()[:8], "big")
+
+
+class HashRing:
+    """Consistent hashing of campaign ids onto pool members
+
+    Each member gets `replicas` points on the ring, so campaigns spread evenly
+    and removing a member only moves the campaigns it owned.
+    """
+
+    def __init__(self, members: Iterable, replicas: int = 64):
+        self.members = sorted(set(members))
+        points: List[Tuple[int, object]] = sorted(
+            (_hash(f"{member}:{i}"), member) for member in self.members for i in range(replicas)
+        )
+        self._keys = [point for point, _ in points]
+        self._owners = [member for _, member in points]
+
+    def owner(self, key: str) -> Optional[object]:
+        if not self._keys:
+            return None
+        index = bisect.bisect(self._keys, _hash(str(key))) % len(self._keys)
+        return self._owners[index]
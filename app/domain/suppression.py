@@ -0,0 +1,228 @@
+import heapq
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Dict, Iterable, Optional
+import structlog
+from app.db.dao_suppressions import (get_suppression_changes, iter_active_suppressed_emails, lift_suppressions,
+                                     upsert_suppressions)
+from app.domain.lead_import import normalize_recipient
+from app.config.settings import settings
+
+log = structlog.get_logger()
+
+# Writers stamp updated_at with their own clock; re-reading a few seconds back covers skew
+SYNC_OVERLAP = timedelta(seconds=5)
+# Pending changes are merged into the sorted array once they reach this (or 1/16 of it)
+COMPACT_MIN_CHANGES = 4096
+SORT_RUN_SIZE = 100_000
+
+
+def normalize_email(email) -> str:
+    return str(email or "").strip().lower()
+
+
+def email_hash(email: str) -> int:
+    # The filter never leaves the process, so the interpreter's seeded 64-bit str hash
+    # will do and costs a fraction of a hashlib digest
+    return hash(normalize_email(email))
+
+
+def _unique(ordered: Iterable[int]) -> Iterable[int]:
+    previous = None
+    for value in ordered:
+        if value != previous:
+            yield value
+            previous = value
+
+
+def _sorted_hashes(hashes: Iterable[int]) -> array:
+    """Sort in fixed-size runs and merge them, so a full load never holds more than one run as Python ints"""
+    runs = []
+    run = []
+    for value in hashes:
+        run.append(value)
+        if len(run) >= SORT_RUN_SIZE:
+            run.sort()
+            runs.append(array("q", run))
+            run = []
+    if run:
+        run.sort()
+        runs.append(array("q", run))
+    return array("q", _unique(heapq.merge(*runs)))
+
+
+class _Index:
+    """Sorted hashes plus a one-probe Bloom bitmap over them (16 bits per entry)
+
+    Most lookups are for addresses that aren't suppressed; the bitmap turns
+    nearly all of those away without a binary search.
+    """
+    __slots__ = ("hashes", "bits", "mask")
+
+    def __init__(self, hashes: array):
+        self.hashes = hashes
+        size = 1 << max(10, (len(hashes) * 2 - 1).bit_length())
+        bits = bytearray(size)
+        mask = size - 1
+        for value in hashes:
+            bits[(value >> 3) & mask] |= 1 << (value & 7)
+        self.bits = bits
+        self.mask = mask
+
+    def __contains__(self, value: int) -> bool:
+        if not self.bits[(value >> 3) & self.mask] & (1 << (value & 7)):
+            return False
+        hashes = self.hashes
+        index = bisect_left(hashes, value)
+        return index < len(hashes) and hashes[index] == value
+
+
+class SuppressionFilter:
+    """In-process membership test for suppressed recipient addresses
+
+    Active suppressions are held as 64-bit hashes in one sorted array (8 bytes
+    per address, binary-search lookups) behind a small Bloom bitmap, plus
+    added/lifted sets for changes picked up since the array was built; those
+    are merged in once they grow. refresh() loads everything the first time and
+    afterwards only reads the suppressions whose updated_at moved, at most every
+    SUPPRESSION_SYNC_SECONDS. A hash collision could suppress an unrelated
+    address; with 10M entries the odds are around 1e-12 per lookup.
+    """
+
+    def __init__(self, sync_seconds: float = None):
+        self.sync_seconds = sync_seconds if sync_seconds is not None else settings.SUPPRESSION_SYNC_SECONDS
+        self._lock = threading.Lock()
+        self._index = _Index(array("q"))
+        self._added = set()
+        self._lifted = set()
+        self._loaded = False
+        self._synced_at: Optional[datetime] = None
+        self._next_sync = 0.0
+        self.stats = {"loads": 0, "syncs": 0, "changes": 0, "compactions": 0}
+
+    def __len__(self) -> int:
+        return len(self._index.hashes) + len(self._added) - len(self._lifted)
+
+    @property
+    def nbytes(self) -> int:
+        index = self._index
+        return index.hashes.itemsize * len(index.hashes) + len(index.bits)
+
+    def contains(self, email: str) -> bool:
+        value = email_hash(email)
+        if value in self._lifted:
+            return False
+        return value in self._added or value in self._index
+
+    __contains__ = contains
+
+    def refresh(self, force: bool = False):
+        """Load on first use, then apply changes made since the last sync when it's due"""
+        if not force and time.monotonic() < self._next_sync:
+            return
+        with self._lock:
+            if not force and time.monotonic() < self._next_sync:
+                return
+            if self._loaded:
+                self._sync()
+            else:
+                self._load()
+            self._next_sync = time.monotonic() + self.sync_seconds
+
+    def load(self, emails: Iterable[str] = None):
+        """Rebuild from `emails`, or from every active suppression; later syncs start from now"""
+        with self._lock:
+            self._load(emails)
+            self._next_sync = time.monotonic() + self.sync_seconds
+
+    def _load(self, emails: Iterable[str] = None):
+        started = datetime.now(timezone.utc)
+        emails = emails if emails is not None else iter_active_suppressed_emails()
+        self._index = _Index(_sorted_hashes(email_hash(email) for email in emails))
+        self._added, self._lifted = set(), set()
+        self._synced_at = started
+        self._loaded = True
+        self.stats["loads"] += 1
+        log.info("suppression.loaded", entries=len(self._index.hashes), bytes=self.nbytes)
+
+    def _sync(self):
+        started = datetime.now(timezone.utc)
+        changes = get_suppression_changes(self._synced_at - SYNC_OVERLAP)
+        for doc in changes:
+            value = email_hash(doc["email"])
+            # Only differences from the array are kept, so re-reading the overlap costs nothing
+            in_index = value in self._index
+            if doc.get("active"):
+                self._lifted.discard(value)
+                if not in_index:
+                    self._added.add(value)
+            else:
+                self._added.discard(value)
+                if in_index:
+                    self._lifted.add(value)
+        self._synced_at = started
+        self.stats["syncs"] += 1
+        self.stats["changes"] += len(changes)
+        if len(self._added) + len(self._lifted) >= max(COMPACT_MIN_CHANGES, len(self._index.hashes) // 16):
+            self._compact()
+
+    def _compact(self):
+        lifted = self._lifted
+        base = (value for value in self._index.hashes if value not in lifted)
+        index = _Index(array("q", heapq.merge(base, sorted(self._added))))
+        # Swap in the new index before emptying the sets so lookups never miss an entry
+        self._index = index
+        self._added, self._lifted = set(), set()
+        self.stats["compactions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._index = _Index(array("q"))
+            self._added, self._lifted = set(), set()
+            self._loaded = False
+            self._synced_at = None
+            self._next_sync = 0.0
+
+
+suppression_filter = SuppressionFilter()
+
+
+def import_suppressions(rows: Iterable[Optional[dict]], reason: str = None, source: str = None,
+                        lift: bool = False, chunk_size: int = 1000,
+                        on_progress: Optional[Callable[[Dict[str, int]], None]] = None) -> Dict[str, int]:
+    """Suppress (or with lift, un-suppress) the address of every row, in chunked bulk writes
+
+    A row's own `reason` column wins over the default reason.
+    """
+    stats = {"rows": 0, "added": 0, "updated": 0, "lifted": 0, "invalid": 0}
+    chunk = {}
+
+    def flush():
+        now_utc = datetime.now(timezone.utc)
+        if lift:
+            stats["lifted"] += lift_suppressions(list(chunk), now_utc)
+        else:
+            added, updated = upsert_suppressions(list(chunk.values()), now_utc)
+            stats["added"] += added
+            stats["updated"] += updated
+        chunk.clear()
+        if on_progress:
+            on_progress(dict(stats))
+
+    for row in rows:
+        stats["rows"] += 1
+        recipient = normalize_recipient(row) if row else None
+        if not recipient:
+            stats["invalid"] += 1
+            continue
+        email = recipient["email"]
+        chunk[email] = {"email": email, "reason": recipient.get("reason") or reason, "source": source}
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+    log.info("suppression.imported", lift=lift, **stats)
+    return stats
@@ -1,12 +1,43 @@
-from jinja2 import Environment, StrictUndefined, UndefinedError
-from typing import Tuple, Dict
+import hashlib
+import threading
+from collections import OrderedDict
+from jinja2 import Environment, StrictUndefined, UndefinedError, Template
+from typing import Tuple, Dict, List, Optional, Iterable
+from app.config.settings import settings
 
 class SilentUndefined(StrictUndefined):
     """Custom undefined that returns empty string for missing variables"""
     def _fail_with_undefined_error(self, *args, **kwargs):
         return ''
 
-def render_template(subject_tpl: str, html_tpl: str, lead_dict: Dict) -> Tuple[str, str]:
+_env = Environment(undefined=SilentUndefined)
+_compiled: "OrderedDict[Tuple[Optional[str], str], Template]" = OrderedDict()
+_compiled_lock = threading.Lock()
+cache_stats = {"hits": 0, "misses": 0}
+
+def get_compiled_template(source: str, template_id: Optional[str] = None) -> Template:
+    """Compile once per (template id, content hash) - edited templates get a new key"""
+    key = (template_id, hashlib.sha1(source.encode("utf-8")).hexdigest())
+    with _compiled_lock:
+        compiled = _compiled.get(key)
+        if compiled is not None:
+            _compiled.move_to_end(key)
+            cache_stats["hits"] += 1
+            return compiled
+        cache_stats["misses"] += 1
+    compiled = _env.from_string(source)
+    with _compiled_lock:
+        _compiled[key] = compiled
+        while len(_compiled) > settings.TEMPLATE_CACHE_SIZE:
+            _compiled.popitem(last=False)
+    return compiled
+
+def clear_template_cache():
+    with _compiled_lock:
+        _compiled.clear()
+        cache_stats.update(hits=0, misses=0)
+
+def build_template_data(lead_dict: Dict) -> Dict:
     # Add default values for common missing fields
     template_data = {
         # Lead fields
@@ -58,12 +89,29 @@ def render_template(subject_tpl: str, html_tpl: str, lead_dict: Dict) -> Tuple[s
         'company': template_data.get('company') or 'your company'
     }
     template_data.update(display_defaults)
-    
-    env = Environment(undefined=SilentUndefined)
-    subject = env.from_string(subject_tpl).render(**template_data)
-    html = env.from_string(html_tpl).render(**template_data)
+    return template_data
+
+def _compile_pair(subject_tpl: str, html_tpl: str, template_id: Optional[str]) -> Tuple[Template, Template]:
+    subject = get_compiled_template(subject_tpl, f"{template_id}:subject" if template_id else None)
+    html = get_compiled_template(html_tpl, f"{template_id}:html" if template_id else None)
     return subject, html
 
+def render_template(subject_tpl: str, html_tpl: str, lead_dict: Dict,
+                    template_id: Optional[str] = None) -> Tuple[str, str]:
+    subject, html = _compile_pair(subject_tpl, html_tpl, template_id)
+    template_data = build_template_data(lead_dict)
+    return subject.render(**template_data), html.render(**template_data)
+
+def render_template_batch(subject_tpl: str, html_tpl: str, lead_dicts: Iterable[Dict],
+                          template_id: Optional[str] = None) -> List[Tuple[str, str]]:
+    """Render one compiled template for many leads, compiling at most once"""
+    subject, html = _compile_pair(subject_tpl, html_tpl, template_id)
+    results = []
+    for lead_dict in lead_dicts:
+        template_data = build_template_data(lead_dict)
+        results.append((subject.render(**template_data), html.render(**template_data)))
+    return results
+
 def append_signature(html: str, sig_html: str) -> str:
     if sig_html:
         return html + "<br>" + sig_html
@@ -1,33 +1,359 @@
+import asyncio
 import smtplib
+import socket
+import threading
+import time
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
-from typing import Optional
+from typing import Dict, List, Optional, Tuple
 import logging
 from app.config.settings import settings
 
+try:
+    import aiosmtplib
+except ImportError:  # only needed by the async engine
+    aiosmtplib = None
+
+PoolKey = Tuple[str, int, str]
+
+# Replies that mean the server dropped or is about to drop the session
+RECONNECT_CODES = (421,)
+
+
+class SmtpConnectionPool:
+    """Keeps authenticated SMTP sessions alive per (smtp_host, port, username)"""
+
+    def __init__(self, max_idle_seconds: int = None, timeout: int = None):
+        self.max_idle_seconds = max_idle_seconds if max_idle_seconds is not None else settings.SMTP_POOL_MAX_IDLE_SECONDS
+        self.timeout = timeout if timeout is not None else settings.SMTP_TIMEOUT_SECONDS
+        self._idle: Dict[PoolKey, List[Tuple[smtplib.SMTP, float]]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "reconnects": 0, "expired": 0, "stale": 0}
+
+    def acquire(self, host: str, port: int, username: str, password: str, starttls: bool = True) -> smtplib.SMTP:
+        """Return a live session, reusing an idle one when it still answers NOOP"""
+        key = (host, port, username)
+        while True:
+            with self._lock:
+                idle = self._idle.get(key)
+                entry = idle.pop() if idle else None
+            if entry is None:
+                break
+            conn, last_used = entry
+            if time.monotonic() - last_used > self.max_idle_seconds:
+                self._count("expired")
+                self._close(conn)
+                continue
+            if self._is_alive(conn):
+                self._count("hits")
+                return conn
+            self._count("stale")
+            self._close(conn)
+
+        self._count("misses")
+        return self._connect(host, port, username, password, starttls)
+
+    def reconnect(self, host: str, port: int, username: str, password: str, starttls: bool = True) -> smtplib.SMTP:
+        """Open a fresh session after the previous one was dropped by the server"""
+        self._count("reconnects")
+        return self._connect(host, port, username, password, starttls)
+
+    def release(self, host: str, port: int, username: str, conn: smtplib.SMTP):
+        """Hand a healthy session back to the pool"""
+        with self._lock:
+            self._idle.setdefault((host, port, username), []).append((conn, time.monotonic()))
+
+    def discard(self, conn: smtplib.SMTP):
+        """Drop a session that failed mid-use"""
+        self._close(conn)
+
+    def prune(self):
+        """Close sessions idle for longer than max_idle_seconds"""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for key, idle in self._idle.items():
+                keep = []
+                for conn, last_used in idle:
+                    if now - last_used > self.max_idle_seconds:
+                        expired.append(conn)
+                    else:
+                        keep.append((conn, last_used))
+                self._idle[key] = keep
+        for conn in expired:
+            self._count("expired")
+            self._close(conn)
+
+    def close_all(self):
+        with self._lock:
+            conns = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        for conn in conns:
+            self._close(conn)
+
+    def idle_count(self) -> int:
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+    def _count(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def _connect(self, host: str, port: int, username: str, password: str, starttls: bool) -> smtplib.SMTP:
+        conn = smtplib.SMTP(host, port, timeout=self.timeout)
+        try:
+            if starttls:
+                conn.starttls()
+            conn.login(username, password)
+        except Exception:
+            self._close(conn)
+            raise
+        return conn
+
+    @staticmethod
+    def _is_alive(conn: smtplib.SMTP) -> bool:
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    def _close(conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except (smtplib.SMTPException, OSError):
+            conn.close()
+
+
+smtp_pool = SmtpConnectionPool()
+
+
+def build_message(account: dict, to_email: str, subject: str, html: str, text: Optional[str] = None) -> MIMEMultipart:
+    msg = MIMEMultipart('alternative')
+    msg['From'] = account['email']
+    msg['To'] = to_email
+    msg['Subject'] = subject
+    part1 = MIMEText(text or '', 'plain')
+    part2 = MIMEText(html, 'html')
+    msg.attach(part1)
+    msg.attach(part2)
+    return msg
+
+
+def _should_reconnect(error: Exception, data_started: bool = False) -> bool:
+    """Whether a failed send can be retried on a fresh session without risking a duplicate"""
+    if isinstance(error, smtplib.SMTPResponseException):
+        # A 421 reply means the server did not take the message, whatever the stage
+        return error.smtp_code in RECONNECT_CODES
+    if isinstance(error, (smtplib.SMTPServerDisconnected, socket.timeout, ConnectionError)):
+        # Without a reply to DATA the provider may already have accepted the message
+        return not data_started
+    return False
+
+
+def _send_envelope(conn: smtplib.SMTP, from_email: str, to_email: str):
+    """MAIL FROM and RCPT TO, as sendmail does them; nothing has been handed over yet"""
+    conn.ehlo_or_helo_if_needed()
+    code, resp = conn.mail(from_email)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, resp, from_email)
+    code, resp = conn.rcpt(to_email)
+    if code in RECONNECT_CODES:
+        raise smtplib.SMTPResponseException(code, resp)
+    if code not in (250, 251):
+        raise smtplib.SMTPRecipientsRefused({to_email: (code, resp)})
+
+
+def _send_data(conn: smtplib.SMTP, payload: str):
+    code, resp = conn.data(payload)
+    if code != 250:
+        raise smtplib.SMTPDataError(code, resp)
+
+
 class SmtpSender:
-    def __init__(self, host: str, port: int, username: str, password: str, starttls: bool = True):
+    def __init__(self, host: str, port: int, username: str, password: str, starttls: bool = True,
+                 pool: Optional[SmtpConnectionPool] = None):
         self.host = host
         self.port = port
         self.username = username
         self.password = password
         self.starttls = starttls
+        self.pool = pool if pool is not None else (smtp_pool if settings.SMTP_POOL_ENABLED else None)
 
     def send(self, account: dict, to_email: str, subject: str, html: str, text: Optional[str] = None):
-        msg = MIMEMultipart('alternative')
-        msg['From'] = account['email']
-        msg['To'] = to_email
-        msg['Subject'] = subject
-        part1 = MIMEText(text or '', 'plain')
-        part2 = MIMEText(html, 'html')
-        msg.attach(part1)
-        msg.attach(part2)
-        try:
-            with smtplib.SMTP(self.host, self.port, timeout=10) as server:
-                if self.starttls:
-                    server.starttls()
-                server.login(self.username, self.password)
-                server.sendmail(account['email'], to_email, msg.as_string())
+        msg = build_message(account, to_email, subject, html, text)
+        try:
+            if self.pool is None:
+                with smtplib.SMTP(self.host, self.port, timeout=settings.SMTP_TIMEOUT_SECONDS) as server:
+                    if self.starttls:
+                        server.starttls()
+                    server.login(self.username, self.password)
+                    server.sendmail(account['email'], to_email, msg.as_string())
+                return
+            self._send_pooled(account['email'], to_email, msg.as_string())
         except Exception as e:
             logging.error(f"SMTP send failed: {e}")
             raise
+
+    def _send_pooled(self, from_email: str, to_email: str, payload: str):
+        conn = self.pool.acquire(self.host, self.port, self.username, self.password, self.starttls)
+        data_started = False
+        try:
+            _send_envelope(conn, from_email, to_email)
+            data_started = True
+            _send_data(conn, payload)
+        except Exception as e:
+            self.pool.discard(conn)
+            if not _should_reconnect(e, data_started):
+                raise
+            # The session died between the NOOP check and DATA - retry once on a fresh one
+            conn = self.pool.reconnect(self.host, self.port, self.username, self.password, self.starttls)
+            try:
+                conn.sendmail(from_email, to_email, payload)
+            except Exception:
+                self.pool.discard(conn)
+                raise
+        self.pool.release(self.host, self.port, self.username, conn)
+
+
+class AsyncSmtpConnectionPool:
+    """SmtpConnectionPool for the async engine: aiosmtplib sessions reused per (smtp_host, port, username)
+
+    Sessions belong to the event loop that opened them, so a pool must stay on one loop.
+    """
+
+    def __init__(self, max_idle_seconds: int = None, timeout: int = None):
+        if aiosmtplib is None:
+            raise RuntimeError("WORKER_ENGINE=async needs the aiosmtplib package: pip install aiosmtplib")
+        self.max_idle_seconds = max_idle_seconds if max_idle_seconds is not None else settings.SMTP_POOL_MAX_IDLE_SECONDS
+        self.timeout = timeout if timeout is not None else settings.SMTP_TIMEOUT_SECONDS
+        self._idle: Dict[PoolKey, List[Tuple["aiosmtplib.SMTP", float]]] = {}
+        self.stats = {"hits": 0, "misses": 0, "reconnects": 0, "expired": 0, "stale": 0}
+
+    async def acquire(self, host: str, port: int, username: str, password: str, starttls: bool = True):
+        key = (host, port, username)
+        idle = self._idle.get(key)
+        while idle:
+            conn, last_used = idle.pop()
+            if time.monotonic() - last_used > self.max_idle_seconds:
+                self.stats["expired"] += 1
+                await self._close(conn)
+                continue
+            if await self._is_alive(conn):
+                self.stats["hits"] += 1
+                return conn
+            self.stats["stale"] += 1
+            await self._close(conn)
+        self.stats["misses"] += 1
+        return await self._connect(host, port, username, password, starttls)
+
+    async def reconnect(self, host: str, port: int, username: str, password: str, starttls: bool = True):
+        self.stats["reconnects"] += 1
+        return await self._connect(host, port, username, password, starttls)
+
+    def release(self, host: str, port: int, username: str, conn):
+        self._idle.setdefault((host, port, username), []).append((conn, time.monotonic()))
+
+    async def discard(self, conn):
+        await self._close(conn)
+
+    async def prune(self):
+        # Split the idle lists without awaiting, so sessions released by other batches
+        # while the expired ones are being closed are neither lost nor iterated over
+        now = time.monotonic()
+        expired = []
+        for key in list(self._idle):
+            keep = []
+            for conn, last_used in self._idle[key]:
+                if now - last_used > self.max_idle_seconds:
+                    expired.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            if keep:
+                self._idle[key] = keep
+            else:
+                del self._idle[key]
+        self.stats["expired"] += len(expired)
+        for conn in expired:
+            await self._close(conn)
+
+    async def close_all(self):
+        conns = [conn for idle in self._idle.values() for conn, _ in idle]
+        self._idle.clear()
+        for conn in conns:
+            await self._close(conn)
+
+    def idle_count(self) -> int:
+        return sum(len(idle) for idle in self._idle.values())
+
+    async def _connect(self, host: str, port: int, username: str, password: str, starttls: bool):
+        conn = aiosmtplib.SMTP(hostname=host, port=port, timeout=self.timeout, start_tls=False)
+        await conn.connect()
+        try:
+            if starttls:
+                await conn.starttls()
+            await conn.login(username, password)
+        except Exception:
+            await self._close(conn)
+            raise
+        return conn
+
+    @staticmethod
+    async def _is_alive(conn) -> bool:
+        try:
+            return (await conn.noop()).code == 250
+        except (aiosmtplib.SMTPException, OSError):
+            return False
+
+    @staticmethod
+    async def _close(conn):
+        try:
+            await conn.quit()
+        except (aiosmtplib.SMTPException, OSError):
+            conn.close()
+
+
+def _should_reconnect_async(error: Exception, data_started: bool = False) -> bool:
+    if isinstance(error, aiosmtplib.SMTPResponseException):
+        return error.code in RECONNECT_CODES
+    if isinstance(error, (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPTimeoutError,
+                          asyncio.TimeoutError, ConnectionError)):
+        return not data_started
+    return False
+
+
+class AsyncSmtpSender:
+    """SmtpSender for the async engine; always pooled, same retry-once-on-reconnect rule"""
+
+    def __init__(self, host: str, port: int, username: str, password: str, starttls: bool = True,
+                 pool: AsyncSmtpConnectionPool = None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.pool = pool
+
+    async def send(self, account: dict, to_email: str, subject: str, html: str, text: Optional[str] = None):
+        payload = build_message(account, to_email, subject, html, text).as_string()
+        conn = await self.pool.acquire(self.host, self.port, self.username, self.password, self.starttls)
+        data_started = False
+        try:
+            # sendmail's steps, split so a failure once DATA is under way isn't retried
+            await conn.mail(account['email'])
+            await conn.rcpt(to_email)
+            data_started = True
+            await conn.data(payload)
+        except Exception as e:
+            await self.pool.discard(conn)
+            if not _should_reconnect_async(e, data_started):
+                logging.error(f"SMTP send failed: {e}")
+                raise
+            conn = await self.pool.reconnect(self.host, self.port, self.username, self.password, self.starttls)
+            try:
+                await conn.sendmail(account['email'], [to_email], payload)
+            except Exception as e:
+                await self.pool.discard(conn)
+                logging.error(f"SMTP send failed: {e}")
+                raise
+        self.pool.release(self.host, self.port, self.username, conn)
@@ -1,13 +1,17 @@
 import structlog
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timezone, timedelta
-from bson import ObjectId
+from typing import List, Optional
 from app.db.client import db
-from app.db.dao_leads import get_due_leads, update_lead_progress
-from app.db.dao_sequences import get_campaign_sequence, get_sequence_step_by_id
-from app.db.dao_templates import get_template
-from app.db.dao_accounts import get_email_account, get_email_general_settings, get_email_campaign_settings
-from app.db.dao_activities import insert_activity
+from app.db.dao_leads import get_due_leads, claim_due_leads, release_lead_claims, new_claim_id, LeadUpdateBatch, due_fields
+from app.db.dao_sequences import get_campaign_sequence
+from app.db.dao_activities import insert_activity, flush_activities
+from app.db.dao_runtime import increment_campaign_sent
+from app.domain import metrics
 from app.domain.arbiter import AccountArbiter
+from app.domain.campaign_context import CampaignContext
+from app.domain.suppression import suppression_filter
 from app.domain.templating import render_template, append_signature
 from app.domain.transport import SmtpSender
 from app.config.settings import settings
@@ -16,19 +20,21 @@ log = structlog.get_logger()
 
 _account_rr_cache = {}
 
-def run_once(campaign_id: str, batch_size: int, dry_run: bool = False, since: datetime = None):
-    """Process a batch of leads for a campaign"""
-    now_utc = datetime.now(timezone.utc)
-    leads = get_due_leads(campaign_id, now_utc, batch_size)
-    if not leads:
-        log.info("worker.no_due_leads", campaign_id=campaign_id)
-        return
+def run_once(campaign_id: str, batch_size: int, dry_run: bool = False, since: datetime = None,
+             deadline: float = None, concurrency: int = None):
+    """Process a batch of leads for a campaign
     
+    deadline is a time.monotonic() value; once passed, no further leads are started.
+    With concurrency > 1 up to that many accounts are reserved at once and their
+    sends run in parallel, each reservation committed or rolled back on its own.
+    With LEAD_LEASES_ENABLED the batch's leads are leased first, so several
+    worker processes can run the same campaign without sending a step twice.
+    """
+    now_utc = datetime.now(timezone.utc)
     sequence = get_campaign_sequence(campaign_id)
     if not sequence:
         log.error("worker.no_sequence", campaign_id=campaign_id)
         return
-    steps = sequence.get("steps", [])
     
     # Get email accounts from campaign_options
     from app.db.dao_campaigns import get_campaign_options
@@ -41,296 +47,440 @@ def run_once(campaign_id: str, batch_size: int, dry_run: bool = False, since: da
         log.error("worker.no_accounts", campaign_id=campaign_id)
         return
     
+    claim_id = new_claim_id() if settings.LEAD_LEASES_ENABLED else None
+    with metrics.timer("due_leads"):
+        if claim_id:
+            leads = claim_due_leads(campaign_id, now_utc, batch_size, claim_id)
+        else:
+            leads = get_due_leads(campaign_id, now_utc, batch_size)
+    if not leads:
+        log.info("worker.no_due_leads", campaign_id=campaign_id)
+        return
+    
+    # Prefetch steps, templates, accounts and account settings for the whole batch
+    with metrics.timer("load_context"):
+        context = CampaignContext.load(campaign_id, sequence, email_accounts)
+        if settings.SUPPRESSION_ENABLED:
+            suppression_filter.refresh()
+    
     # Round-robin account selection per campaign
     rr = _account_rr_cache.setdefault(campaign_id, list(email_accounts))
     arbiter = AccountArbiter(db)
+    concurrency = max(1, concurrency or settings.WORKER_SEND_CONCURRENCY)
+    executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="send") if concurrency > 1 else None
     
+    lead_updates = LeadUpdateBatch()
     processed = 0
+    pending = iter(leads)
+    exhausted = False
     
-    for lead in leads:
-        progress = lead.get("progress", {})
-        current_step_order = progress.get("current_step_order", 1)
-        lead_id = str(lead["_id"]) if "_id" in lead else None
-        
-        # Find step info from the steps array in sequence
-        step_info = next((s for s in steps if s.get("order") == current_step_order), None)
-        if not step_info:
-            # Completed sequence
-            update_lead_progress(lead_id, {**progress, "stopped": True, "reason": "completed"})
-            log.info("worker.sequence_completed", campaign_id=campaign_id, lead_id=lead_id)
-            continue
-        
-        # Get the actual step document using the step id
-        step_id = step_info.get("id")
-        step = get_sequence_step_by_id(step_id) if step_id else None
-        if not step:
-            log.error("worker.no_step_document", campaign_id=campaign_id, lead_id=lead_id, step_id=step_id)
-            continue
-            
-        template_id = step.get("active_template")
-        if not template_id:
-            log.error("worker.no_template_id", campaign_id=campaign_id, lead_id=lead_id, step_order=current_step_order, step=step)
-            continue
-        template = get_template(template_id)
-        if not template:
-            log.error("worker.no_template", campaign_id=campaign_id, lead_id=lead_id, template_id=template_id)
-            continue
-            
-        # Handle lead_data - it can be array or object
-        lead_data_raw = lead.get("lead_data", {})
-        if isinstance(lead_data_raw, list) and lead_data_raw:
-            # For lead_data arrays, we need to process each recipient separately
-            # Check which recipients haven't been processed for this step yet
-            progress = lead.get("progress", {})
-            current_step_order = progress.get("current_step_order", 1)
-            processed_recipients = progress.get("processed_recipients", {})
+    try:
+        while not exhausted:
+            if deadline is not None and time.monotonic() >= deadline:
+                log.info("worker.time_budget_exhausted", campaign_id=campaign_id, processed=processed)
+                break
             
-            # Find recipients that haven't been processed for current step
-            recipients_to_process = []
-            for i, recipient_data in enumerate(lead_data_raw):
-                recipient_key = f"step_{current_step_order}_recipient_{i}"
-                if recipient_key not in processed_recipients:
-                    recipients_to_process.append((i, recipient_data))
+            # Pair up to `concurrency` leads with distinct reserved accounts
+            jobs = []
+            while len(jobs) < concurrency:
+                lead = next(pending, None)
+                if lead is None:
+                    exhausted = True
+                    break
+                job = _prepare_job(context, lead, lead_updates)
+                # Suppressed recipients are settled here and never take a reservation
+                if job and not _skip_if_suppressed(context, job, now_utc, lead_updates):
+                    jobs.append(job)
+            if not jobs:
+                break
             
-            if not recipients_to_process:
-                # All recipients for this step have been processed
-                continue
-                
-            # Process the next recipient in line
-            recipient_index, lead_data = recipients_to_process[0]
-        else:
-            lead_data = lead_data_raw
-            recipient_index = 0  # Single recipient case
+            reservations = _reserve_accounts(rr, context, arbiter, now_utc, len(jobs))
+            wave = list(zip(jobs, reservations))
+            if len(reservations) < len(jobs):
+                log.info("worker.no_account_available", campaign_id=campaign_id, lead_id=jobs[len(reservations)]["lead_id"])
+                metrics.inc("emailbot_no_account_available_total", campaign_id=campaign_id)
+                exhausted = True  # Stop processing this batch if no accounts available
             
-        # Account selection with round-robin (do this before template rendering to get account context)
-        granted = False
-        selected_email_id = None
-        selected_account = None
+            if executor and len(wave) > 1:
+                futures = [executor.submit(_process_job, context, arbiter, job, reservation, now_utc, dry_run, lead_updates)
+                           for job, reservation in wave]
+                processed += sum(1 for f in futures if f.result())
+            else:
+                processed += sum(1 for job, reservation in wave
+                                 if _process_job(context, arbiter, job, reservation, now_utc, dry_run, lead_updates))
+    finally:
+        if executor:
+            executor.shutdown(wait=True)
+        # Each step runs even if an earlier one raised: the batch's sends have gone out
+        try:
+            # Progress for the whole batch goes out in one bulk_write
+            with metrics.timer("progress_write"):
+                lead_updates.flush()
+        finally:
+            try:
+                with metrics.timer("activity_write"):
+                    flush_activities()
+            finally:
+                try:
+                    if not dry_run:
+                        # processed only counts committed sends outside dry runs
+                        increment_campaign_sent(campaign_id, now_utc.strftime('%Y-%m-%d'), processed)
+                finally:
+                    if claim_id:
+                        # Sent, skipped and never-reached leads alike
+                        with metrics.timer("release_leads"):
+                            release_lead_claims([lead["_id"] for lead in leads], claim_id)
+    
+    log.info("worker.batch_complete", campaign_id=campaign_id, processed=processed,
+             total_leads=len(leads), dry_run=dry_run)
+
+def _prepare_job(context: CampaignContext, lead: dict, lead_updates: LeadUpdateBatch) -> Optional[dict]:
+    """Work out step, template and next recipient for a lead, or None to skip it"""
+    campaign_id = context.campaign_id
+    progress = lead.get("progress", {})
+    current_step_order = progress.get("current_step_order", 1)
+    lead_id = str(lead["_id"]) if "_id" in lead else None
+    
+    # Find step info from the steps array in sequence
+    step_info = context.step_info(current_step_order)
+    if not step_info:
+        # Completed sequence
+        lead_updates.set(lead_id, {"progress.stopped": True, "progress.reason": "completed", **due_fields({"stopped": True})})
+        log.info("worker.sequence_completed", campaign_id=campaign_id, lead_id=lead_id)
+        return None
+    
+    # Get the actual step document using the step id
+    step_id = step_info.get("id")
+    step = context.step(step_id)
+    if not step:
+        log.error("worker.no_step_document", campaign_id=campaign_id, lead_id=lead_id, step_id=step_id)
+        return None
+    
+    template_id = step.get("active_template")
+    if not template_id:
+        log.error("worker.no_template_id", campaign_id=campaign_id, lead_id=lead_id, step_order=current_step_order, step=step)
+        return None
+    template = context.template(template_id)
+    if not template:
+        log.error("worker.no_template", campaign_id=campaign_id, lead_id=lead_id, template_id=template_id)
+        return None
+    
+    # Handle lead_data - it can be array or object
+    lead_data_raw = lead.get("lead_data", {})
+    if isinstance(lead_data_raw, list) and lead_data_raw:
+        # For lead_data arrays, we need to process each recipient separately
+        # Check which recipients haven't been processed for this step yet
+        processed_recipients = progress.get("processed_recipients", {})
         
-        for _ in range(len(rr)):
-            email_id = rr.pop(0)
-            rr.append(email_id)
-            
-            account = get_email_account(email_id)
-            if not account:
-                log.warning("worker.account_not_found", email_id=email_id)
-                continue
-                
-            settings_doc = get_email_campaign_settings(email_id)
-            if not settings_doc:
-                log.warning("worker.no_account_settings", email_id=email_id)
-                continue
-                
-            daily_limit = int(settings_doc.get("daily_limit", 0))
-            min_wait = int(settings_doc.get("min_wait_time", 0))
-            
-            if not arbiter.reserve(email_id, now_utc, daily_limit, min_wait):
-                continue
-                
-            granted = True
-            selected_email_id = email_id
-            selected_account = account
-            break
-            
-        if not granted:
-            log.info("worker.no_account_available", campaign_id=campaign_id, lead_id=lead_id)
-            break  # Stop processing this batch if no accounts available
-            
-        # Get account signature and general settings for template context
-        sig_doc = get_email_general_settings(selected_email_id)
+        # Find recipients that haven't been processed for current step
+        recipients_to_process = []
+        for i, recipient_data in enumerate(lead_data_raw):
+            recipient_key = f"step_{current_step_order}_recipient_{i}"
+            if recipient_key not in processed_recipients:
+                recipients_to_process.append((i, recipient_data))
         
-        # Enhance lead_data with account/sender information
-        enhanced_lead_data = {
-            **lead_data,
-            # Account signature and sender info
-            'account_signature': sig_doc.get("signature", "") if sig_doc else "",
-            'sender_name': f"{sig_doc.get('first_name', '')} {sig_doc.get('last_name', '')}".strip() if sig_doc else "",
-            'sender_first_name': sig_doc.get("first_name", "") if sig_doc else "",
-            'sender_last_name': sig_doc.get("last_name", "") if sig_doc else "",
-            'sender_email': selected_account.get("email", ""),
-            # Custom variables for sender (to avoid confusion with recipient names)
-            'first_name_me': sig_doc.get("first_name", "") if sig_doc else "",
-            'last_name_me': sig_doc.get("last_name", "") if sig_doc else "",
-            # Campaign context
-            'campaign_id': campaign_id,
-            'step_order': current_step_order,
-        }
-            
-        try:
-            # Use 'content' field from template since that's what your schema has
-            html_content = template.get("html") or template.get("content", "")
-            subject, html = render_template(template["subject"], html_content, enhanced_lead_data)
-            
-            if not subject.strip():
-                log.warning("worker.empty_subject", campaign_id=campaign_id, lead_id=lead_id, template_id=template_id)
-                
-        except Exception as e:
-            log.error("worker.template_error", campaign_id=campaign_id, lead_id=lead_id, 
-                     template_id=template_id, error=str(e), 
-                     available_fields=list(enhanced_lead_data.keys()),
-                     template_subject=template.get("subject", "")[:100])
-            arbiter.rollback(selected_email_id, now_utc)
-            continue
-            
-        # Get signature and append to email (if not already in template)
-        signature = sig_doc.get("signature", "") if sig_doc else ""
-        # Only append signature if it's not already included via {{account_signature}} in template
-        if signature and "{{account_signature}}" not in template.get("content", ""):
-            html = append_signature(html, signature)
-            
-        to_email = enhanced_lead_data.get("email")
+        if not recipients_to_process:
+            # All recipients for this step have been processed
+            return None
         
-        if not to_email:
-            log.error("worker.no_email_address", campaign_id=campaign_id, lead_id=lead_id)
-            arbiter.rollback(selected_email_id, now_utc)
+        # Process the next recipient in line
+        recipient_index, lead_data = recipients_to_process[0]
+    else:
+        lead_data = lead_data_raw
+        recipient_index = 0  # Single recipient case
+    
+    return {
+        "lead": lead,
+        "lead_id": lead_id,
+        "step": step,
+        "step_order": current_step_order,
+        "template": template,
+        "template_id": template_id,
+        "recipient_index": recipient_index,
+        "lead_data": lead_data,
+    }
+
+def _skip_if_suppressed(context: CampaignContext, job: dict, now_utc: datetime, lead_updates: LeadUpdateBatch) -> bool:
+    """Record the job's recipient as suppressed and move the lead on; False if it may be sent to"""
+    if not settings.SUPPRESSION_ENABLED:
+        return False
+    to_email = job["lead_data"].get("email")
+    if not to_email or not suppression_filter.contains(to_email):
+        return False
+    
+    lead_data_raw = job["lead"].get("lead_data", {})
+    recipients = lead_data_raw if isinstance(lead_data_raw, list) else [lead_data_raw]
+    if all(suppression_filter.contains(recipient.get("email") or "") for recipient in recipients):
+        # Nobody on this lead can be written to again
+        stopped = {"stopped": True, "reason": "suppressed", "stopped_at": now_utc}
+        update = {f"progress.{field}": value for field, value in stopped.items()}
+        update.update(due_fields(stopped))
+        if isinstance(lead_data_raw, list):
+            update.update({f"lead_data.{i}.status": "suppressed" for i in range(len(lead_data_raw))})
+        lead_updates.set(job["lead_id"], update)
+    else:
+        entry = {"processed_at": now_utc, "email": to_email, "suppressed": True}
+        _advance_lead(context, job, entry, {"status": "suppressed"}, now_utc, 0, lead_updates)
+    
+    metrics.inc("emailbot_suppressed_total", campaign_id=context.campaign_id)
+    log.info("worker.recipient_suppressed", campaign_id=context.campaign_id, lead_id=job["lead_id"],
+             step_order=job["step_order"], to_email=to_email)
+    return True
+
+def _reserve_accounts(rr: list, context: CampaignContext, arbiter: AccountArbiter, now_utc: datetime,
+                      count: int) -> List[dict]:
+    """Reserve up to `count` free accounts, preferring round-robin order"""
+    with metrics.timer("reserve"):
+        claimed = arbiter.reserve_many(_daily_limits(rr, context), now_utc, count)
+    return _reservations(rr, context, claimed)
+
+def _daily_limits(rr: list, context: CampaignContext) -> dict:
+    """email_id -> daily limit for usable accounts, in round-robin order"""
+    daily_limits = {}
+    for email_id in rr:
+        account = context.account(email_id)
+        if not account:
+            log.warning("worker.account_not_found", email_id=email_id)
             continue
         
-        if dry_run:
-            log.info("worker.dry_run_send", campaign_id=campaign_id, lead_id=lead_id, 
-                    email_id=selected_email_id, to_email=to_email, subject=subject)
-            arbiter.rollback(selected_email_id, now_utc)
-            processed += 1
+        settings_doc = context.email_campaign_settings(email_id)
+        if not settings_doc:
+            log.warning("worker.no_account_settings", email_id=email_id)
             continue
-            
-        # Send the email
-        try:
-            sender = SmtpSender(
-                host=selected_account["smtp_host"],
-                port=int(selected_account["smtp_port"]),
-                username=selected_account["smtp_username"],
-                password=selected_account.get("smtp_passcode") or selected_account.get("smtp_password"),
-                starttls=settings.SMTP_STARTTLS
-            )
+        
+        daily_limits[email_id] = int(settings_doc.get("daily_limit", 0))
+    return daily_limits
+
+def _reservations(rr: list, context: CampaignContext, claimed: List[str]) -> List[dict]:
+    reservations = []
+    for email_id in claimed:
+        # Reserved accounts go to the back of the round-robin queue
+        rr.remove(email_id)
+        rr.append(email_id)
+        min_wait = int(context.email_campaign_settings(email_id).get("min_wait_time", 0))
+        reservations.append({"email_id": email_id, "account": context.account(email_id), "min_wait": min_wait})
+    return reservations
+
+def _process_job(context: CampaignContext, arbiter: AccountArbiter, job: dict, reservation: dict,
+                 now_utc: datetime, dry_run: bool, lead_updates: LeadUpdateBatch) -> bool:
+    """Render and send one email on a reserved account; True if it counts as processed"""
+    campaign_id = context.campaign_id
+    lead_id = job["lead_id"]
+    current_step_order = job["step_order"]
+    selected_email_id = reservation["email_id"]
+    selected_account = reservation["account"]
+    
+    with metrics.timer("render"):
+        rendered = _render_job(context, job, reservation)
+    if rendered is None:
+        arbiter.rollback(selected_email_id, now_utc, refund_tokens=True)
+        return False
+    to_email, subject, html = rendered
+    
+    if dry_run:
+        log.info("worker.dry_run_send", campaign_id=campaign_id, lead_id=lead_id,
+                email_id=selected_email_id, to_email=to_email, subject=subject)
+        arbiter.rollback(selected_email_id, now_utc, refund_tokens=True)
+        return True
+    
+    # Send the email
+    try:
+        sender = SmtpSender(
+            host=selected_account["smtp_host"],
+            port=int(selected_account["smtp_port"]),
+            username=selected_account["smtp_username"],
+            password=selected_account.get("smtp_passcode") or selected_account.get("smtp_password"),
+            starttls=settings.SMTP_STARTTLS
+        )
+        with metrics.timer("smtp"):
             sender.send(selected_account, to_email, subject, html)
-            
-            # Commit the send
-            min_wait = int(get_email_campaign_settings(selected_email_id).get("min_wait_time", 0))
-            arbiter.commit(selected_email_id, now_utc, min_wait)
-            
-            # Update lead progress - track per-recipient processing
-            progress = lead.get("progress", {})
-            current_step_order = progress.get("current_step_order", 1)
-            processed_recipients = progress.get("processed_recipients", {})
-            
-            # Mark this recipient as processed for this step
-            recipient_key = f"step_{current_step_order}_recipient_{recipient_index}"
-            processed_recipients[recipient_key] = {
-                "processed_at": now_utc,
-                "email": to_email,
-                "template_id": template_id
+        
+        # Commit the send
+        with metrics.timer("commit"):
+            arbiter.commit(selected_email_id, now_utc, reservation["min_wait"])
+            insert_activity(_record_sent(context, job, reservation, to_email, now_utc, lead_updates))
+        metrics.inc("emailbot_emails_sent_total", campaign_id=campaign_id)
+        
+        log.info("worker.sent", campaign_id=campaign_id, lead_id=lead_id,
+                email_id=selected_email_id, step_order=current_step_order,
+                to_email=to_email, subject=subject)
+        return True
+    
+    except Exception as e:
+        arbiter.rollback(selected_email_id, now_utc)
+        insert_activity(_error_activity(context, job, reservation, now_utc, e))
+        metrics.inc("emailbot_send_errors_total", campaign_id=campaign_id)
+        log.error("worker.send_error", campaign_id=campaign_id, lead_id=lead_id,
+                 email_id=selected_email_id, error=str(e))
+        return False
+
+def _render_job(context: CampaignContext, job: dict, reservation: dict) -> Optional[tuple]:
+    """(to_email, subject, html) for a job on its reserved account, or None if it can't be sent"""
+    campaign_id = context.campaign_id
+    lead_id = job["lead_id"]
+    template = job["template"]
+    template_id = job["template_id"]
+    current_step_order = job["step_order"]
+    selected_email_id = reservation["email_id"]
+    selected_account = reservation["account"]
+    
+    # Get account signature and general settings for template context
+    sig_doc = context.email_general_settings(selected_email_id)
+    
+    # Enhance lead_data with account/sender information
+    enhanced_lead_data = {
+        **job["lead_data"],
+        # Account signature and sender info
+        'account_signature': sig_doc.get("signature", "") if sig_doc else "",
+        'sender_name': f"{sig_doc.get('first_name', '')} {sig_doc.get('last_name', '')}".strip() if sig_doc else "",
+        'sender_first_name': sig_doc.get("first_name", "") if sig_doc else "",
+        'sender_last_name': sig_doc.get("last_name", "") if sig_doc else "",
+        'sender_email': selected_account.get("email", ""),
+        # Custom variables for sender (to avoid confusion with recipient names)
+        'first_name_me': sig_doc.get("first_name", "") if sig_doc else "",
+        'last_name_me': sig_doc.get("last_name", "") if sig_doc else "",
+        # Campaign context
+        'campaign_id': campaign_id,
+        'step_order': current_step_order,
+    }
+    
+    try:
+        # Use 'content' field from template since that's what your schema has
+        html_content = template.get("html") or template.get("content", "")
+        subject, html = render_template(template["subject"], html_content, enhanced_lead_data, template_id=str(template_id))
+        
+        if not subject.strip():
+            log.warning("worker.empty_subject", campaign_id=campaign_id, lead_id=lead_id, template_id=template_id)
+    
+    except Exception as e:
+        metrics.inc("emailbot_template_errors_total", campaign_id=campaign_id)
+        log.error("worker.template_error", campaign_id=campaign_id, lead_id=lead_id,
+                 template_id=template_id, error=str(e),
+                 available_fields=list(enhanced_lead_data.keys()),
+                 template_subject=template.get("subject", "")[:100])
+        return None
+    
+    # Get signature and append to email (if not already in template)
+    signature = sig_doc.get("signature", "") if sig_doc else ""
+    # Only append signature if it's not already included via {{account_signature}} in template
+    if signature and "{{account_signature}}" not in template.get("content", ""):
+        html = append_signature(html, signature)
+    
+    to_email = enhanced_lead_data.get("email")
+    
+    if not to_email:
+        log.error("worker.no_email_address", campaign_id=campaign_id, lead_id=lead_id)
+        return None
+    return to_email, subject, html
+
+def _error_activity(context: CampaignContext, job: dict, reservation: dict, now_utc: datetime, error: Exception) -> dict:
+    return {
+        "campaign_id": context.campaign_id,
+        "lead_id": job["lead_id"],
+        "email_id": reservation["email_id"],
+        "type": "error",
+        "meta": {"step_order": job["step_order"], "template_id": job["template_id"], "reason": str(error)},
+        "created_at": now_utc
+    }
+
+def _advance_lead(context: CampaignContext, job: dict, entry: dict, recipient_fields: dict, now_utc: datetime,
+                  min_wait_minutes: int, lead_updates: LeadUpdateBatch):
+    """Record the job's recipient as processed for its step and move the lead's progress on"""
+    campaign_id = context.campaign_id
+    lead = job["lead"]
+    lead_id = job["lead_id"]
+    step = job["step"]
+    recipient_index = job["recipient_index"]
+    
+    # Update lead progress - track per-recipient processing
+    progress = lead.get("progress", {})
+    current_step_order = progress.get("current_step_order", 1)
+    processed_recipients = progress.get("processed_recipients", {})
+    
+    # Mark this recipient as processed for this step
+    recipient_key = f"step_{current_step_order}_recipient_{recipient_index}"
+    processed_recipients[recipient_key] = entry
+    # Only the changed paths are written, never the whole progress or lead_data array
+    update = {f"progress.processed_recipients.{recipient_key}": processed_recipients[recipient_key]}
+    
+    # Update recipient status in lead_data array
+    lead_data_raw = lead.get("lead_data", {})
+    
+    if isinstance(lead_data_raw, list) and recipient_index < len(lead_data_raw):
+        # Update the status for this specific recipient
+        update.update({f"lead_data.{recipient_index}.{field}": value for field, value in recipient_fields.items()})
+        log.info("worker.status_updated", campaign_id=campaign_id, lead_id=lead_id,
+                recipient_email=entry["email"], old_status="not_contacted", new_status=recipient_fields["status"])
+    
+    # Check if all recipients for this step have been processed
+    total_recipients = len(lead_data_raw) if isinstance(lead_data_raw, list) else 1
+    
+    recipients_processed_this_step = sum(1 for key in processed_recipients.keys()
+                                       if key.startswith(f"step_{current_step_order}_"))
+    
+    if recipients_processed_this_step >= total_recipients:
+        # All recipients processed for this step - check if there's a next step
+        next_step_order = current_step_order + 1
+        next_step_info = context.step_info(next_step_order)
+        
+        if next_step_info:
+            # There's a next step - advance to it
+            next_due = now_utc + timedelta(days=step.get("next_message_day", 0))
+            new_progress = {
+                "current_step_order": next_step_order,
+                "last_sent_at": now_utc,
+                "next_due_at": next_due
             }
-            
-            # Update recipient status in lead_data array
-            lead_data_raw = lead.get("lead_data", {})
-            updated_lead_data = lead_data_raw.copy() if isinstance(lead_data_raw, list) else lead_data_raw
-            
-            if isinstance(updated_lead_data, list) and recipient_index < len(updated_lead_data):
-                # Update the status for this specific recipient
-                updated_lead_data[recipient_index] = {
-                    **updated_lead_data[recipient_index],
-                    "status": "contacted",
-                    "last_contacted_at": now_utc,
-                    "last_step": current_step_order
-                }
-                log.info("worker.status_updated", campaign_id=campaign_id, lead_id=lead_id,
-                        recipient_email=to_email, old_status="not_contacted", new_status="contacted")
-            
-            # Check if all recipients for this step have been processed
-            total_recipients = len(lead_data_raw) if isinstance(lead_data_raw, list) else 1
-            
-            recipients_processed_this_step = sum(1 for key in processed_recipients.keys() 
-                                               if key.startswith(f"step_{current_step_order}_"))
-            
-            if recipients_processed_this_step >= total_recipients:
-                # All recipients processed for this step - check if there's a next step
-                next_step_order = current_step_order + 1
-                next_step_info = next((s for s in steps if s.get("order") == next_step_order), None)
-                
-                if next_step_info:
-                    # There's a next step - advance to it
-                    next_due = now_utc + timedelta(days=step.get("next_message_day", 0))
-                    new_progress = {
-                        **progress,
-                        "current_step_order": next_step_order,
-                        "last_sent_at": now_utc,
-                        "next_due_at": next_due,
-                        "processed_recipients": processed_recipients
-                    }
-                    log.info("worker.step_completed", campaign_id=campaign_id, lead_id=lead_id, 
-                            step_order=current_step_order, total_recipients=total_recipients,
-                            next_step=next_step_order)
-                else:
-                    # No more steps - mark sequence as completed
-                    new_progress = {
-                        **progress,
-                        "stopped": True,
-                        "reason": "completed",
-                        "last_sent_at": now_utc,
-                        "completed_at": now_utc,
-                        "processed_recipients": processed_recipients
-                    }
-                    log.info("worker.sequence_completed", campaign_id=campaign_id, lead_id=lead_id, 
-                            step_order=current_step_order, total_recipients=total_recipients)
-            else:
-                # More recipients to process for this step - set due time based on min_wait_time
-                settings_doc = get_email_campaign_settings(selected_email_id)
-                min_wait_minutes = int(settings_doc.get("min_wait_time", 0))
-                next_due = now_utc + timedelta(minutes=min_wait_minutes)
-                
-                new_progress = {
-                    **progress,
-                    "last_sent_at": now_utc,
-                    "next_due_at": next_due,
-                    "processed_recipients": processed_recipients
-                }
-                log.info("worker.recipient_processed", campaign_id=campaign_id, lead_id=lead_id, 
-                        step_order=current_step_order, 
-                        recipients_done=recipients_processed_this_step, 
-                        total_recipients=total_recipients,
-                        next_due_minutes=min_wait_minutes)
-            
-            # Update both progress and lead_data in a single operation
-            update_data = {"progress": new_progress}
-            if isinstance(updated_lead_data, list):
-                update_data["lead_data"] = updated_lead_data
-                
-            update_lead_progress(lead_id, new_progress)
-            
-            # Also update the lead_data separately if it was modified
-            if isinstance(updated_lead_data, list):
-                from bson import ObjectId
-                db.campaign_leads.update_one(
-                    {"_id": ObjectId(lead_id)},
-                    {"$set": {"lead_data": updated_lead_data}}
-                )
-            
-            # Log activity
-            insert_activity({
-                "campaign_id": campaign_id,
-                "lead_id": lead_id,
-                "email_id": selected_email_id,
-                "type": "sent",
-                "meta": {"step_order": current_step_order, "template_id": template_id},
-                "created_at": now_utc
-            })
-            
-            log.info("worker.sent", campaign_id=campaign_id, lead_id=lead_id, 
-                    email_id=selected_email_id, step_order=current_step_order, 
-                    to_email=to_email, subject=subject)
-            processed += 1
-            
-        except Exception as e:
-            arbiter.rollback(selected_email_id, now_utc)
-            insert_activity({
-                "campaign_id": campaign_id,
-                "lead_id": lead_id,
-                "email_id": selected_email_id,
-                "type": "error",
-                "meta": {"step_order": current_step_order, "template_id": template_id, "reason": str(e)},
-                "created_at": now_utc
-            })
-            log.error("worker.send_error", campaign_id=campaign_id, lead_id=lead_id, 
-                     email_id=selected_email_id, error=str(e))
-    
-    log.info("worker.batch_complete", campaign_id=campaign_id, processed=processed, 
-             total_leads=len(leads), dry_run=dry_run)
+            log.info("worker.step_completed", campaign_id=campaign_id, lead_id=lead_id,
+                    step_order=current_step_order, total_recipients=total_recipients,
+                    next_step=next_step_order)
+        else:
+            # No more steps - mark sequence as completed
+            new_progress = {
+                "stopped": True,
+                "reason": "completed",
+                "last_sent_at": now_utc,
+                "completed_at": now_utc
+            }
+            log.info("worker.sequence_completed", campaign_id=campaign_id, lead_id=lead_id,
+                    step_order=current_step_order, total_recipients=total_recipients)
+    else:
+        # More recipients to process for this step - set due time based on min_wait_time
+        next_due = now_utc + timedelta(minutes=min_wait_minutes)
+        
+        new_progress = {
+            "last_sent_at": now_utc,
+            "next_due_at": next_due
+        }
+        log.info("worker.recipient_processed", campaign_id=campaign_id, lead_id=lead_id,
+                step_order=current_step_order,
+                recipients_done=recipients_processed_this_step,
+                total_recipients=total_recipients,
+                next_due_minutes=min_wait_minutes)
+    
+    update.update({f"progress.{field}": value for field, value in new_progress.items()})
+    # Keep the indexed queue fields in step with progress
+    update.update(due_fields(new_progress))
+    lead_updates.set(lead_id, update)
+
+def _record_sent(context: CampaignContext, job: dict, reservation: dict, to_email: str, now_utc: datetime,
+                 lead_updates: LeadUpdateBatch) -> dict:
+    """Advance lead progress after a committed send; returns the sent activity to log"""
+    campaign_id = context.campaign_id
+    lead_id = job["lead_id"]
+    current_step_order = job["step_order"]
+    template_id = job["template_id"]
+    selected_email_id = reservation["email_id"]
+    
+    entry = {"processed_at": now_utc, "email": to_email, "template_id": template_id}
+    recipient_fields = {"status": "contacted", "last_contacted_at": now_utc, "last_step": current_step_order}
+    _advance_lead(context, job, entry, recipient_fields, now_utc, reservation["min_wait"], lead_updates)
+    
+    return {
+        "campaign_id": campaign_id,
+        "lead_id": lead_id,
+        "email_id": selected_email_id,
+        "type": "sent",
+        "meta": {"step_order": current_step_order, "template_id": template_id},
+        "created_at": now_utc
+    }
@@ -0,0 +1,177 @@
+import functools
+import socketserver
+import threading
+import time
+import pytest
+from bson import ObjectId
+from mongomock import MongoClient
+
+
+class _SmtpStubHandler(socketserver.StreamRequestHandler):
+    """Minimal SMTP dialogue: enough for smtplib login, sendmail and noop"""
+
+    def reply(self, line: str):
+        self.wfile.write((line + "\r\n").encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply("220 stub ESMTP")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw.decode().strip().upper()
+            if server.drop_next or (server.drop_on and command.startswith(server.drop_on)):
+                server.drop_next = False
+                server.drop_on = None
+                self.reply("421 closing connection")
+                return
+            if command.startswith(("EHLO", "HELO")):
+                self.reply("250-stub")
+                self.reply("250 AUTH PLAIN")
+            elif command.startswith("AUTH"):
+                with server.lock:
+                    server.logins += 1
+                self.reply("235 authenticated")
+            elif command.startswith("NOOP"):
+                self.reply("250 ok")
+            elif command.startswith("DATA"):
+                self.reply("354 go ahead")
+                while self.rfile.readline().rstrip(b"\r\n") != b".":
+                    pass
+                with server.lock:
+                    server.in_flight += 1
+                    server.max_in_flight = max(server.max_in_flight, server.in_flight)
+                try:
+                    if server.barrier is not None:
+                        # Holds each message until `parties` are in flight at once
+                        server.barrier.wait()
+                    if server.delay:
+                        time.sleep(server.delay)
+                except threading.BrokenBarrierError:
+                    self.reply("451 not enough concurrent sessions")
+                    continue
+                finally:
+                    with server.lock:
+                        server.in_flight -= 1
+                with server.lock:
+                    server.messages += 1
+                if server.hang_up_after_data:
+                    # Message taken, connection lost before the client sees the reply
+                    server.hang_up_after_data = False
+                    return
+                self.reply("250 queued")
+            elif command.startswith("QUIT"):
+                self.reply("221 bye")
+                return
+            else:
+                self.reply("250 ok")
+
+
+class SmtpStubServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpStubHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.logins = 0
+        self.messages = 0
+        self.drop_next = False
+        self.drop_on: str = None
+        self.hang_up_after_data = False
+        self.delay = 0
+        self.barrier: threading.Barrier = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+
+@pytest.fixture
+def smtp_server():
+    server = SmtpStubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def mongo_db(monkeypatch):
+    """mongomock database wired into every DAO module"""
+    from app.db import (dao_accounts, dao_activities, dao_campaigns, dao_leads, dao_rate_limits, dao_runtime,
+                        dao_sequences, dao_suppressions, dao_templates)
+    from app.db.cache import dao_cache
+    from app.domain import worker
+    from app.domain.availability import availability_index
+    from app.domain.rate_limit import rate_limiter
+    from app.domain.suppression import suppression_filter
+    db = MongoClient()['testdb']
+    for module in (dao_accounts, dao_activities, dao_campaigns, dao_leads, dao_rate_limits, dao_runtime,
+                   dao_sequences, dao_suppressions, dao_templates, worker):
+        monkeypatch.setattr(module, "db", db)
+    dao_cache.clear()
+    availability_index.clear()
+    rate_limiter.clear()
+    suppression_filter.clear()
+    worker._account_rr_cache.clear()
+    return db
+
+
+def make_campaign(db, smtp_port: int, accounts: int = 3, leads: int = 3, recipients: int = 1,
+                  daily_limit: int = 10, min_wait_time: int = 5, queue: bool = False) -> str:
+    """Active, always-open one-step campaign; every lead due now, `recipients` addresses per lead
+
+    Also seeds the benchmarks (benchmarks/scenarios.py), with limits sized to the run and no cooldown.
+    """
+    from app.db.dao_leads import due_fields
+    campaign_id = ObjectId()
+    step_id, template_id = ObjectId(), ObjectId()
+    email_ids = [ObjectId() for _ in range(accounts)]
+    db.campaigns.insert_one({"_id": campaign_id, "status": "active"})
+    db.campaign_schedule.insert_one({"campaign_id": str(campaign_id), "timezone": "UTC"})
+    db.campaign_sequences.insert_one({"campaign_id": str(campaign_id),
+                                      "steps": [{"order": 1, "id": str(step_id)}]})
+    db.sequence_steps.insert_one({"_id": step_id, "active_template": str(template_id), "next_message_day": 2})
+    db.templates.insert_one({"_id": template_id, "subject": "Hello {{name}}",
+                             "html": "<p>Hi {{name}},</p><p>A note about {{company}}.</p>"})
+    db.campaign_options.insert_one({"campaign_id": str(campaign_id), "daily_email_limit": daily_limit,
+                                    "email_accounts": [str(e) for e in email_ids]})
+    if accounts:
+        db.email_accounts.insert_many([
+            {"_id": email_id, "email": f"sender{i}@test.com", "smtp_host": "127.0.0.1", "smtp_port": smtp_port,
+             "smtp_username": "user", "smtp_password": "pass", "status": "active"}
+            for i, email_id in enumerate(email_ids)
+        ])
+        db.email_campaign_settings.insert_many([
+            {"email_id": str(email_id), "daily_limit": str(daily_limit), "min_wait_time": str(min_wait_time)}
+            for email_id in email_ids
+        ])
+
+    def recipient(i: int, r: int) -> dict:
+        email = f"lead{i}@test.com" if recipients == 1 else f"lead{i}-{r}@test.com"
+        return {"email": email, "name": f"Lead {i}", "company": f"Company {i % 97}"}
+    if leads:
+        db.campaign_leads.insert_many([
+            {"campaign_id": campaign_id,
+             "lead_data": recipient(i, 0) if recipients == 1 else [recipient(i, r) for r in range(recipients)],
+             "progress": {"current_step_order": 1, "stopped": False}, **due_fields(None)}
+            for i in range(leads)
+        ])
+    if queue:
+        db.campaign_queue.insert_one({"campaign_id": str(campaign_id)})
+    return str(campaign_id)
+
+
+@pytest.fixture
+def seed_campaign(mongo_db):
+    """make_campaign on the test database: seed_campaign(smtp_port, accounts=3, leads=3, ...)"""
+    return functools.partial(make_campaign, mongo_db)
+
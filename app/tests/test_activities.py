@@ -0,0 +1,71 @@
+from datetime import datetime, timezone
+from app.db.dao_activities import ActivityWriter
+
+
+def activity(i):
+    return {"campaign_id": "c1", "lead_id": f"l{i}", "email_id": "e1", "type": "sent",
+            "meta": {"step_order": 1}, "created_at": datetime.now(timezone.utc)}
+
+
+def test_buffer_flushes_by_size(mongo_db):
+    writer = ActivityWriter(max_batch=3, max_delay_seconds=60)
+    for i in range(4):
+        writer.add(activity(i))
+    assert mongo_db.campaign_activities.count_documents({}) == 3
+    writer.flush()
+    assert mongo_db.campaign_activities.count_documents({}) == 4
+    assert writer.stats["flushes"] == 2
+
+
+def test_spool_replayed_after_crash(mongo_db, tmp_path):
+    spool = str(tmp_path / "activities.jsonl")
+    crashed = ActivityWriter(max_batch=100, max_delay_seconds=60, spool_path=spool)
+    crashed.add(activity(1))
+    crashed.add(activity(2))
+    # Process dies here without flushing (its spool lock goes with it)
+    crashed.close(flush=False)
+    assert mongo_db.campaign_activities.count_documents({}) == 0
+
+    restarted = ActivityWriter(max_batch=100, max_delay_seconds=60, spool_path=spool)
+    assert restarted.recover() == 2
+    docs = list(mongo_db.campaign_activities.find())
+    assert sorted(d["lead_id"] for d in docs) == ["l1", "l2"]
+    assert isinstance(docs[0]["created_at"], datetime)
+
+
+def test_replay_does_not_duplicate_flushed_events(mongo_db, tmp_path):
+    spool = str(tmp_path / "activities.jsonl")
+    writer = ActivityWriter(max_batch=100, max_delay_seconds=60, spool_path=spool)
+    writer.add(activity(1))
+    lines = open(spool).read()
+    writer.flush()
+    # Crash between insert_many and truncating the spool
+    writer.close(flush=False)
+    with open(spool, "w") as f:
+        f.write(lines)
+
+    ActivityWriter(spool_path=spool).recover()
+    assert mongo_db.campaign_activities.count_documents({}) == 1
+
+
+def test_writers_sharing_a_spool_path_keep_their_own_events(mongo_db, tmp_path):
+    spool = str(tmp_path / "activities.jsonl")
+    first = ActivityWriter(max_batch=100, max_delay_seconds=60, spool_path=spool)
+    second = ActivityWriter(max_batch=100, max_delay_seconds=60, spool_path=spool)
+    first.add(activity(1))
+    second.add(activity(2))
+    # The second writer found the spool locked: it neither replayed nor truncated it
+    assert second.stats["replayed"] == 0
+    assert mongo_db.campaign_activities.count_documents({}) == 0
+
+    second.flush()
+    assert [d["lead_id"] for d in mongo_db.campaign_activities.find()] == ["l2"]
+    first.add(activity(3))
+    # first crashes: its spool survives second's flush and is replayed by the next writer
+    first.close(flush=False)
+    restarted = ActivityWriter(max_batch=100, max_delay_seconds=60, spool_path=spool)
+    assert restarted.recover() == 2
+    assert sorted(d["lead_id"] for d in mongo_db.campaign_activities.find()) == ["l1", "l2", "l3"]
+    # A live writer's spool is left alone
+    second.add(activity(4))
+    assert ActivityWriter(spool_path=spool).recover() == 0
@@ -41,3 +41,25 @@ def test_cooldown(db):
     assert arbiter.reserve(email_id, now_utc, daily_limit, min_wait)
     arbiter.commit(email_id, now_utc, min_wait)
     assert not arbiter.reserve(email_id, now_utc, daily_limit, min_wait)
+
+def test_reserve_many_claims_each_account_once(mongo_db):
+    arbiter = AccountArbiter(mongo_db)
+    now_utc = datetime.now(timezone.utc)
+    limits = {"e1": 5, "e2": 5, "e3": 5}
+    first = arbiter.reserve_many(limits, now_utc, 2)
+    second = arbiter.reserve_many(limits, now_utc, 2)
+    assert first == ["e1", "e2"]
+    assert second == ["e3"]
+    assert arbiter.reserve_any(limits, now_utc) is None
+
+def test_reserve_any_skips_capped_and_cooling_accounts(mongo_db):
+    arbiter = AccountArbiter(mongo_db)
+    now_utc = datetime.now(timezone.utc)
+    limits = {"capped": 1, "cooling": 5, "free": 5}
+    for email_id in ("capped", "cooling"):
+        assert arbiter.reserve(email_id, now_utc, limits[email_id], 10)
+        arbiter.commit(email_id, now_utc, 10)
+    assert arbiter.reserve_any(limits, now_utc) == "free"
+    arbiter.rollback("free", now_utc)
+    assert arbiter.reserve_any(limits, now_utc) == "free"
+    assert mongo_db.account_runtime_state.count_documents({}) == 3
@@ -0,0 +1,180 @@
+import asyncio
+import threading
+import time
+import pytest
+from pymongo.errors import BulkWriteError
+pytest.importorskip("aiosmtplib")  # the async extra: pip install .[async]
+from app.db import async_dao
+from app.domain.async_worker import AsyncEngine, run_once_async
+
+
+class FakeAsyncCursor:
+    def __init__(self, cursor):
+        self._cursor = cursor
+
+    def sort(self, *args, **kwargs):
+        self._cursor = self._cursor.sort(*args, **kwargs)
+        return self
+
+    def limit(self, n):
+        self._cursor = self._cursor.limit(n)
+        return self
+
+    async def to_list(self, length=None):
+        return list(self._cursor)
+
+
+class FakeAsyncCollection:
+    """Motor-shaped view of a mongomock collection"""
+
+    def __init__(self, collection):
+        self._collection = collection
+
+    def find(self, *args, **kwargs):
+        return FakeAsyncCursor(self._collection.find(*args, **kwargs))
+
+    def __getattr__(self, name):
+        method = getattr(self._collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class FakeAsyncDatabase:
+    def __init__(self, db):
+        self._db = db
+
+    def __getattr__(self, name):
+        return FakeAsyncCollection(self._db[name])
+
+
+def test_async_engine_sends_concurrently_with_same_bookkeeping(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    # Each message is held until all three are in flight
+    smtp_server.barrier = threading.Barrier(3, timeout=5)
+    campaign_id = seed_campaign(smtp_server.port)
+
+    asyncio.run(run_once_async(campaign_id, 3, concurrency=3, db=FakeAsyncDatabase(mongo_db)))
+
+    sent = list(mongo_db.campaign_activities.find({"type": "sent"}))
+    assert len(sent) == 3
+    assert len({a["email_id"] for a in sent}) == 3
+    assert smtp_server.messages == 3
+    assert smtp_server.max_in_flight == 3
+    for lead in mongo_db.campaign_leads.find():
+        assert lead["progress"]["stopped"] is True
+        assert lead["state"] == "stopped"
+        assert "claimed_by" not in lead
+    for state in mongo_db.account_runtime_state.find():
+        assert state["sent_count"] == 1
+        assert state["locked_until"] is None
+    assert mongo_db.campaign_runtime_state.find_one({"campaign_id": campaign_id})["sent_count"] == 3
+
+
+def test_async_send_failure_rolls_back_and_logs_error(mongo_db, seed_campaign, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    campaign_id = seed_campaign(smtp_port=1, accounts=1, leads=1)
+
+    asyncio.run(run_once_async(campaign_id, 1, db=FakeAsyncDatabase(mongo_db)))
+
+    assert mongo_db.campaign_activities.count_documents({"type": "error"}) == 1
+    state = mongo_db.account_runtime_state.find_one()
+    assert state["sent_count"] == 0
+    assert state["locked_until"] is None
+    lead = mongo_db.campaign_leads.find_one()
+    assert "last_sent_at" not in lead["progress"]
+    assert "claimed_by" not in lead
+
+
+def test_engine_runs_batches_for_sync_callers(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    monkeypatch.setattr(async_dao, "get_async_db", lambda: FakeAsyncDatabase(mongo_db))
+    campaign_id = seed_campaign(smtp_server.port, accounts=1, leads=2)
+    engine = AsyncEngine()
+
+    engine.run_once(campaign_id, 2)
+
+    # One account: the second lead waits for its cooldown
+    assert smtp_server.messages == 1
+    assert engine.pool.idle_count() == 1
+
+
+class FakeAsyncConnection:
+    def __init__(self, on_quit=None):
+        self.on_quit = on_quit
+        self.closed = False
+
+    async def quit(self):
+        await asyncio.sleep(0)
+        if self.on_quit:
+            self.on_quit()
+        self.closed = True
+
+
+def test_prune_keeps_sessions_released_while_closing_expired_ones():
+    from app.domain.transport import AsyncSmtpConnectionPool
+    pool = AsyncSmtpConnectionPool(max_idle_seconds=60)
+    fresh, other = FakeAsyncConnection(), FakeAsyncConnection()
+    # Another batch hands sessions back while prune is awaiting quit()
+    expired = FakeAsyncConnection(on_quit=lambda: (pool.release("smtp.a", 25, "a", fresh),
+                                                   pool.release("smtp.b", 25, "b", other)))
+    pool._idle[("smtp.a", 25, "a")] = [(expired, time.monotonic() - 120)]
+
+    asyncio.run(pool.prune())
+
+    assert expired.closed
+    assert pool.stats["expired"] == 1
+    assert pool.idle_count() == 2
+    assert not fresh.closed and not other.closed
+
+
+
+def test_async_sender_does_not_retry_once_data_was_sent(smtp_server):
+    from app.domain.transport import AsyncSmtpConnectionPool, AsyncSmtpSender
+
+    async def send_all():
+        pool = AsyncSmtpConnectionPool(max_idle_seconds=60, timeout=5)
+        sender = AsyncSmtpSender("127.0.0.1", smtp_server.port, "user", "pass", starttls=False, pool=pool)
+        await sender.send({"email": "sender@test.com"}, "lead@test.com", "Hi", "Hi")
+        smtp_server.drop_on = "MAIL"
+        await sender.send({"email": "sender@test.com"}, "lead@test.com", "Hi", "Hi")
+        smtp_server.hang_up_after_data = True
+        with pytest.raises(Exception):
+            await sender.send({"email": "sender@test.com"}, "lead@test.com", "Hi", "Hi")
+        await pool.close_all()
+        return pool.stats
+
+    stats = asyncio.run(send_all())
+    # The 421 at MAIL FROM was retried; the lost reply to DATA was not
+    assert stats["reconnects"] == 1
+    assert smtp_server.messages == 3
+
+
+class FailingProgressDatabase(FakeAsyncDatabase):
+    """campaign_leads.bulk_write fails, everything else goes to mongomock"""
+
+    def __getattr__(self, name):
+        collection = super().__getattr__(name)
+        if name == "campaign_leads":
+            async def bulk_write(*args, **kwargs):
+                raise BulkWriteError({"writeErrors": [{"index": 0, "code": 2, "errmsg": "bad op"}]})
+            collection.bulk_write = bulk_write
+        return collection
+
+
+def test_failed_progress_write_still_records_sends(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    campaign_id = seed_campaign(smtp_server.port, accounts=2, leads=2)
+
+    with pytest.raises(BulkWriteError):
+        asyncio.run(run_once_async(campaign_id, 2, concurrency=2, db=FailingProgressDatabase(mongo_db)))
+
+    assert smtp_server.messages == 2
+    assert mongo_db.campaign_activities.count_documents({"type": "sent"}) == 2
+    assert mongo_db.campaign_runtime_state.find_one({"campaign_id": campaign_id})["sent_count"] == 2
+    assert mongo_db.campaign_leads.count_documents({"claimed_by": {"$exists": True}}) == 0
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta, timezone
+from app.domain.arbiter import AccountArbiter
+from app.domain.availability import AccountAvailabilityIndex
+
+
+def test_cooling_accounts_skipped_without_query(mongo_db):
+    index = AccountAvailabilityIndex(resync_seconds=60)
+    arbiter = AccountArbiter(mongo_db, availability=index)
+    now_utc = datetime.now(timezone.utc)
+    limits = {"e1": 5, "e2": 5}
+    assert arbiter.reserve_many(limits, now_utc, 2) == ["e1", "e2"]
+    arbiter.commit("e1", now_utc, 10)
+    arbiter.commit("e2", now_utc, 10)
+
+    assert index.plausibly_free(limits, now_utc, now_utc.strftime('%Y-%m-%d')) == {}
+    assert arbiter.reserve_any(limits, now_utc) is None
+    assert index.earliest_available() == now_utc + timedelta(minutes=10)
+    later = now_utc + timedelta(minutes=11)
+    assert index.plausibly_free(limits, later, now_utc.strftime('%Y-%m-%d')) == limits
+
+
+def test_index_resyncs_when_mongo_disagrees(mongo_db):
+    index = AccountAvailabilityIndex(resync_seconds=60)
+    arbiter = AccountArbiter(mongo_db, availability=index)
+    now_utc = datetime.now(timezone.utc)
+    date_key = now_utc.strftime('%Y-%m-%d')
+    assert arbiter.reserve_any({"e1": 5}, now_utc) == "e1"
+    arbiter.rollback("e1", now_utc)
+    # Another process sends on e1 behind our back
+    mongo_db.account_runtime_state.update_one(
+        {"email_id": "e1", "date_key": date_key},
+        {"$set": {"next_available_at": now_utc + timedelta(minutes=5)}, "$inc": {"sent_count": 1}}
+    )
+
+    assert arbiter.reserve_any({"e1": 5}, now_utc) is None
+    assert index.stats["resyncs"] == 1
+    assert index.plausibly_free({"e1": 5}, now_utc, date_key) == {}
+
+
+def test_earliest_available_skips_superseded_entries_and_filters_subset():
+    index = AccountAvailabilityIndex(resync_seconds=60)
+    now_utc = datetime.now(timezone.utc)
+    date_key = now_utc.strftime('%Y-%m-%d')
+    index.load([{"email_id": "e1", "next_available_at": now_utc + timedelta(minutes=1), "sent_count": 0},
+                {"email_id": "e2", "next_available_at": now_utc + timedelta(minutes=5), "sent_count": 0}], date_key)
+    for i in range(200):
+        index.mark_committed("e1", now_utc + timedelta(minutes=10, seconds=i))
+
+    assert index.earliest_available() == now_utc + timedelta(minutes=5)
+    assert index.earliest_available(["e1"]) == now_utc + timedelta(minutes=10, seconds=199)
+    assert index.earliest_available(["e3"]) is None
+    # Stale entries don't pile up, and a subset query puts the others back
+    assert len(index._heap) <= 2 * 2 + 64
+    assert index.earliest_available() == now_utc + timedelta(minutes=5)
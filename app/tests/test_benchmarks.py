@@ -0,0 +1,30 @@
+from benchmarks.run import compare
+from benchmarks.scenarios import dispatcher_tick, worker_batch
+from benchmarks.suppression import suppression_lookup
+
+
+def test_worker_benchmark_sends_every_lead_and_counts_phases():
+    result = worker_batch(leads=20, accounts=3)
+    assert result["sent"] == result["smtp_messages"] == 20
+    assert result["phases"]["smtp"]["calls"] == 20
+    assert result["phases"]["claim_leads"]["calls"] == 1
+    assert result["mongo_ops"] == sum(result["mongo_ops_by_call"].values())
+    assert result["mongo_ops_by_call"]["campaign_leads.update_many"] == 2
+
+
+def test_dispatcher_benchmark_and_baseline_comparison():
+    result = {"params": {"leads": 5}, **dispatcher_tick(campaigns=2, leads=5, accounts=2)}
+    assert result["sent"] == 10
+    assert compare(result, result, 0.2) == []
+
+    slower = dict(result, emails_per_second=result["emails_per_second"] * 2,
+                  mongo_ops_per_email=result["mongo_ops_per_email"] / 2)
+    problems = compare(result, slower, 0.2)
+    assert len(problems) == 2
+    assert compare(result, dict(result, params={"leads": 6}), 0.2)[0].startswith("parameters differ")
+
+
+def test_suppression_benchmark():
+    result = suppression_lookup(entries=2000, lookups=500, changes=10)
+    assert result["synced_lookup_ok"] and result["sync_mongo_ops"] == 1
+    assert result["filter_bytes"] < result["set_of_str_bytes"]
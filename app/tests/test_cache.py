@@ -0,0 +1,53 @@
+import time
+from datetime import datetime, timedelta, timezone
+from mongomock import MongoClient
+from app.db.cache import CacheInvalidator, DaoCache
+
+
+def test_ttl_expiry():
+    cache = DaoCache(max_entries=10, ttls={"templates": 0.05})
+    cache.set("templates", "t1", {"subject": "Hi"})
+    assert cache.get("templates", "t1") == (True, {"subject": "Hi"})
+    time.sleep(0.06)
+    assert cache.get("templates", "t1") == (False, None)
+    assert cache.stats()["hit_rate"] == 0.5
+
+
+def test_lru_bound_evicts_least_recent():
+    cache = DaoCache(max_entries=2, ttls={})
+    cache.set("templates", "a", 1)
+    cache.set("templates", "b", 2)
+    cache.get("templates", "a")
+    cache.set("templates", "c", 3)
+    assert cache.get("templates", "b") == (False, None)
+    assert cache.get("templates", "a") == (True, 1)
+    assert cache.evictions == 1
+
+
+def test_get_many_only_loads_misses():
+    cache = DaoCache(max_entries=10, ttls={})
+    cache.set("email_accounts", "e1", {"email": "a@test.com"})
+    requested = []
+
+    def loader(missing):
+        requested.extend(missing)
+        return {key: {"email": f"{key}@test.com"} for key in missing}
+
+    found = cache.get_many("email_accounts", ["e1", "e2"], loader)
+    assert requested == ["e2"]
+    assert set(found) == {"e1", "e2"}
+    assert cache.get("email_accounts", "e2")[0]
+
+
+def test_poll_invalidates_updated_documents():
+    db = MongoClient()['testdb']
+    cache = DaoCache(max_entries=10, ttls={})
+    cache.set("campaign_options", "c1", {"daily_email_limit": 10})
+    cache.set("campaign_options", "c2", {"daily_email_limit": 20})
+    invalidator = CacheInvalidator(db, cache=cache)
+    invalidator._last_seen["campaign_options"] = datetime.now(timezone.utc) - timedelta(minutes=1)
+    db.campaign_options.insert_one({"campaign_id": "c1", "daily_email_limit": 50,
+                                    "updated_at": datetime.now(timezone.utc)})
+    invalidator.poll_once()
+    assert cache.get("campaign_options", "c1") == (False, None)
+    assert cache.get("campaign_options", "c2")[0]
@@ -0,0 +1,38 @@
+import pytest
+from bson import ObjectId
+from mongomock import MongoClient
+from app.db import dao_accounts, dao_sequences, dao_templates
+from app.db.cache import dao_cache
+from app.domain.campaign_context import CampaignContext
+
+
+@pytest.fixture
+def db(monkeypatch):
+    db = MongoClient()['testdb']
+    for module in (dao_accounts, dao_sequences, dao_templates):
+        monkeypatch.setattr(module, "db", db)
+    dao_cache.clear()
+    return db
+
+
+def test_context_loads_batch_dependencies(db):
+    step1, step2, tpl1, tpl2 = ObjectId(), ObjectId(), ObjectId(), ObjectId()
+    e1, e2 = ObjectId(), ObjectId()
+    db.sequence_steps.insert_many([
+        {"_id": step1, "active_template": str(tpl1)},
+        {"_id": step2, "active_template": str(tpl2)},
+    ])
+    db.templates.insert_many([{"_id": tpl1, "subject": "One"}, {"_id": tpl2, "subject": "Two"}])
+    db.email_accounts.insert_many([{"_id": e1, "email": "a@test.com"}, {"_id": e2, "email": "b@test.com"}])
+    db.email_campaign_settings.insert_one({"email_id": str(e1), "daily_limit": "10"})
+    db.email_general_settings.insert_one({"email_id": str(e1), "signature": "sig"})
+    sequence = {"steps": [{"order": 1, "id": str(step1)}, {"order": 2, "id": str(step2)}]}
+
+    context = CampaignContext.load("c1", sequence, [str(e1), str(e2)])
+
+    step = context.step(context.step_info(2)["id"])
+    assert context.template(step["active_template"])["subject"] == "Two"
+    assert context.step_info(3) is None
+    assert context.account(str(e2))["email"] == "b@test.com"
+    assert context.email_campaign_settings(str(e1))["daily_limit"] == "10"
+    assert context.email_general_settings(str(e2)) is None
@@ -0,0 +1,93 @@
+import threading
+import time
+from app.domain import dispatcher
+
+
+def test_concurrent_dispatch_isolates_slow_and_failing_campaigns(monkeypatch):
+    queue = [{"campaign_id": "slow"}, {"campaign_id": "broken"}, {"campaign_id": "fast"}]
+    finished = []
+    lock = threading.Lock()
+
+    def fake_worker(campaign_id, batch_size, dry_run=False, deadline=None):
+        if campaign_id == "broken":
+            raise RuntimeError("smtp exploded")
+        if campaign_id == "slow":
+            time.sleep(0.3)
+        with lock:
+            finished.append((campaign_id, time.monotonic()))
+
+    monkeypatch.setattr(dispatcher, "get_campaign_queue", lambda: queue)
+    monkeypatch.setattr(dispatcher, "_plan_campaign", lambda entry, *args: (entry["campaign_id"], 5))
+    monkeypatch.setattr(dispatcher, "worker_run_once", fake_worker)
+
+    dispatcher.run_once(batch_size=5, concurrency=3)
+
+    assert [c for c, _ in finished] == ["fast", "slow"]
+
+
+def test_sequential_dispatch_is_default(monkeypatch):
+    calls = []
+    monkeypatch.setattr(dispatcher, "get_campaign_queue", lambda: [{"campaign_id": "a"}, {"campaign_id": "b"}])
+    monkeypatch.setattr(dispatcher, "_plan_campaign", lambda entry, *args: (entry["campaign_id"], 5))
+    monkeypatch.setattr(dispatcher, "worker_run_once",
+                        lambda campaign_id, *args, **kwargs: calls.append(threading.current_thread().name))
+
+    dispatcher.run_once(batch_size=5)
+
+    assert calls == [threading.main_thread().name] * 2
+
+
+def test_campaign_sent_counter_is_seeded_once_then_incremented(mongo_db):
+    from datetime import datetime, timezone
+    from app.db.dao_runtime import get_campaign_sent_count, increment_campaign_sent, recount_campaign_runtime_state
+    sent_at = datetime(2024, 3, 4, 9, 30, tzinfo=timezone.utc)
+    mongo_db.campaign_activities.insert_many([
+        {"campaign_id": "c1", "type": "sent", "created_at": sent_at},
+        {"campaign_id": "c1", "type": "sent", "created_at": sent_at},
+        {"campaign_id": "c1", "type": "error", "created_at": sent_at},
+        {"campaign_id": "c2", "type": "sent", "created_at": sent_at},
+    ])
+
+    assert get_campaign_sent_count("c1", "2024-03-04") == 2
+    # Later sends only touch the counter; activities are not re-counted
+    mongo_db.campaign_activities.insert_one({"campaign_id": "c1", "type": "sent", "created_at": sent_at})
+    increment_campaign_sent("c1", "2024-03-04", 3)
+    assert get_campaign_sent_count("c1", "2024-03-04") == 5
+    assert get_campaign_sent_count("c1", "2024-03-05") == 0
+
+    assert recount_campaign_runtime_state("c1", "2024-03-04") == 3
+    assert get_campaign_sent_count("c1", "2024-03-04") == 3
+
+
+
+def test_worker_increment_before_any_check_seeds_from_activities(mongo_db):
+    from datetime import datetime, timezone
+    from app.db.dao_runtime import get_campaign_sent_count, increment_campaign_sent
+    sent_at = datetime(2024, 3, 4, 9, 30, tzinfo=timezone.utc)
+    # Two sends earlier in the day (before the counter existed), then a batch of one
+    mongo_db.campaign_activities.insert_many([
+        {"campaign_id": "c1", "type": "sent", "created_at": sent_at} for _ in range(3)
+    ])
+    increment_campaign_sent("c1", "2024-03-04", 1)
+    assert get_campaign_sent_count("c1", "2024-03-04") == 3
+    increment_campaign_sent("c1", "2024-03-04", 2)
+    assert get_campaign_sent_count("c1", "2024-03-04") == 5
+
+def test_closed_campaign_is_skipped_until_its_window_opens(monkeypatch):
+    from datetime import datetime, timedelta, timezone
+    lookups = []
+    monkeypatch.setattr(dispatcher, "_window_opens", {})
+    monkeypatch.setattr(dispatcher, "get_campaign_by_id",
+                        lambda campaign_id: lookups.append(campaign_id) or {"status": "active"})
+    monkeypatch.setattr(dispatcher, "get_campaign_schedule",
+                        lambda campaign_id: {"timezone": "UTC", "time_from": "09:00", "time_to": "17:00"})
+    monkeypatch.setattr(dispatcher, "get_campaign_options", lambda campaign_id: None)
+    now_utc = datetime(2025, 8, 25, 8, 58, tzinfo=timezone.utc)
+
+    assert dispatcher._plan_campaign({"campaign_id": "c1"}, now_utc, 10, False) is None
+    assert dispatcher._plan_campaign({"campaign_id": "c1"}, now_utc + timedelta(minutes=1), 10, False) is None
+    assert lookups == ["c1"]
+    assert dispatcher._window_opens["c1"] == datetime(2025, 8, 25, 9, 0, tzinfo=timezone.utc)
+
+    dispatcher._plan_campaign({"campaign_id": "c1"}, now_utc + timedelta(minutes=3), 10, False)
+    assert lookups == ["c1", "c1"]
@@ -29,3 +29,77 @@ def test_due_leads_selection():
     assert "a@test.com" in emails
     assert "c@test.com" in emails
     assert "b@test.com" not in emails
+
+
+def test_due_leads_uses_materialized_fields(mongo_db):
+    from bson import ObjectId
+    from app.db.dao_leads import backfill_lead_due_fields
+    campaign_id = ObjectId()
+    now_utc = datetime.now(timezone.utc)
+    mongo_db.campaign_leads.insert_many([
+        {"campaign_id": campaign_id, "lead_data": {"email": "late@test.com"},
+         "progress": {"stopped": False, "last_sent_at": now_utc, "next_due_at": now_utc - timedelta(minutes=1)}},
+        {"campaign_id": campaign_id, "lead_data": {"email": "stopped@test.com"},
+         "progress": {"stopped": True, "next_due_at": now_utc}},
+        {"campaign_id": campaign_id, "lead_data": {"email": "new@test.com"},
+         "progress": {"stopped": False}},
+        {"campaign_id": campaign_id, "lead_data": {"email": "future@test.com"},
+         "progress": {"stopped": False, "last_sent_at": now_utc, "next_due_at": now_utc + timedelta(days=1)}},
+        {"campaign_id": ObjectId(), "lead_data": {"email": "other@test.com"}},
+    ])
+    # Not migrated yet: matched on progress.* instead of being skipped
+    leads = get_due_leads(str(campaign_id), now_utc, 10)
+    assert sorted(l["lead_data"]["email"] for l in leads) == ["late@test.com", "new@test.com"]
+
+    assert backfill_lead_due_fields(str(campaign_id)) == 4
+    assert backfill_lead_due_fields(str(campaign_id)) == 0
+
+    leads = get_due_leads(str(campaign_id), now_utc, 10)
+    assert [l["lead_data"]["email"] for l in leads] == ["new@test.com", "late@test.com"]
+
+
+def test_claimed_leads_are_leased_to_one_worker(mongo_db):
+    from bson import ObjectId
+    from app.db.dao_leads import claim_due_leads, release_lead_claims, due_fields
+    campaign_id = ObjectId()
+    now_utc = datetime.now(timezone.utc)
+    mongo_db.campaign_leads.insert_many([
+        {"campaign_id": campaign_id, "lead_data": [{"email": f"{i}@test.com"}], **due_fields(None)}
+        for i in range(5)
+    ])
+
+    first = claim_due_leads(str(campaign_id), now_utc, 3, "worker-a", lease_seconds=60)
+    second = claim_due_leads(str(campaign_id), now_utc, 3, "worker-b", lease_seconds=60)
+    assert len(first) == 3
+    assert len(second) == 2
+    assert not {l["_id"] for l in first} & {l["_id"] for l in second}
+    assert claim_due_leads(str(campaign_id), now_utc, 3, "worker-c") == []
+
+    # A crashed worker's leases expire and the leads can be claimed again
+    later = now_utc + timedelta(seconds=61)
+    assert len(claim_due_leads(str(campaign_id), later, 10, "worker-c", lease_seconds=60)) == 5
+
+    # Releasing with a stale claim id leaves the new owner's leases alone
+    assert release_lead_claims([l["_id"] for l in first], "worker-a") == 0
+    assert release_lead_claims([l["_id"] for l in first], "worker-c") == 3
+    assert mongo_db.campaign_leads.count_documents({"claimed_by": {"$exists": True}}) == 2
+
+
+def test_leads_without_state_are_claimed_and_wake_the_dispatcher(mongo_db):
+    from bson import ObjectId
+    from app.db.dao_leads import claim_due_leads, due_fields, get_next_due_at
+    campaign_id = ObjectId()
+    now_utc = datetime.now(timezone.utc)
+    later = now_utc + timedelta(hours=1)
+    mongo_db.campaign_leads.insert_many([
+        {"campaign_id": campaign_id, "lead_data": [{"email": "migrated@test.com"}],
+         **due_fields({"last_sent_at": now_utc, "next_due_at": later})},
+        # Inserted by another tool: progress only
+        {"campaign_id": campaign_id, "lead_data": [{"email": "raw@test.com"}], "progress": {"stopped": False}},
+    ])
+    assert get_next_due_at(str(campaign_id), now_utc).replace(tzinfo=None) < now_utc.replace(tzinfo=None)
+    leads = claim_due_leads(str(campaign_id), now_utc, 10, "worker-a", lease_seconds=60)
+    assert [l["lead_data"][0]["email"] for l in leads] == ["raw@test.com"]
+    # Leased: the next wake-up is the migrated lead's due_at
+    next_due_at = get_next_due_at(str(campaign_id), now_utc).replace(tzinfo=None)
+    assert abs(next_due_at - later.replace(tzinfo=None)) < timedelta(seconds=1)
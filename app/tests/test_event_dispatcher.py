@@ -0,0 +1,83 @@
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from app.db.dao_leads import due_fields
+from app.domain import event_dispatcher
+from app.domain.event_dispatcher import EventDrivenDispatcher, WakeQueue, next_wake_at
+
+NOW = datetime(2025, 8, 25, 8, 0, tzinfo=timezone.utc)
+
+
+def seed(db, lead_due_at):
+    campaign_id = ObjectId()
+    email_ids = [str(ObjectId()), str(ObjectId())]
+    db.campaigns.insert_one({"_id": campaign_id, "status": "active"})
+    db.campaign_schedule.insert_one({"campaign_id": str(campaign_id), "timezone": "UTC",
+                                     "time_from": "09:00", "time_to": "17:00"})
+    db.campaign_options.insert_one({"campaign_id": str(campaign_id), "daily_email_limit": 10,
+                                    "email_accounts": email_ids})
+    for email_id in email_ids:
+        db.email_campaign_settings.insert_one({"email_id": email_id, "daily_limit": "5"})
+    db.campaign_leads.insert_one({"campaign_id": campaign_id, "lead_data": {"email": "a@test.com"},
+                                  "progress": {"last_sent_at": NOW}, "state": "active", "due_at": lead_due_at})
+    return str(campaign_id), email_ids
+
+
+def test_wake_queue_keeps_latest_time_per_campaign():
+    queue = WakeQueue()
+    queue.schedule("a", NOW + timedelta(minutes=5))
+    queue.schedule("b", NOW + timedelta(minutes=1))
+    queue.schedule("a", NOW)
+    assert queue.next_wake() == NOW
+    assert queue.pop_due(NOW + timedelta(minutes=2)) == ["a", "b"]
+    assert queue.next_wake() is None
+    assert len(queue) == 0
+
+
+def test_next_wake_is_latest_of_window_lead_and_accounts(mongo_db):
+    campaign_id, email_ids = seed(mongo_db, NOW + timedelta(hours=2))
+    assert next_wake_at(campaign_id, NOW) == NOW + timedelta(hours=2)
+
+    # Both accounts cooling down past the lead's due time
+    for email_id, minutes in zip(email_ids, (150, 180)):
+        mongo_db.account_runtime_state.insert_one({"email_id": email_id, "date_key": "2025-08-25", "sent_count": 1,
+                                                   "next_available_at": NOW + timedelta(minutes=minutes)})
+    assert next_wake_at(campaign_id, NOW) == NOW + timedelta(minutes=150)
+
+    # Lead already due: the window opening is what we wait for
+    mongo_db.campaign_leads.update_many({}, {"$set": due_fields({})})
+    mongo_db.account_runtime_state.update_many({}, {"$set": {"next_available_at": NOW}})
+    assert next_wake_at(campaign_id, NOW) == NOW + timedelta(hours=1)
+
+    # Campaign budget spent today: tomorrow's window
+    mongo_db.campaign_runtime_state.update_one({"campaign_id": campaign_id, "date_key": "2025-08-25"},
+                                               {"$set": {"sent_count": 10}}, upsert=True)
+    assert next_wake_at(campaign_id, NOW) == datetime(2025, 8, 26, 0, 0, tzinfo=timezone.utc)
+
+    mongo_db.campaign_leads.update_many({}, {"$set": due_fields({"stopped": True})})
+    assert next_wake_at(campaign_id, NOW) is None
+
+
+def test_run_pass_dispatches_only_due_campaigns_and_sleeps_until_next(monkeypatch):
+    wakes = {"now": NOW, "later": NOW + timedelta(seconds=40), "idle": None}
+    dispatched = []
+    monkeypatch.setattr(event_dispatcher, "get_campaign_queue", lambda: [{"campaign_id": c} for c in wakes])
+    monkeypatch.setattr(event_dispatcher, "next_wake_at", lambda campaign_id, now_utc: wakes[campaign_id])
+    monkeypatch.setattr(event_dispatcher, "dispatch_campaigns",
+                        lambda entries, *args: dispatched.extend(e["campaign_id"] for e in entries))
+
+    dispatcher = EventDrivenDispatcher(None, max_sleep_seconds=300, min_sleep_seconds=1)
+    dispatcher.run_pass(NOW)
+    assert dispatched == ["now"]
+    assert dispatcher.queue.wake_time("later") == NOW + timedelta(seconds=40)
+    assert dispatcher.queue.wake_time("idle") == NOW + timedelta(seconds=300)
+
+    # Nothing due at the next pass: sleep no longer than until "later"
+    wakes["now"] = NOW + timedelta(hours=1)
+    assert 9 < dispatcher.run_pass(NOW + timedelta(seconds=30)) <= 10
+    assert dispatched == ["now"]
+
+    # A lead change wakes the campaign early
+    wakes["later"] = NOW
+    dispatcher.notify("later")
+    dispatcher.run_pass(NOW + timedelta(seconds=31))
+    assert dispatched == ["now", "later"]
@@ -0,0 +1,57 @@
+import gzip
+from bson import ObjectId
+from app.db.dao_leads import LEAD_STATE_ACTIVE, NEVER_SENT_DUE_AT
+from app.domain.lead_import import import_leads, normalize_lead, read_rows
+
+
+def test_normalize_lead():
+    assert normalize_lead({" Email ": " Ann@Example.COM ", "name": "Ann ", "company": "", None: ["extra"]}) == [
+        {"email": "ann@example.com", "name": "Ann"}]
+    assert normalize_lead({"lead_data": [{"email_address": "a@x.com"}, {"email": "nope"}, "junk"]}) == [
+        {"email": "a@x.com"}]
+    assert normalize_lead({"name": "No address"}) == []
+    assert normalize_lead(None) == []
+
+
+def test_read_rows_csv_and_jsonl(tmp_path):
+    csv_path = tmp_path / "leads.csv"
+    csv_path.write_bytes("﻿Email,Name\r\na@x.com,Ann\r\nb@x.com,\r\n".encode("utf-8"))
+    assert list(read_rows(str(csv_path))) == [{"Email": "a@x.com", "Name": "Ann"}, {"Email": "b@x.com", "Name": ""}]
+
+    jsonl_path = tmp_path / "leads.jsonl.gz"
+    with gzip.open(jsonl_path, "wt", encoding="utf-8") as out:
+        out.write('{"email": "a@x.com"}\n\nnot json\n[1]\n')
+    assert list(read_rows(str(jsonl_path))) == [{"email": "a@x.com"}, None, None]
+
+
+def test_import_dedupes_against_campaign_and_across_chunks(mongo_db):
+    campaign_id = ObjectId()
+    mongo_db.campaign_leads.insert_many([
+        {"campaign_id": campaign_id, "lead_data": [{"email": "taken@x.com"}]},
+        {"campaign_id": str(campaign_id), "lead_data": {"email": "legacy@x.com"}},
+        {"campaign_id": ObjectId(), "lead_data": [{"email": "other-campaign@x.com"}]},
+    ])
+    rows = [
+        {"email": "new1@x.com", "name": "One"},
+        {"email": "TAKEN@x.com"},
+        {"email": "legacy@x.com"},
+        {"email": "other-campaign@x.com"},
+        {"email": "new1@x.com"},  # repeat of a row in an earlier chunk
+        {"lead_data": [{"email": "new2@x.com"}, {"email": "new2@x.com"}, {"email": "new3@x.com"}]},
+        {"name": "missing address"},
+    ]
+    progress = []
+    stats = import_leads(str(campaign_id), rows, chunk_size=2, on_progress=progress.append)
+
+    assert stats == {"rows": 7, "inserted": 3, "duplicates": 4, "invalid": 1}
+    assert [p["rows"] for p in progress] == [2, 4, 6]
+    imported = list(mongo_db.campaign_leads.find({"campaign_id": campaign_id, "state": {"$exists": True}}))
+    assert [lead["lead_data"] for lead in imported] == [
+        [{"email": "new1@x.com", "name": "One"}],
+        [{"email": "other-campaign@x.com"}],
+        [{"email": "new2@x.com"}, {"email": "new3@x.com"}],
+    ]
+    lead = imported[0]
+    assert lead["progress"] == {"current_step_order": 1, "stopped": False}
+    assert lead["state"] == LEAD_STATE_ACTIVE
+    assert lead["due_at"].replace(tzinfo=None) == NEVER_SENT_DUE_AT.replace(tzinfo=None)
@@ -0,0 +1,62 @@
+from datetime import datetime
+from bson import ObjectId
+from app.db.dao_leads import recipient_last_steps, update_recipient_statuses
+
+FIRST = datetime(2025, 8, 1, 9, 0)
+SECOND = datetime(2025, 8, 3, 9, 0)
+
+
+def seed_lead(db, campaign_id, processed, lead_data=None):
+    lead_data = lead_data if lead_data is not None else [
+        {"email": "a@test.com"},
+        {"email": "b@test.com", "status": "not_contacted"},
+        {"email": "c@test.com", "status": "replied"},
+    ]
+    return db.campaign_leads.insert_one({"campaign_id": campaign_id, "lead_data": lead_data,
+                                         "progress": {"processed_recipients": processed}}).inserted_id
+
+
+def test_recipient_last_steps_keeps_latest_step():
+    steps = recipient_last_steps({
+        "step_1_recipient_0": {"processed_at": FIRST},
+        "step_2_recipient_0": {"processed_at": SECOND},
+        "step_1_recipient_10": {"processed_at": FIRST},
+        "unrelated": {},
+    })
+    assert steps == {0: (2, SECOND), 10: (1, FIRST)}
+
+
+def test_update_streams_in_chunks_and_only_touches_uncontacted(mongo_db):
+    campaign_id = ObjectId()
+    processed = {"step_1_recipient_0": {"processed_at": FIRST}, "step_2_recipient_0": {"processed_at": SECOND},
+                 "step_1_recipient_2": {"processed_at": FIRST}}
+    lead_ids = [seed_lead(mongo_db, campaign_id, processed) for _ in range(3)]
+    single = seed_lead(mongo_db, campaign_id, processed, lead_data={"email": "solo@test.com"})
+    other_campaign = seed_lead(mongo_db, ObjectId(), processed)
+
+    chunks = []
+    scanned, updated = update_recipient_statuses(str(campaign_id), chunk_size=2,
+                                                 on_progress=lambda *args: chunks.append(args))
+    assert (scanned, updated) == (3, 3)
+    assert chunks == [(2, 2, lead_ids[1]), (3, 3, lead_ids[2])]
+
+    lead = mongo_db.campaign_leads.find_one({"_id": lead_ids[0]})
+    assert lead["lead_data"][0] == {"email": "a@test.com", "status": "contacted",
+                                    "last_contacted_at": SECOND, "last_step": 2}
+    assert lead["lead_data"][1] == {"email": "b@test.com", "status": "not_contacted"}
+    assert lead["lead_data"][2] == {"email": "c@test.com", "status": "replied"}
+    assert mongo_db.campaign_leads.find_one({"_id": single})["lead_data"] == {"email": "solo@test.com"}
+    assert "status" not in mongo_db.campaign_leads.find_one({"_id": other_campaign})["lead_data"][0]
+
+    # Recipient 1 is still not_contacted, so the leads are scanned again but not rewritten
+    assert update_recipient_statuses(str(campaign_id)) == (3, 0)
+
+
+def test_update_resumes_after_checkpoint(mongo_db):
+    campaign_id = ObjectId()
+    processed = {"step_1_recipient_1": {"processed_at": FIRST}}
+    lead_ids = [seed_lead(mongo_db, campaign_id, processed) for _ in range(3)]
+
+    assert update_recipient_statuses(resume_after=lead_ids[0]) == (2, 2)
+    assert mongo_db.campaign_leads.find_one({"_id": lead_ids[0]})["lead_data"][1]["status"] == "not_contacted"
+    assert mongo_db.campaign_leads.find_one({"_id": lead_ids[2]})["lead_data"][1]["status"] == "contacted"
@@ -0,0 +1,77 @@
+import socket
+import urllib.error
+import urllib.request
+import pytest
+from app.domain import metrics
+from app.domain.metrics import MetricsRegistry, registry
+from app.domain.worker import run_once
+
+
+@pytest.fixture
+def metrics_on(monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "METRICS_ENABLED", True)
+    registry.clear()
+    yield registry
+    registry.clear()
+
+
+def test_render_prometheus_text():
+    metrics_registry = MetricsRegistry(buckets=(0.1, 1.0))
+    metrics_registry.inc("emailbot_emails_sent_total", campaign_id="c1")
+    metrics_registry.inc("emailbot_emails_sent_total", 2, campaign_id="c1")
+    metrics_registry.set("emailbot_due_leads", 7, campaign_id='we"ird')
+    for seconds in (0.05, 0.5, 3.0):
+        metrics_registry.observe("emailbot_phase_seconds", seconds, phase="smtp")
+
+    text = metrics_registry.render()
+    assert "# TYPE emailbot_emails_sent_total counter" in text
+    assert 'emailbot_emails_sent_total{campaign_id="c1"} 3' in text
+    assert 'emailbot_due_leads{campaign_id="we\\"ird"} 7' in text
+    assert 'emailbot_phase_seconds_bucket{phase="smtp",le="0.1"} 1' in text
+    assert 'emailbot_phase_seconds_bucket{phase="smtp",le="1.0"} 2' in text
+    assert 'emailbot_phase_seconds_bucket{phase="smtp",le="+Inf"} 3' in text
+    assert 'emailbot_phase_seconds_count{phase="smtp"} 3' in text
+
+
+def test_disabled_metrics_record_nothing():
+    registry.clear()
+    with metrics.timer("smtp"):
+        metrics.inc("emailbot_emails_sent_total", campaign_id="c1")
+    assert registry.histogram("emailbot_phase_seconds", phase="smtp") is None
+    assert registry.value("emailbot_emails_sent_total", campaign_id="c1") is None
+
+
+def test_worker_records_phases_and_counters(mongo_db, seed_campaign, smtp_server, monkeypatch, metrics_on):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    campaign_id = seed_campaign(smtp_server.port, accounts=2, leads=3)
+
+    run_once(campaign_id, 3, concurrency=2)
+
+    assert metrics_on.value("emailbot_emails_sent_total", campaign_id=campaign_id) == 2
+    # Both accounts cooling down for the third lead
+    assert metrics_on.value("emailbot_no_account_available_total", campaign_id=campaign_id) == 1
+    assert metrics_on.histogram("emailbot_phase_seconds", phase="smtp")["count"] == 2
+    for phase in ("due_leads", "load_context", "progress_write", "activity_write", "release_leads"):
+        assert metrics_on.histogram("emailbot_phase_seconds", phase=phase)["count"] == 1
+
+    mongo_db.campaign_queue.insert_one({"campaign_id": campaign_id})
+    text = metrics_on.render()
+    assert f'emailbot_due_leads{{campaign_id="{campaign_id}"}} 1' in text
+
+
+def test_http_endpoint(mongo_db, metrics_on):
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    metrics_on.inc("emailbot_send_errors_total", campaign_id="c1")
+    server = metrics.start_http_server(port)
+    try:
+        body = urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5).read().decode()
+        assert 'emailbot_send_errors_total{campaign_id="c1"} 1' in body
+        with pytest.raises(urllib.error.HTTPError):
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/other", timeout=5)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,104 @@
+from collections import Counter
+from app.domain import dispatcher, pool
+from app.domain.pool import ShardMember, WorkerPool
+from app.domain.sharding import HashRing
+
+CAMPAIGNS = [f"campaign-{i}" for i in range(3000)]
+
+
+def test_ring_spreads_campaigns_and_only_moves_a_removed_members_share():
+    ring = HashRing([0, 1, 2])
+    owners = {c: ring.owner(c) for c in CAMPAIGNS}
+    counts = Counter(owners.values())
+    assert set(counts) == {0, 1, 2}
+    assert all(600 < n < 1400 for n in counts.values())
+
+    smaller = HashRing([0, 1])
+    for campaign_id, owner in owners.items():
+        if owner != 2:
+            assert smaller.owner(campaign_id) == owner
+    # Same placement in every process
+    assert HashRing([2, 1, 0]).owner("campaign-7") == owners["campaign-7"]
+
+
+def test_member_takes_over_dead_slot_campaigns(monkeypatch):
+    alive, heartbeats = [1, 1, 1], [0.0] * 3
+    seen = []
+    monkeypatch.setattr(dispatcher, "get_campaign_queue", lambda: [{"campaign_id": c} for c in CAMPAIGNS])
+    monkeypatch.setattr(dispatcher, "dispatch_campaigns", lambda queue, *args: seen.append({e["campaign_id"] for e in queue}))
+    monkeypatch.setattr(pool, "report_worker_health", lambda worker_id, fields: None)
+    member = ShardMember(0, alive, heartbeats, tick_seconds=5)
+
+    assert member.refresh_membership() is True
+    assert member.run_pass() == 5
+    assert seen[-1] == {c for c in CAMPAIGNS if HashRing([0, 1, 2]).owner(c) == 0}
+
+    alive[2] = 0
+    assert member.refresh_membership() is True
+    assert member.refresh_membership() is False
+    member.run_pass()
+    assert seen[-1] == {c for c in CAMPAIGNS if HashRing([0, 1]).owner(c) == 0}
+    assert seen[-1] > seen[0]
+
+    member.beat()
+    assert heartbeats[0] > 0
+    assert member.health["passes"] == 2
+    assert member.health["members"] == [0, 1]
+
+
+class FakeProcess:
+    def __init__(self, alive=True, exitcode=None):
+        self.pid = 1234
+        self._alive = alive
+        self.exitcode = exitcode
+        self.terminated = False
+
+    def is_alive(self):
+        return self._alive
+
+    def terminate(self):
+        self.terminated = True
+        self._alive = False
+
+    def join(self, timeout=None):
+        pass
+
+
+def test_supervisor_drops_and_restarts_dead_or_hung_processes(monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "POOL_RESTART_BACKOFF_SECONDS", 2.0)
+    monkeypatch.setattr(settings, "POOL_HEARTBEAT_TIMEOUT_SECONDS", 30)
+    supervisor = WorkerPool(3)
+    spawned = []
+    monkeypatch.setattr(supervisor, "_spawn", lambda slot: spawned.append(slot))
+    now = 1000.0
+    hung = FakeProcess()
+    supervisor._procs = [FakeProcess(), FakeProcess(alive=False, exitcode=1), hung]
+    for slot in range(3):
+        supervisor.alive[slot] = 1
+        supervisor.heartbeats[slot] = now
+    supervisor.heartbeats[2] = now - 31
+
+    supervisor.supervise(now)
+    assert list(supervisor.alive) == [1, 0, 0]
+    assert hung.terminated
+    assert spawned == []
+
+    # Restarted once the backoff has passed
+    supervisor.supervise(now + 1)
+    assert spawned == []
+    supervisor.supervise(now + 2)
+    assert spawned == [1, 2]
+
+
+def test_member_spools_activities_to_its_own_file(monkeypatch, tmp_path):
+    from app.config.settings import settings
+    from app.db.dao_activities import activity_writer
+    monkeypatch.setattr(settings, "ACTIVITY_SPOOL_PATH", str(tmp_path / "activities.jsonl"))
+    monkeypatch.setattr(activity_writer, "spool_path", settings.ACTIVITY_SPOOL_PATH)
+    pool._use_slot_spool(2)
+    try:
+        assert activity_writer.spool_path == str(tmp_path / "activities.jsonl.pool-2")
+        assert settings.ACTIVITY_SPOOL_PATH == activity_writer.spool_path
+    finally:
+        activity_writer.close()
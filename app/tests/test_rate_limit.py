@@ -0,0 +1,72 @@
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId
+from app.domain.arbiter import AccountArbiter
+from app.domain.rate_limit import RateLimiter
+
+NOW = datetime(2025, 8, 25, 9, 0, tzinfo=timezone.utc)
+
+
+def seed_accounts(db, count, smtp_host="smtp.example.com", **limits):
+    email_ids = []
+    for _ in range(count):
+        email_id = ObjectId()
+        db.email_accounts.insert_one({"_id": email_id, "smtp_host": smtp_host})
+        db.email_campaign_settings.insert_one({"email_id": str(email_id), "daily_limit": "100", **limits})
+        email_ids.append(str(email_id))
+    return email_ids
+
+
+def test_bucket_is_shared_and_refills(mongo_db):
+    [email_id] = seed_accounts(mongo_db, 1, per_minute_limit=2)
+    first, second = RateLimiter(), RateLimiter()
+    buckets = first.buckets_for([email_id])[email_id]
+    assert buckets == [(f"account:{email_id}:60", 2.0, 2 / 60)]
+
+    assert first.acquire(buckets, NOW) is None
+    assert second.acquire(buckets, NOW) is None
+    # Another process drained it: one token back after 30s
+    assert first.acquire(buckets, NOW) == NOW + timedelta(seconds=30)
+    assert first.acquire(buckets, NOW + timedelta(seconds=10)) == NOW + timedelta(seconds=30)
+    assert second.acquire(buckets, NOW + timedelta(seconds=30)) is None
+
+
+def test_burst_and_hourly_limits(mongo_db):
+    [email_id] = seed_accounts(mongo_db, 1, per_minute_limit=10, burst_limit=1, per_hour_limit=30)
+    limiter = RateLimiter()
+    buckets = limiter.buckets_for([email_id])[email_id]
+    assert limiter.acquire(buckets, NOW) is None
+    assert limiter.acquire(buckets, NOW) is not None
+    # A failed acquire takes nothing from the other buckets
+    assert mongo_db.rate_limit_buckets.find_one({"_id": f"account:{email_id}:3600"})["tokens"] == 29
+
+
+def test_host_limit_caps_reservations_across_accounts(mongo_db):
+    email_ids = seed_accounts(mongo_db, 3)
+    mongo_db.smtp_host_limits.insert_one({"smtp_host": "smtp.example.com", "per_minute_limit": 2})
+    arbiter = AccountArbiter(mongo_db, rate_limiter=RateLimiter())
+
+    claimed = arbiter.reserve_many({email_id: 100 for email_id in email_ids}, NOW, 3)
+    assert claimed == email_ids[:2]
+    assert mongo_db.rate_limit_buckets.find_one({"_id": "host:smtp.example.com:60"})["tokens"] == 0
+
+    # Nothing was sent on the second account: its token goes back
+    arbiter.commit(email_ids[0], NOW, 0)
+    arbiter.rollback(email_ids[1], NOW, refund_tokens=True)
+    assert mongo_db.rate_limit_buckets.find_one({"_id": "host:smtp.example.com:60"})["tokens"] == 1
+    assert arbiter.reserve_many({email_ids[2]: 100}, NOW, 1) == [email_ids[2]]
+
+
+def test_unconfigured_accounts_are_not_limited(mongo_db):
+    email_ids = seed_accounts(mongo_db, 2)
+    arbiter = AccountArbiter(mongo_db, rate_limiter=RateLimiter())
+    assert arbiter.reserve_many({email_id: 100 for email_id in email_ids}, NOW, 2) == email_ids
+    assert mongo_db.rate_limit_buckets.count_documents({}) == 0
+
+
+def test_hosts_without_limits_are_looked_up_once(mongo_db):
+    email_ids = seed_accounts(mongo_db, 2)
+    limiter = RateLimiter()
+    assert limiter.buckets_for(email_ids) == {email_id: [] for email_id in email_ids}
+    mongo_db.smtp_host_limits.insert_one({"smtp_host": "smtp.example.com", "per_minute_limit": 2})
+    # Cached until the invalidator sees the new document
+    assert limiter.buckets_for(email_ids) == {email_id: [] for email_id in email_ids}
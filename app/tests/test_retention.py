@@ -0,0 +1,83 @@
+import gzip
+import os
+from datetime import datetime, timedelta, timezone
+from bson import json_util
+import pytest
+from app.db.dao_leads import get_checkpoint, save_checkpoint
+from app.domain.retention import CHECKPOINT, compact_runtime_states, retain_activities
+
+NOW = datetime(2025, 8, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def activity(days_ago, campaign_id="c1", email_id="e1", kind="sent", hour=9):
+    created_at = (NOW - timedelta(days=days_ago)).replace(hour=hour)
+    return {"campaign_id": campaign_id, "email_id": email_id, "type": kind, "created_at": created_at}
+
+
+@pytest.fixture
+def activities(mongo_db):
+    mongo_db.campaign_activities.insert_many([
+        activity(5), activity(5, hour=23), activity(5, kind="error"), activity(5, email_id="e2"),
+        activity(3, campaign_id="c2"),
+        activity(1), activity(0),
+    ])
+    return mongo_db
+
+
+def read_archive(path):
+    with gzip.open(path, "rt", encoding="utf-8") as archive:
+        return [json_util.loads(line) for line in archive]
+
+
+def test_archive_rolls_up_and_prunes_old_days(activities, tmp_path):
+    days = retain_activities(NOW, days=2, action="archive", archive_dir=str(tmp_path))
+
+    assert [(d["date_key"], d["summaries"], d["archived"], d["deleted"]) for d in days] == [
+        ("2025-08-05", 2, 4, 4), ("2025-08-07", 1, 1, 1)]
+    rollup = activities.activity_rollups.find_one({"_id": "2025-08-05:c1:e1"})
+    assert rollup["counts"] == {"sent": 2, "error": 1} and rollup["total"] == 3
+    assert activities.activity_rollups.find_one({"_id": "2025-08-05:c1:e2"})["counts"] == {"sent": 1}
+    assert len(read_archive(tmp_path / "campaign_activities" / "2025-08-05.jsonl.gz")) == 4
+    # Yesterday and today are inside the window
+    assert activities.campaign_activities.count_documents({}) == 2
+
+    assert retain_activities(NOW, days=2, action="archive", archive_dir=str(tmp_path)) == []
+
+
+def test_keep_is_incremental_and_later_delete_does_not_recount(activities, tmp_path):
+    assert len(retain_activities(NOW, days=2, action="keep")) == 2
+    assert retain_activities(NOW, days=2, action="keep") == []
+    assert activities.campaign_activities.count_documents({}) == 7
+
+    days = retain_activities(NOW, days=2, action="delete")
+    assert [(d["summaries"], d["deleted"]) for d in days] == [(0, 4), (0, 1)]
+    assert activities.activity_rollups.find_one({"_id": "2025-08-05:c1:e1"})["total"] == 3
+    assert not os.path.exists(tmp_path / "campaign_activities")
+
+
+def test_resume_after_archive_only_deletes(activities, tmp_path):
+    retain_activities(NOW, days=2, action="keep", max_days=1)
+    # A run that archived 08-07 and died before deleting it
+    save_checkpoint(CHECKPOINT, "2025-08-05", day="2025-08-07", stage="archived")
+
+    days = retain_activities(NOW, days=2, action="archive", archive_dir=str(tmp_path))
+    assert [(d["date_key"], d["summaries"], d["archived"], d["deleted"]) for d in days] == [
+        ("2025-08-07", 0, 0, 1), ("2025-08-05", 0, 4, 4)]
+    assert get_checkpoint(CHECKPOINT)["last_id"] == "2025-08-07"
+
+
+def test_existing_archive_is_not_overwritten(activities, tmp_path):
+    (tmp_path / "campaign_activities").mkdir()
+    (tmp_path / "campaign_activities" / "2025-08-05.jsonl.gz").write_bytes(b"")
+    days = retain_activities(NOW, days=2, action="archive", archive_dir=str(tmp_path), max_days=1)
+    assert days[0]["archive_path"].endswith("2025-08-05.1.jsonl.gz")
+
+
+def test_compact_runtime_states(mongo_db):
+    mongo_db.account_runtime_state.insert_many([{"email_id": "e1", "date_key": key}
+                                                for key in ("2025-07-01", "2025-08-02", "2025-08-03", "2025-08-10")])
+    mongo_db.campaign_runtime_state.insert_one({"campaign_id": "c1", "date_key": "2025-07-01"})
+    assert compact_runtime_states(NOW, days=7) == {"account_runtime_state": 2, "campaign_runtime_state": 1}
+    assert sorted(doc["date_key"] for doc in mongo_db.account_runtime_state.find()) == ["2025-08-03", "2025-08-10"]
+    with pytest.raises(ValueError):
+        compact_runtime_states(NOW, days=0)
@@ -0,0 +1,32 @@
+from datetime import datetime, timedelta
+from app.db.dao_runtime import (get_account_runtime_state_page, runtime_state_page_pipeline,
+                                summarize_account_runtime_states)
+
+NOW = datetime(2025, 8, 1, 12, 0)
+
+
+def seed_states(db):
+    db.account_runtime_state.insert_many([
+        {"email_id": "a", "date_key": "2025-08-01", "sent_count": 3, "next_available_at": NOW - timedelta(minutes=5)},
+        {"email_id": "b", "date_key": "2025-08-01", "sent_count": 1, "next_available_at": NOW + timedelta(minutes=5)},
+        {"email_id": "c", "date_key": "2025-08-01", "sent_count": 2, "next_available_at": NOW,
+         "locked_until": NOW + timedelta(seconds=30)},
+        {"email_id": "d", "date_key": "2025-08-01", "sent_count": 0, "next_available_at": NOW, "locked_until": None},
+        # History from earlier days is never read
+        {"email_id": "a", "date_key": "2025-07-31", "sent_count": 40, "next_available_at": NOW + timedelta(days=1)},
+    ])
+
+
+def test_summary_counts_only_the_requested_day(mongo_db):
+    seed_states(mongo_db)
+    assert summarize_account_runtime_states("2025-08-01", NOW) == {"AVAILABLE": 2, "WAITING": 1, "LOCKED": 1}
+    assert summarize_account_runtime_states("2025-06-01", NOW) == {"AVAILABLE": 0, "WAITING": 0, "LOCKED": 0}
+
+
+def test_page_is_ordered_and_paged_before_lookups(mongo_db):
+    seed_states(mongo_db)
+    rows = get_account_runtime_state_page("2025-08-01", skip=1, limit=2, join=False)
+    assert [(row["email_id"], row["sent_count"]) for row in rows] == [("b", 1), ("c", 2)]
+
+    stages = [next(iter(stage)) for stage in runtime_state_page_pipeline("2025-08-01", 0, 50)]
+    assert stages == ["$match", "$sort", "$skip", "$limit", "$lookup", "$lookup", "$project"]
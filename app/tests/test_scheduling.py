@@ -14,3 +14,55 @@ def test_in_window_basic():
     assert not in_window(dt, schedule)
     dt = datetime(2025, 8, 25, 10, 1, tzinfo=timezone.utc)
     assert in_window(dt, schedule)
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_overnight_window_spans_midnight():
+    from app.domain.scheduling import compile_schedule
+    schedule = compile_schedule({"timezone": "UTC", "time_from": "10:00 pm", "time_to": "06:00"})
+    assert schedule.is_open(utc(2025, 8, 25, 23, 0))
+    assert schedule.is_open(utc(2025, 8, 26, 5, 59))
+    assert not schedule.is_open(utc(2025, 8, 26, 12, 0))
+    assert schedule.next_open_at(utc(2025, 8, 26, 12, 0)) == utc(2025, 8, 26, 22, 0)
+    # The evening and the following morning are one window
+    assert schedule.closes_at(utc(2025, 8, 25, 23, 0)) == utc(2025, 8, 26, 6, 0)
+
+    # Weekdays apply to the local calendar day, so Friday night stops at midnight
+    weekdays = compile_schedule({"timezone": "UTC", "time_from": "22:00", "time_to": "06:00",
+                                 "scheduled_days": ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday"]})
+    assert weekdays.closes_at(utc(2025, 8, 29, 23, 0)) == utc(2025, 8, 30, 0, 0)
+    assert weekdays.next_open_at(utc(2025, 8, 30, 1, 0)) == utc(2025, 9, 1, 0, 0)
+
+
+def test_next_open_at_across_dst_transitions():
+    from app.domain.scheduling import compile_schedule
+    office = compile_schedule({"timezone": "America/New_York", "time_from": "09:00", "time_to": "17:00"})
+    # 09:00 EST on Saturday, 09:00 EDT on Sunday after clocks went forward
+    assert office.next_open_at(utc(2024, 3, 9, 0, 0)) == utc(2024, 3, 9, 14, 0)
+    assert office.next_open_at(utc(2024, 3, 9, 23, 0)) == utc(2024, 3, 10, 13, 0)
+    assert office.closes_at(utc(2024, 3, 10, 15, 0)) == utc(2024, 3, 10, 21, 0)
+
+    # A start inside the skipped hour opens right after the gap
+    gap = compile_schedule({"timezone": "America/New_York", "time_from": "02:30", "time_to": "04:00"})
+    assert gap.next_open_at(utc(2024, 3, 10, 5, 0)) == utc(2024, 3, 10, 7, 30)
+
+    # A start inside the repeated hour opens on both passes
+    repeat = compile_schedule({"timezone": "America/New_York", "time_from": "01:30", "time_to": "01:45"})
+    assert repeat.next_open_at(utc(2024, 11, 3, 4, 0)) == utc(2024, 11, 3, 5, 30)
+    assert repeat.next_open_at(utc(2024, 11, 3, 5, 50)) == utc(2024, 11, 3, 6, 30)
+
+
+def test_start_and_end_date_bound_the_window():
+    from app.domain.scheduling import compile_schedule
+    doc = {"timezone": "Asia/Kolkata (UTC +05:30)", "time_from": "10:00", "time_to": "16:00",
+           "start_date": "2025-09-01T00:00:00.000Z", "end_date": datetime(2025, 9, 2)}
+    schedule = compile_schedule(doc)
+    assert schedule is compile_schedule(dict(doc))
+    assert not schedule.is_open(utc(2025, 8, 25, 6, 0))
+    assert schedule.next_open_at(utc(2025, 8, 25, 6, 0)) == utc(2025, 9, 1, 4, 30)
+    assert schedule.closes_at(utc(2025, 9, 2, 6, 0)) == utc(2025, 9, 2, 10, 30)
+    assert schedule.next_open_at(utc(2025, 9, 2, 11, 0)) is None
+    assert compile_schedule({"timezone": "Not/AZone"}).next_open_at(utc(2025, 9, 1)) is None
@@ -0,0 +1,92 @@
+from datetime import datetime, timezone
+import pytest
+from bson import ObjectId
+from app.db.dao_leads import due_fields
+from app.domain import suppression
+from app.domain.suppression import SuppressionFilter, _sorted_hashes, import_suppressions
+from app.domain.worker import run_once
+
+
+def suppress(db, *emails, active=True):
+    for email in emails:
+        db.suppressions.update_one({"email": email}, {"$set": {"active": active, "updated_at": datetime.now(timezone.utc)}},
+                                   upsert=True)
+
+
+def test_sorted_hashes_merges_runs(monkeypatch):
+    monkeypatch.setattr(suppression, "SORT_RUN_SIZE", 3)
+    assert list(_sorted_hashes([9, 1, 7, 3, 8, 2, 5])) == [1, 2, 3, 5, 7, 8, 9]
+
+
+@pytest.mark.parametrize("compact_min", [4096, 1])
+def test_filter_loads_then_syncs_changes(mongo_db, monkeypatch, compact_min):
+    monkeypatch.setattr(suppression, "COMPACT_MIN_CHANGES", compact_min)
+    suppress(mongo_db, "a@x.com", "b@x.com")
+    suppress(mongo_db, "gone@x.com", active=False)
+    bloom = SuppressionFilter(sync_seconds=3600)
+    bloom.refresh()
+    assert bloom.contains(" A@X.com") and "b@x.com" in bloom
+    assert not bloom.contains("gone@x.com") and not bloom.contains("c@x.com")
+
+    suppress(mongo_db, "c@x.com")
+    suppress(mongo_db, "a@x.com", active=False)
+    bloom.refresh()
+    assert bloom.contains("a@x.com")  # not due yet
+    bloom.refresh(force=True)
+    assert [bloom.contains(email) for email in ("a@x.com", "b@x.com", "c@x.com")] == [False, True, True]
+    assert bloom.stats["loads"] == 1 and bloom.stats["syncs"] == 1
+    assert bloom.stats["compactions"] == (1 if compact_min == 1 else 0)
+
+
+def test_import_and_lift(mongo_db):
+    rows = [{"Email": "A@x.com", "reason": "bounced"}, {"email": "b@x.com"}, {"email": "b@x.com"}, {"name": "?"}, None]
+    progress = []
+    stats = import_suppressions(rows, reason="unsubscribed", source="list.csv", on_progress=progress.append)
+    assert stats == {"rows": 5, "added": 2, "updated": 0, "lifted": 0, "invalid": 2}
+    assert len(progress) == 1
+    doc = mongo_db.suppressions.find_one({"email": "a@x.com"})
+    assert (doc["active"], doc["reason"], doc["source"]) == (True, "bounced", "list.csv")
+    assert mongo_db.suppressions.find_one({"email": "b@x.com"})["reason"] == "unsubscribed"
+
+    assert import_suppressions([{"email": "a@x.com"}, {"email": "nobody@x.com"}], lift=True)["lifted"] == 1
+    assert mongo_db.suppressions.find_one({"email": "a@x.com"})["active"] is False
+
+
+def test_worker_skips_suppressed_leads_before_reserving(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    campaign_id = seed_campaign(smtp_server.port, accounts=2, leads=3)
+    suppress(mongo_db, "lead0@test.com")
+
+    run_once(campaign_id, 3)
+
+    # Both accounts are left for the two leads that can be sent to
+    sent = list(mongo_db.campaign_activities.find({"type": "sent"}))
+    assert len(sent) == smtp_server.messages == 2
+    lead = mongo_db.campaign_leads.find_one({"lead_data.email": "lead0@test.com"})
+    assert lead["progress"]["stopped"] is True and lead["progress"]["reason"] == "suppressed"
+    assert lead["state"] == "stopped"
+    assert sum(state["sent_count"] for state in mongo_db.account_runtime_state.find()) == 2
+
+
+def test_worker_moves_past_a_suppressed_recipient(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    campaign_id = seed_campaign(smtp_server.port, accounts=2, leads=0)
+    lead_id = mongo_db.campaign_leads.insert_one({
+        "campaign_id": ObjectId(campaign_id),
+        "lead_data": [{"email": "blocked@test.com", "name": "B"}, {"email": "ok@test.com", "name": "O"}],
+        "progress": {"current_step_order": 1, "stopped": False}, **due_fields(None)}).inserted_id
+    suppress(mongo_db, "blocked@test.com")
+
+    run_once(campaign_id, 5)
+    lead = mongo_db.campaign_leads.find_one({"_id": lead_id})
+    assert lead["progress"]["processed_recipients"]["step_1_recipient_0"]["suppressed"] is True
+    assert lead["lead_data"][0]["status"] == "suppressed"
+    assert smtp_server.messages == 0
+
+    run_once(campaign_id, 5)
+    lead = mongo_db.campaign_leads.find_one({"_id": lead_id})
+    assert smtp_server.messages == 1
+    assert lead["lead_data"][1]["status"] == "contacted"
+    assert lead["progress"]["stopped"] is True and lead["progress"]["reason"] == "completed"
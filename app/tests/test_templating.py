@@ -1,5 +1,5 @@
 import pytest
-from app.domain.templating import render_template
+from app.domain.templating import render_template, render_template_batch, clear_template_cache, cache_stats
 
 def test_template_strict():
     subject_tpl = "Hello {{name}}"
@@ -11,3 +11,24 @@ def test_template_strict():
     # Missing variable should raise
     with pytest.raises(Exception):
         render_template(subject_tpl, html_tpl, {})
+
+def test_compiled_template_reused():
+    clear_template_cache()
+    render_template("Hello {{name}}", "Hi {{name}}", {"name": "A"}, template_id="t1")
+    subject, html = render_template("Hello {{name}}", "Hi {{name}}", {"name": "B"}, template_id="t1")
+    assert (subject, html) == ("Hello B", "Hi B")
+    assert cache_stats == {"hits": 2, "misses": 2}
+
+def test_edited_template_recompiles():
+    clear_template_cache()
+    render_template("Hello {{name}}", "Hi", {"name": "A"}, template_id="t1")
+    subject, _ = render_template("Hey {{name}}", "Hi", {"name": "A"}, template_id="t1")
+    assert subject == "Hey A"
+    assert cache_stats["misses"] == 3
+
+def test_render_batch():
+    clear_template_cache()
+    rendered = render_template_batch("Hello {{name}}", "Hi {{company}}",
+                                     [{"name": "A"}, {"name": "B", "company": "Acme"}], template_id="t1")
+    assert rendered == [("Hello A", "Hi your company"), ("Hello B", "Hi Acme")]
+    assert cache_stats["misses"] == 2
@@ -0,0 +1,68 @@
+import smtplib
+import pytest
+from app.domain.transport import SmtpConnectionPool, SmtpSender
+
+ACCOUNT = {"email": "sender@test.com"}
+
+
+def make_sender(smtp_server, pool):
+    return SmtpSender("127.0.0.1", smtp_server.port, "user", "pass", starttls=False, pool=pool)
+
+
+def test_pool_reuses_authenticated_session(smtp_server):
+    pool = SmtpConnectionPool(max_idle_seconds=60, timeout=5)
+    for _ in range(3):
+        make_sender(smtp_server, pool).send(ACCOUNT, "lead@test.com", "Hi", "<b>Hi</b>")
+    assert smtp_server.messages == 3
+    assert smtp_server.connections == 1
+    assert smtp_server.logins == 1
+    assert pool.stats["misses"] == 1
+    assert pool.stats["hits"] == 2
+    pool.close_all()
+
+
+def test_pool_reconnects_after_421(smtp_server):
+    pool = SmtpConnectionPool(max_idle_seconds=60, timeout=5)
+    sender = make_sender(smtp_server, pool)
+    sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    # Server drops the session on the next command (the NOOP health check)
+    smtp_server.drop_next = True
+    sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    assert smtp_server.messages == 2
+    assert pool.stats["stale"] == 1
+    assert smtp_server.connections == 2
+    pool.close_all()
+
+
+def test_pool_retries_421_before_data(smtp_server):
+    pool = SmtpConnectionPool(max_idle_seconds=60, timeout=5)
+    sender = make_sender(smtp_server, pool)
+    sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    smtp_server.drop_on = "MAIL"
+    sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    assert smtp_server.messages == 2
+    assert pool.stats["reconnects"] == 1
+    pool.close_all()
+
+
+def test_pool_does_not_retry_once_data_was_sent(smtp_server):
+    pool = SmtpConnectionPool(max_idle_seconds=60, timeout=5)
+    sender = make_sender(smtp_server, pool)
+    smtp_server.hang_up_after_data = True
+    # The server may have the message: the error goes to the caller instead of a second copy
+    with pytest.raises(smtplib.SMTPServerDisconnected):
+        sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    assert smtp_server.messages == 1
+    assert pool.stats["reconnects"] == 0
+    pool.close_all()
+
+
+def test_pool_expires_idle_sessions(smtp_server):
+    pool = SmtpConnectionPool(max_idle_seconds=0, timeout=5)
+    sender = make_sender(smtp_server, pool)
+    sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    sender.send(ACCOUNT, "lead@test.com", "Hi", "Hi")
+    assert pool.stats["expired"] >= 1
+    assert smtp_server.connections == 2
+    pool.prune()
+    assert pool.idle_count() == 0
@@ -0,0 +1,90 @@
+import threading
+import pytest
+from bson import ObjectId
+from app.db.dao_leads import due_fields
+from app.domain.worker import run_once
+
+
+def test_parallel_sends_use_distinct_accounts(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    # Each message is held until all three are in flight
+    smtp_server.barrier = threading.Barrier(3, timeout=5)
+    campaign_id = seed_campaign(smtp_server.port)
+
+    run_once(campaign_id, 3, concurrency=3)
+
+    sent = list(mongo_db.campaign_activities.find({"type": "sent"}))
+    assert len(sent) == 3
+    assert len({a["email_id"] for a in sent}) == 3
+    assert smtp_server.messages == 3
+    assert smtp_server.max_in_flight == 3
+    for lead in mongo_db.campaign_leads.find():
+        assert lead["progress"]["stopped"] is True
+    for state in mongo_db.account_runtime_state.find():
+        assert state["sent_count"] == 1
+        assert state["locked_until"] is None
+
+
+def test_sequential_batch_stops_when_accounts_are_cooling_down(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    campaign_id = seed_campaign(smtp_server.port, accounts=2, leads=3)
+
+    run_once(campaign_id, 3)
+
+    assert mongo_db.campaign_activities.count_documents({"type": "sent"}) == 2
+    assert mongo_db.campaign_leads.count_documents({"progress.stopped": True}) == 2
+    # The lead left waiting for an account is released along with the sent ones
+    assert mongo_db.campaign_leads.count_documents({"claimed_by": {"$exists": True}}) == 0
+    assert mongo_db.campaign_runtime_state.find_one({"campaign_id": campaign_id})["sent_count"] == 2
+
+
+def test_multi_recipient_progress_uses_targeted_updates(mongo_db, seed_campaign, smtp_server, monkeypatch):
+    from app.config.settings import settings
+    from app.db.dao_leads import LeadUpdateBatch
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+    flushes = []
+    original_flush = LeadUpdateBatch.flush
+    monkeypatch.setattr(LeadUpdateBatch, "flush", lambda self: flushes.append(len(self)) or original_flush(self))
+    campaign_id = seed_campaign(smtp_server.port, accounts=3, leads=0)
+    mongo_db.campaign_leads.insert_many([
+        {"campaign_id": ObjectId(campaign_id),
+         "lead_data": [{"email": f"a{i}@test.com", "status": "not_contacted"},
+                       {"email": f"b{i}@test.com", "status": "not_contacted"}],
+         "progress": {"current_step_order": 1, "stopped": False, "processed_recipients": {}},
+         **due_fields(None)}
+        for i in range(2)
+    ])
+
+    run_once(campaign_id, 2, concurrency=2)
+
+    assert flushes == [2]
+    for lead in mongo_db.campaign_leads.find():
+        assert lead["lead_data"][0]["status"] == "contacted"
+        assert lead["lead_data"][0]["last_step"] == 1
+        assert lead["lead_data"][1]["status"] == "not_contacted"
+        assert list(lead["progress"]["processed_recipients"]) == ["step_1_recipient_0"]
+        assert lead["progress"]["current_step_order"] == 1
+        assert lead["progress"]["stopped"] is False
+        assert "next_due_at" in lead["progress"]
+
+
+def test_failed_progress_write_still_counts_sends_and_releases_leases(mongo_db, seed_campaign, smtp_server,
+                                                                      monkeypatch):
+    from pymongo.errors import BulkWriteError
+    from app.config.settings import settings
+    from app.db.dao_leads import LeadUpdateBatch
+    monkeypatch.setattr(settings, "SMTP_STARTTLS", False)
+
+    def fail(self):
+        raise BulkWriteError({"writeErrors": [{"index": 0, "code": 2, "errmsg": "bad op"}]})
+    monkeypatch.setattr(LeadUpdateBatch, "flush", fail)
+    campaign_id = seed_campaign(smtp_server.port, accounts=2, leads=2)
+
+    with pytest.raises(BulkWriteError):
+        run_once(campaign_id, 2, concurrency=2)
+
+    assert mongo_db.campaign_activities.count_documents({"type": "sent"}) == 2
+    assert mongo_db.campaign_runtime_state.find_one({"campaign_id": campaign_id})["sent_count"] == 2
+    assert mongo_db.campaign_leads.count_documents({"claimed_by": {"$exists": True}}) == 0
@@ -0,0 +1,179 @@
+import contextlib
+import inspect
+import socketserver
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Dict, List
+
+
+class CountingCollection:
+    """Collection proxy that counts every call made on it"""
+
+    def __init__(self, collection, counts: Counter):
+        self._collection = collection
+        self._counts = counts
+
+    def __getattr__(self, name):
+        attr = getattr(self._collection, name)
+        if not callable(attr):
+            return attr
+        key = f"{self._collection.name}.{name}"
+
+        def call(*args, **kwargs):
+            self._counts[key] += 1
+            return attr(*args, **kwargs)
+        return call
+
+
+class CountingDatabase:
+    """Database proxy handing out CountingCollections; `counts` is keyed by collection.method"""
+
+    def __init__(self, db):
+        self._db = db
+        self.counts: Counter = Counter()
+
+    def __getitem__(self, name):
+        return CountingCollection(self._db[name], self.counts)
+
+    def __getattr__(self, name):
+        return self[name]
+
+    def reset(self):
+        self.counts.clear()
+
+
+class PhaseTimer:
+    """Wraps functions in place and records the wall time of each call per phase"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+        self._patches = []
+
+    def wrap(self, owner, name: str, phase: str):
+        original = inspect.getattr_static(owner, name)
+        func = original.__func__ if isinstance(original, (classmethod, staticmethod)) else original
+        samples = self.samples[phase]
+
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                samples.append(time.perf_counter() - started)
+        if isinstance(original, classmethod):
+            timed = classmethod(timed)
+        elif isinstance(original, staticmethod):
+            timed = staticmethod(timed)
+        setattr(owner, name, timed)
+        self._patches.append((owner, name, original))
+
+    def restore(self):
+        for owner, name, original in reversed(self._patches):
+            setattr(owner, name, original)
+        self._patches.clear()
+
+    def summary(self) -> Dict[str, dict]:
+        summary = {}
+        for phase, samples in self.samples.items():
+            if not samples:
+                continue
+            ordered = sorted(samples)
+            summary[phase] = {
+                "calls": len(ordered),
+                "total_ms": round(sum(ordered) * 1000, 2),
+                "p50_ms": round(ordered[len(ordered) // 2] * 1000, 3),
+                "p95_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))] * 1000, 3),
+            }
+        return summary
+
+
+class _NullSmtpHandler(socketserver.StreamRequestHandler):
+    """Accepts any login and message without doing anything with it"""
+
+    def reply(self, line: bytes):
+        self.wfile.write(line + b"\r\n")
+
+    def handle(self):
+        self.reply(b"220 null ESMTP")
+        while True:
+            raw = self.rfile.readline()
+            if not raw:
+                return
+            command = raw[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250-null\r\n250 AUTH PLAIN\r\n")
+            elif command == b"AUTH":
+                self.reply(b"235 ok")
+            elif command == b"DATA":
+                self.reply(b"354 go ahead")
+                while self.rfile.readline().rstrip(b"\r\n") != b".":
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply(b"250 queued")
+            elif command == b"QUIT":
+                self.reply(b"221 bye")
+                return
+            else:
+                self.reply(b"250 ok")
+
+
+class NullSmtpServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _NullSmtpHandler)
+        self.lock = threading.Lock()
+        self.messages = 0
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+@contextlib.contextmanager
+def use_database(db):
+    """Point every DAO module (and the worker) at `db` and reset process-local state"""
+    from app.db import (dao_accounts, dao_activities, dao_campaigns, dao_leads, dao_rate_limits, dao_runtime,
+                        dao_sequences, dao_suppressions, dao_templates)
+    from app.db.cache import dao_cache
+    from app.domain import dispatcher, worker
+    from app.domain.availability import availability_index
+    from app.domain.rate_limit import rate_limiter
+    from app.domain.suppression import suppression_filter
+    modules = (dao_accounts, dao_activities, dao_campaigns, dao_leads, dao_rate_limits, dao_runtime,
+               dao_sequences, dao_suppressions, dao_templates, worker)
+    originals = [(module, module.db) for module in modules]
+    for module in modules:
+        module.db = db
+    for state in (dao_cache, availability_index, rate_limiter, suppression_filter, worker._account_rr_cache,
+                  dispatcher._window_opens):
+        state.clear()
+    try:
+        yield db
+    finally:
+        for module, original in originals:
+            module.db = original
+
+
+@contextlib.contextmanager
+def override_settings(**values):
+    from app.config.settings import settings
+    originals = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield settings
+    finally:
+        for name, value in originals.items():
+            setattr(settings, name, value)
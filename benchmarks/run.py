@@ -0,0 +1,102 @@
+import os
+# Benchmarks run against mongomock; settings still insist on a URI
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+import inspect
+import json
+import logging
+from pathlib import Path
+from typing import List, Optional
+import structlog
+import typer
+from benchmarks.scenarios import SCENARIOS
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+
+app = typer.Typer()
+
+
+def _baseline_path(name: str) -> Path:
+    return BASELINE_DIR / f"{name}.json"
+
+
+def compare(result: dict, baseline: dict, tolerance: float) -> List[str]:
+    """Regressions of result against baseline; empty when within tolerance
+
+    Throughput is noisy across machines, so it gets the tolerance; Mongo
+    operation counts are deterministic for the same parameters and are
+    compared per email.
+    """
+    problems = []
+    if result["params"] != baseline["params"]:
+        return [f"parameters differ from baseline ({baseline['params']}); re-save it"]
+    if result["emails_per_second"] < baseline["emails_per_second"] * (1 - tolerance):
+        problems.append(f"throughput {result['emails_per_second']}/s vs baseline {baseline['emails_per_second']}/s")
+    if result["sent"] != baseline["sent"]:
+        problems.append(f"sent {result['sent']} emails vs baseline {baseline['sent']}")
+    ops, base_ops = result["mongo_ops_per_email"], baseline["mongo_ops_per_email"]
+    if ops is not None and base_ops is not None and ops > base_ops * (1 + tolerance):
+        problems.append(f"{ops} Mongo ops per email vs baseline {base_ops}")
+    return problems
+
+
+def _print(name: str, result: dict):
+    typer.echo(f"\n== {name} {result['params']}")
+    typer.echo(f"sent {result['sent']} in {result['seconds']}s: {result['emails_per_second']} emails/s, "
+               f"{result['mongo_ops']} Mongo ops ({result['mongo_ops_per_email']} per email)")
+    typer.echo(f"{'phase':<14}{'calls':>8}{'total ms':>12}{'p50 ms':>10}{'p95 ms':>10}")
+    for phase, stats in sorted(result["phases"].items(), key=lambda item: -item[1]["total_ms"]):
+        typer.echo(f"{phase:<14}{stats['calls']:>8}{stats['total_ms']:>12}{stats['p50_ms']:>10}{stats['p95_ms']:>10}")
+    typer.echo("top Mongo calls: " + ", ".join(f"{call}={n}" for call, n in list(result["mongo_ops_by_call"].items())[:8]))
+
+
+@app.command()
+def main(
+    scenario: Optional[List[str]] = typer.Option(None, help="Scenario(s) to run (default: all)"),
+    leads: Optional[int] = typer.Option(None, help="Leads per campaign"),
+    accounts: Optional[int] = typer.Option(None, help="Sending accounts per campaign"),
+    campaigns: Optional[int] = typer.Option(None, help="Campaigns in the queue (dispatcher_tick)"),
+    recipients: int = typer.Option(1, help="Recipients per lead (lead_data array when > 1)"),
+    concurrency: int = typer.Option(1, help="Worker/dispatcher concurrency"),
+    save_baseline: bool = typer.Option(False, help="Write results to benchmarks/baselines/"),
+    check: bool = typer.Option(False, help="Compare against saved baselines; exit 1 on regression"),
+    tolerance: float = typer.Option(0.2, help="Allowed relative regression for --check"),
+    output: Optional[Path] = typer.Option(None, help="Also write all results to this JSON file"),
+):
+    """Measure worker/dispatcher throughput against mongomock and a null SMTP sink."""
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    names = scenario or list(SCENARIOS)
+    results, failed = {}, False
+    for name in names:
+        params = {"recipients": recipients, "concurrency": concurrency}
+        for key, value in (("leads", leads), ("accounts", accounts), ("campaigns", campaigns)):
+            if value is not None and (key != "campaigns" or name == "dispatcher_tick"):
+                params[key] = value
+        bound = inspect.signature(SCENARIOS[name]).bind(**params)
+        bound.apply_defaults()
+        result = {"params": dict(bound.arguments), **SCENARIOS[name](**params)}
+        results[name] = result
+        _print(name, result)
+
+        path = _baseline_path(name)
+        if check:
+            if not path.exists():
+                typer.echo(f"no baseline at {path}")
+            else:
+                problems = compare(result, json.loads(path.read_text()), tolerance)
+                for problem in problems:
+                    typer.echo(f"REGRESSION {name}: {problem}")
+                failed = failed or bool(problems)
+        if save_baseline:
+            BASELINE_DIR.mkdir(exist_ok=True)
+            path.write_text(json.dumps(result, indent=2, sort_keys=True) + "\n")
+            typer.echo(f"baseline saved to {path}")
+    if output:
+        output.write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+    if failed:
+        raise typer.Exit(1)
+
+
+if __name__ == "__main__":
+    app()
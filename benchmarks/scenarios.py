@@ -0,0 +1,90 @@
+import time
+from typing import Dict, List
+from mongomock import MongoClient
+from app.db.dao_leads import LeadUpdateBatch
+from app.tests.conftest import make_campaign
+from benchmarks.harness import CountingDatabase, NullSmtpServer, PhaseTimer, override_settings, use_database
+
+
+def seed_campaign(db, smtp_port: int, leads: int, accounts: int, recipients: int = 1,
+                  queue: bool = False) -> str:
+    """The tests' campaign, with limits sized to the run and no cooldown so accounts are reused within a batch"""
+    return make_campaign(db, smtp_port, accounts=accounts, leads=leads, recipients=recipients,
+                         daily_limit=leads * recipients, min_wait_time=0, queue=queue)
+
+
+def _instrument(timer: PhaseTimer):
+    from app.domain import dispatcher, worker
+    from app.domain.arbiter import AccountArbiter
+    from app.domain.campaign_context import CampaignContext
+    from app.domain.transport import SmtpSender
+    timer.wrap(dispatcher, "_plan_campaign", "plan")
+    timer.wrap(worker, "claim_due_leads", "claim_leads")
+    timer.wrap(worker, "get_due_leads", "claim_leads")
+    timer.wrap(CampaignContext, "load", "load_context")
+    timer.wrap(worker, "_prepare_job", "prepare")
+    timer.wrap(worker, "_reserve_accounts", "reserve")
+    timer.wrap(worker, "_render_job", "render")
+    timer.wrap(SmtpSender, "send", "smtp")
+    timer.wrap(AccountArbiter, "commit", "commit")
+    timer.wrap(worker, "insert_activity", "record")
+    timer.wrap(LeadUpdateBatch, "flush", "flush")
+    timer.wrap(worker, "flush_activities", "flush")
+    timer.wrap(worker, "release_lead_claims", "flush")
+
+
+def _measure(db: CountingDatabase, smtp: NullSmtpServer, run) -> Dict:
+    timer = PhaseTimer()
+    _instrument(timer)
+    db.reset()
+    try:
+        started = time.perf_counter()
+        run()
+        seconds = time.perf_counter() - started
+    finally:
+        timer.restore()
+    sent = db._db.campaign_activities.count_documents({"type": "sent"})
+    ops = sum(db.counts.values())
+    return {
+        "sent": sent,
+        "smtp_messages": smtp.messages,
+        "seconds": round(seconds, 3),
+        "emails_per_second": round(sent / seconds, 1) if seconds else 0.0,
+        "phases": timer.summary(),
+        "mongo_ops": ops,
+        "mongo_ops_per_email": round(ops / sent, 2) if sent else None,
+        "mongo_ops_by_call": dict(db.counts.most_common()),
+    }
+
+
+def worker_batch(leads: int = 2000, accounts: int = 50, recipients: int = 1, batch_size: int = None,
+                 concurrency: int = 1) -> Dict:
+    """One worker.run_once over a single campaign's whole due queue"""
+    from app.domain.worker import run_once
+    db = CountingDatabase(MongoClient()["bench"])
+    with NullSmtpServer() as smtp, use_database(db), override_settings(SMTP_STARTTLS=False):
+        campaign_id = seed_campaign(db._db, smtp.port, leads, accounts, recipients)
+        result = _measure(db, smtp, lambda: run_once(campaign_id, batch_size or leads, concurrency=concurrency))
+    return result
+
+
+def dispatcher_tick(campaigns: int = 20, leads: int = 200, accounts: int = 5, recipients: int = 1,
+                    batch_size: int = None, concurrency: int = 1) -> Dict:
+    """One dispatcher.run_once over a queue of independent campaigns"""
+    from app.domain.dispatcher import run_once
+    db = CountingDatabase(MongoClient()["bench"])
+    with NullSmtpServer() as smtp, use_database(db), override_settings(SMTP_STARTTLS=False):
+        for _ in range(campaigns):
+            seed_campaign(db._db, smtp.port, leads, accounts, recipients, queue=True)
+        result = _measure(db, smtp, lambda: run_once(batch_size or leads * recipients, concurrency=concurrency))
+    return result
+
+
+SCENARIOS = {
+    "worker_batch": worker_batch,
+    "dispatcher_tick": dispatcher_tick,
+}
+
+
+def scenario_names() -> List[str]:
+    return list(SCENARIOS)
@@ -0,0 +1,86 @@
+import os
+# Benchmarks run against mongomock; settings still insist on a URI
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+os.environ.setdefault("DB_NAME", "bench")
+
+import json
+import logging
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Dict
+import structlog
+import typer
+from mongomock import MongoClient
+from benchmarks.harness import CountingDatabase, use_database
+
+app = typer.Typer()
+
+
+def _ns_per_call(func, emails) -> float:
+    started = time.perf_counter()
+    for email in emails:
+        func(email)
+    return round((time.perf_counter() - started) / len(emails) * 1e9, 1)
+
+
+def suppression_lookup(entries: int = 1_000_000, lookups: int = 200_000, changes: int = 1000) -> Dict:
+    """Build the suppression filter over `entries` addresses, then time lookups and an incremental sync
+
+    The full load is timed from an in-memory list: a mongomock scan of that many
+    documents would measure mongomock. The sync reads `changes` documents back
+    through the DAO like a worker does.
+    """
+    from app.domain.suppression import SuppressionFilter, normalize_email
+    suppressed = [f"blocked{i}@bench.test" for i in range(entries)]
+    bloom = SuppressionFilter(sync_seconds=0)
+    started = time.perf_counter()
+    bloom.load(suppressed)
+    build_seconds = time.perf_counter() - started
+
+    step = max(1, entries // lookups)
+    hits = suppressed[::step][:lookups]
+    misses = [f"Lead{i}@Bench.test" for i in range(len(hits))]
+    assert all(bloom.contains(email) for email in hits[:100]) and not any(bloom.contains(e) for e in misses[:100])
+    # The plain alternative: every address held as a Python str in a set
+    plain = set(suppressed)
+    result = {
+        "entries": entries,
+        "build_seconds": round(build_seconds, 3),
+        "filter_bytes": bloom.nbytes,
+        "set_of_str_bytes": sys.getsizeof(plain) + sum(sys.getsizeof(email) for email in suppressed),
+        "hit_ns": _ns_per_call(bloom.contains, hits),
+        "miss_ns": _ns_per_call(bloom.contains, misses),
+        "set_of_str_ns": _ns_per_call(lambda email: normalize_email(email) in plain, misses),
+    }
+    del plain
+
+    db = CountingDatabase(MongoClient()["bench"])
+    with use_database(db):
+        db._db.suppressions.insert_many([{"email": f"new{i}@bench.test", "active": True,
+                                          "updated_at": datetime.now(timezone.utc)} for i in range(changes)])
+        db.reset()
+        started = time.perf_counter()
+        bloom.refresh()
+        result.update({
+            "sync_changes": changes,
+            "sync_seconds": round(time.perf_counter() - started, 4),
+            "sync_mongo_ops": sum(db.counts.values()),
+            "synced_lookup_ok": bloom.contains(f"new{changes - 1}@bench.test"),
+        })
+    return result
+
+
+@app.command()
+def main(
+    entries: int = typer.Option(1_000_000, help="Suppressed addresses to load"),
+    lookups: int = typer.Option(200_000, help="Hit and miss lookups to time"),
+    changes: int = typer.Option(1000, help="Suppressions added before timing an incremental sync"),
+):
+    """Measure suppression filter load time, memory, lookup latency and incremental sync cost."""
+    structlog.configure(wrapper_class=structlog.make_filtering_bound_logger(logging.WARNING))
+    typer.echo(json.dumps(suppression_lookup(entries, lookups, changes), indent=2))
+
+
+if __name__ == "__main__":
+    app()